@@ -0,0 +1,129 @@
+"""
+Benchmark of the position QP assembly of the ClassicGenerator against the
+former numpy.matrix based implementation on the reference scenario of
+tests/data, i.e. the initial state and reference velocity of the dumped
+walkGenJrl QP matrices Q.dat and P.dat.
+"""
+import os, sys
+import timeit
+import numpy
+from numpy.testing import assert_allclose
+from walking_generator.classic import ClassicGenerator
+from walking_generator import utility
+
+BASEDIR = os.path.dirname(os.path.abspath(__file__))
+
+def legacy_update_pos_Q(gen):
+    """ former implementation of ClassicGenerator._update_pos_Q """
+    N  = gen.N
+    nf = gen.nf
+
+    alpha = gen.a
+    gamma = gen.c
+    delta = gen.d
+
+    Pvu   = numpy.asmatrix(gen.Pvu)
+    Pzu   = numpy.asmatrix(gen.Pzu)
+    V_kp1 = numpy.asmatrix(gen.V_kp1)
+
+    Q = numpy.zeros((N+nf, N+nf))
+    Q[:N,:N] = alpha * Pvu.transpose() * Pvu \
+             + gamma * Pzu.transpose() * Pzu \
+             + delta * numpy.eye(N)
+    Q[:N,N:] = -gamma * Pzu.transpose() * V_kp1
+    Q[N:,:N] = Q[:N,N:].transpose()
+    Q[N:,N:] = gamma * V_kp1.transpose() * V_kp1
+    return Q
+
+def legacy_update_pos_p(gen, case):
+    """ former implementation of ClassicGenerator._update_pos_p """
+    N  = gen.N
+    nf = gen.nf
+
+    if case == 'x':
+        f_k = gen.f_k_x
+        c_k        = utility.cast_array_as_matrix(gen.c_k_x)
+        dC_kp1_ref = utility.cast_array_as_matrix(gen.dC_kp1_x_ref)
+    else:
+        f_k = gen.f_k_y
+        c_k        = utility.cast_array_as_matrix(gen.c_k_y)
+        dC_kp1_ref = utility.cast_array_as_matrix(gen.dC_kp1_y_ref)
+
+    alpha = gen.a
+    gamma = gen.c
+
+    v_kp1 = utility.cast_array_as_matrix(gen.v_kp1)
+    Pvs   = numpy.asmatrix(gen.Pvs)
+    Pvu   = numpy.asmatrix(gen.Pvu)
+    Pzs   = numpy.asmatrix(gen.Pzs)
+    Pzu   = numpy.asmatrix(gen.Pzu)
+    V_kp1 = numpy.asmatrix(gen.V_kp1)
+
+    p = numpy.zeros((N+nf,))
+    p[:N] = (
+          alpha * Pvu.transpose() *(Pvs*c_k - dC_kp1_ref)
+        + gamma * Pzu.transpose() *(Pzs*c_k - v_kp1*f_k)
+    ).ravel()
+    p[N:] = (
+        -gamma * V_kp1.transpose() * (Pzs*c_k - v_kp1*f_k)
+    ).ravel()
+    return p
+
+def bench(stmt, number):
+    """ best time of three repetitions per call in micro seconds """
+    return min(timeit.repeat(stmt, number=number, repeat=3)) / number * 1e6
+
+if __name__ == '__main__':
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    # reference scenario, cf. tests/test_classic.py
+    gen = ClassicGenerator(fsm_state='L/R')
+    secmargin = 0.04
+    gen.set_security_margin(secmargin, secmargin)
+
+    comx = [0.06591456,0.07638739,-0.1467377]
+    comy = [2.49008564e-02,6.61665254e-02,6.72712187e-01]
+    comz = 0.814
+    footx = 0.00949035
+    footy = 0.095
+    footq = 0.0
+    gen.set_initial_values(comx, comy, comz, footx, footy, footq)
+
+    gen.dC_kp1_x_ref[...] = 0.2
+    gen.dC_kp1_y_ref[...] = 0.0
+
+    # check consistency of both implementations
+    gen._update_pos_Q()
+    assert_allclose(gen._pos_Q, legacy_update_pos_Q(gen), rtol=1e-12, atol=1e-14)
+    for case in ('x', 'y'):
+        gen._update_pos_p(case)
+        assert_allclose(
+            gen._pos_p, legacy_update_pos_p(gen, case), rtol=1e-12, atol=1e-14
+        )
+
+    # check against dumped walkGenJrl gradient, which follows convention
+    # U_k = (dddC_x, dddC_y, F_x, F_y)
+    pos_g = numpy.loadtxt(os.path.join(BASEDIR, 'tests', 'data', 'P.dat'), skiprows=1)
+    gen._update_pos_p('x')
+    assert_allclose(gen._pos_p[:gen.N], pos_g[:gen.N], rtol=1e-07, atol=1e-07)
+
+    results = [
+        ('_update_pos_Q',
+            bench(lambda: legacy_update_pos_Q(gen), number),
+            bench(gen._update_pos_Q, number)),
+        ('_update_pos_p',
+            bench(lambda: legacy_update_pos_p(gen, 'x'), number),
+            bench(lambda: gen._update_pos_p('x'), number)),
+    ]
+
+    print 'N = {}, nf = {}, {} calls'.format(gen.N, gen.nf, number)
+    print '{:<22} {:>12} {:>12} {:>8}'.format('', 'legacy [us]', 'new [us]', 'speedup')
+    for name, t_old, t_new in results:
+        print '{:<22} {:>12.2f} {:>12.2f} {:>8.2f}'.format(
+            name, t_old, t_new, t_old / t_new
+        )
+
+    # per tick budget of the whole QP assembly
+    gen.buildConstraints()
+    t_tick = bench(gen._preprocess_solution, number)
+    print '{:<22} {:>12} {:>12.2f}'.format('_preprocess_solution', '', t_tick)
@@ -86,8 +86,8 @@ for i in range(220):
     if show_canvas or save_to_file:
         classic_p.update()
 
-nmpc.   data.save_to_file('./nmpc.json')
-classic.data.save_to_file('./classic.json')
+nmpc.   data.save_to_file('./nmpc.npz')
+classic.data.save_to_file('./classic.npz')
 
 show_canvas  = False
 save_to_file = True
@@ -101,8 +101,8 @@ classic_p = Plotter(
     filename='./classic', fmt='pdf'
 )
 
-nmpc_p   .load_from_file('./nmpc.json')
-classic_p.load_from_file('./classic.json')
+nmpc_p   .load_from_file('./nmpc.npz')
+classic_p.load_from_file('./classic.npz')
 
 nmpc_p   .update()
 classic_p.update()
@@ -182,11 +182,8 @@ if __name__ == '__main__':
     leftFootTraj = inter.leftFootTraj
     rightFootTraj = inter.rightFootTraj
 
-    LeftFootTrajX = numpy.zeros( leftFootTraj.shape , dtype=float)
-    RightFootTrajX = numpy.zeros( rightFootTraj.shape , dtype=float)
-    for j in range(leftFootTraj.shape[0]):
-        LeftFootTrajX[j] = leftFootTraj[j].x
-        RightFootTrajX[j] = rightFootTraj[j].x
+    LeftFootTrajX = leftFootTraj['x']
+    RightFootTrajX = rightFootTraj['x']
 
     LeftFootTrajX.tofile("LeftFootBuffer",sep="\n")
     RightFootTrajX.tofile("RightFootBuffer",sep="\n")
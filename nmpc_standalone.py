@@ -61,7 +61,7 @@ for i in range(220):
     if show_canvas:
         nmpc_p.update()
 
-nmpc.   data.save_to_file('./nmpc_alone.json')
+nmpc.   data.save_to_file('./nmpc_alone.npz')
 
 show_canvas  = False
 save_to_file = True
@@ -71,7 +71,7 @@ nmpc_p    = Plotter(
     filename='./nmpc_alone',    fmt='pdf'
 )
 
-nmpc_p   .load_from_file('./nmpc_alone.json')
+nmpc_p   .load_from_file('./nmpc_alone.npz')
 nmpc_p   .update()
 nmpc_p   .create_data_plot()
 
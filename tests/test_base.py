@@ -4,6 +4,7 @@ numpy.set_printoptions(threshold=numpy.nan, linewidth =numpy.nan)
 from numpy.testing import *
 import numpy.testing.decorators as decorators
 
+from walking_generator import workspace
 from walking_generator.base import BaseGenerator as Generator
 from walking_generator.base import BaseTypeFoot, BaseTypeSupportFoot
 
@@ -423,6 +424,266 @@ class TestBaseGenerator(TestCase):
         #print "A-B:\n",data_DY - gen.D_kp1y
         assert_allclose(data_Pzu,gen.Pzu)
 
+    def test_vectorized_cop_constraint_transformation(self):
+        def reference(gen):
+            # former sample by sample assembly of D_kp1 and b_kp1
+            D_kp1 = numpy.zeros(gen.D_kp1.shape)
+            b_kp1 = numpy.zeros(gen.b_kp1.shape)
+            theta_vec = [gen.f_k_q, gen.F_k_q[0], gen.F_k_q[1]]
+            for i in range(gen.N):
+                theta = theta_vec[gen.supportDeque[i].stepNumber]
+                rotMat = numpy.array([
+                    [ numpy.cos(theta), numpy.sin(theta)],
+                    [-numpy.sin(theta), numpy.cos(theta)]
+                ])
+                if gen.supportDeque[i].foot == "left" :
+                    A0 = gen.A0lf.dot(rotMat); B0 = gen.ubB0lf
+                    D0 = gen.A0dlf.dot(rotMat); d0 = gen.ubB0dlf
+                else :
+                    A0 = gen.A0rf.dot(rotMat); B0 = gen.ubB0rf
+                    D0 = gen.A0drf.dot(rotMat); d0 = gen.ubB0drf
+                for j in range(gen.nf):
+                    if gen.V_kp1[i,j] == 1 and gen.fsm_states[j] == 'D':
+                        A0 = D0; B0 = d0
+                for k in range(gen.nFootEdge):
+                    D_kp1[i*gen.nFootEdge+k, i]       = A0[k][0]
+                    D_kp1[i*gen.nFootEdge+k, gen.N+i] = A0[k][1]
+                    b_kp1[i*gen.nFootEdge+k]          = B0[k]
+            return D_kp1, b_kp1
+
+        for fsm_state, foot in (('D', 'left'), ('L/R', 'left'), ('R/L', 'right')):
+            gen = Generator(fsm_state=fsm_state)
+            gen.set_security_margin(0.04, 0.04)
+
+            comx = [0.06591456,0.07638739,-0.1467377]
+            comy = [2.49008564e-02,6.61665254e-02,6.72712187e-01]
+            gen.set_initial_values(comx, comy, 0.814, 0.00949035, 0.095, 0.1, foot)
+
+            for i in range(20):
+                gen.F_k_q[...] = (0.3 + 0.01*i, -0.2)
+                gen._update_selection_matrices()
+                gen._calculate_support_order()
+                gen.buildCoPconstraint()
+
+                D_kp1, b_kp1 = reference(gen)
+                assert_array_equal(gen.D_kp1, D_kp1)
+                assert_array_equal(gen.b_kp1, b_kp1)
+
+    def test_block_structured_cop_constraint(self):
+        gen = Generator(fsm_state='L/R')
+        gen.set_security_margin(0.04, 0.04)
+
+        comx = [0.06591456,0.07638739,-0.1467377]
+        comy = [2.49008564e-02,6.61665254e-02,6.72712187e-01]
+        gen.set_initial_values(comx, comy, 0.814, 0.00949035, 0.095, 0.1)
+
+        N  = gen.N
+        nf = gen.nf
+        for i in range(10):
+            gen.F_k_q[...] = (0.3, -0.2)
+            gen._update_selection_matrices()
+            gen.buildCoPconstraint()
+
+            # dense reference Acop = D_kp1 * PzuV
+            PzuV = numpy.zeros((2*N, 2*(N+nf)))
+            PzuV[:N,    :N     ] =  gen.Pzu
+            PzuV[:N,   N:N+nf  ] = -gen.V_kp1
+            PzuV[N:,N+nf:2*N+nf] =  gen.Pzu
+            PzuV[N:,    -nf:   ] = -gen.V_kp1
+            PzsC    = numpy.hstack((gen.Pzs.dot(gen.c_k_x), gen.Pzs.dot(gen.c_k_y)))
+            v_kp1fc = numpy.hstack((gen.v_kp1*gen.f_k_x, gen.v_kp1*gen.f_k_y))
+
+            Acop   = gen.D_kp1.dot(PzuV)
+            ubBcop = gen.b_kp1 - gen.D_kp1.dot(PzsC) + gen.D_kp1.dot(v_kp1fc)
+
+            assert_allclose(gen.Acop, Acop, atol=1e-14)
+            assert_allclose(gen.ubBcop, ubBcop, atol=1e-14)
+
+            # materialize into rows of bigger matrix
+            A = numpy.zeros((gen.nc_cop + 3, 2*(N+nf)))
+            gen.cop_constraint.dense(out=A[:gen.nc_cop])
+            assert_allclose(A[:gen.nc_cop], Acop, atol=1e-14)
+            assert_allclose(A[gen.nc_cop:], 0.0)
+
+            # matrix free evaluation of constraint function
+            U_k = numpy.linspace(-1.0, 1.0, 2*(N+nf))
+            assert_allclose(gen.cop_constraint.dot(U_k), Acop.dot(U_k), atol=1e-14)
+
+    def test_cached_preview_matrices(self):
+        gen = Generator()
+        T = gen.T
+        N = gen.N
+        g = gen.g
+
+        # former element by element assembly
+        Pps = numpy.zeros((N,3)); Ppu = numpy.zeros((N,N))
+        Pvs = numpy.zeros((N,3)); Pvu = numpy.zeros((N,N))
+        Pas = numpy.zeros((N,3)); Pau = numpy.zeros((N,N))
+        for i in range(N):
+            j = i+1
+            Pps[i, :] = (1.,   j*T,           (j**2*T**2)/2.)
+            Pvs[i, :] = (0.,    1.,                      j*T)
+            Pas[i, :] = (0.,    0.,                       1.)
+            for j in range(N):
+                if j <= i:
+                    Ppu[i, j] = (3.*(i-j)**2 + 3.*(i-j) + 1.)*T**3/6.
+                    Pvu[i, j] = (2.*(i-j) + 1.)*T**2/2.
+                    Pau[i, j] = T
+
+        assert_array_equal(gen.Pps, Pps)
+        assert_array_equal(gen.Ppu, Ppu)
+        assert_array_equal(gen.Pvs, Pvs)
+        assert_array_equal(gen.Pvu, Pvu)
+        assert_array_equal(gen.Pas, Pas)
+        assert_array_equal(gen.Pau, Pau)
+
+        # matrices are shared between generators and read-only
+        other = Generator()
+        assert_(other.Ppu is gen.Ppu)
+        assert_(other.Pzu is gen.Pzu)
+        assert_raises(ValueError, gen.Pzu.__setitem__, (0, 0), 1.0)
+
+        # change of CoM height only replaces the CoP matrices
+        comx = [0.06591456,0.07638739,-0.1467377]
+        comy = [2.49008564e-02,6.61665254e-02,6.72712187e-01]
+        other.set_initial_values(comx, comy, 0.75, 0.00949035, 0.095, 0.0)
+        assert_(other.Ppu is gen.Ppu)
+        assert_(other.Pzu is not gen.Pzu)
+        assert_allclose(other.Pzu, Ppu - 0.75/g * Pau)
+        assert_allclose(other.Pzs, Pps - 0.75/g * Pas)
+
+    def test_masked_gram_of_foot_selection(self):
+        gen = Generator(fsm_state='L/R')
+        gen.set_security_margin(0.04, 0.04)
+
+        comx = [0.06591456,0.07638739,-0.1467377]
+        comy = [2.49008564e-02,6.61665254e-02,6.72712187e-01]
+        gen.set_initial_values(comx, comy, 0.814, 0.00949035, 0.095, 0.0)
+
+        Pvu = gen.Pvu
+        for i in range(2*gen.N):
+            gen._update_selection_matrices()
+            gen.buildConstraints()
+
+            assert_array_equal(numpy.diag(gen.E_FR_mask), gen.E_FR)
+            assert_array_equal(numpy.diag(gen.E_FL_mask), gen.E_FL)
+
+            E_FR = gen.E_FR; E_FL = gen.E_FL
+            assert_allclose(gen.Pvu_gram(gen.E_FR_mask),
+                Pvu.T.dot(E_FR.T).dot(E_FR).dot(Pvu), rtol=1e-12, atol=1e-15)
+            assert_allclose(gen.Pvu_gram(gen.E_FL_mask),
+                Pvu.T.dot(E_FL.T).dot(E_FL).dot(Pvu), rtol=1e-12, atol=1e-15)
+
+        # support patterns repeat, i.e. most lookups are hits
+        cache = gen.Pvu_gram.cache
+        assert_(cache.misses <= len(cache))
+        assert_(cache.hits > cache.misses)
+
+    def test_gait_phase_cache(self):
+        gen = Generator(fsm_state='L/R')
+        gen.set_security_margin(0.04, 0.04)
+
+        comx = [0.06591456,0.07638739,-0.1467377]
+        comy = [2.49008564e-02,6.61665254e-02,6.72712187e-01]
+        gen.set_initial_values(comx, comy, 0.814, 0.00949035, 0.095, 0.0)
+
+        N = gen.N
+        nstep = int(gen.T_step/gen.T)
+        for i in range(6*nstep):
+            gen._update_selection_matrices()
+            gen.buildConstraints()
+
+            # compare against assembly from scratch
+            A_fvel_eq = numpy.hstack((
+                gen.E_FR_bar.dot(gen.Pvu), gen.E_FL_bar.dot(gen.Pvu)
+            ))
+            I = numpy.hstack((numpy.eye(N), -numpy.eye(N)))
+            assert_array_equal(gen.A_fvel_eq, A_fvel_eq)
+            assert_array_equal(gen.A_fpos_ineq, gen.Ppu.dot(I))
+            assert_array_equal(gen.A_fvel_ineq, gen.Pvu.dot(I))
+
+        # support pattern repeats after two steps, i.e. later phases are hits
+        cache = gen.gait_phase_cache
+        assert_(cache.misses <= 2*nstep + 1)
+        assert_(cache.hits >= 2*(6*nstep - cache.misses))
+
+        # cached matrices must not be modified
+        phase = gen._gait_phase_matrices()
+        assert_raises(ValueError, phase['A_fvel_eq'].__setitem__, (0, 0), 1.0)
+
+    def test_workspace_buffers(self):
+        gen = Generator()
+        gen.set_velocity_reference([0.2, 0.0, 0.1])
+
+        ws = gen.workspace
+        assert_(ws.nbytes > 0)
+        assert_raises(AssertionError, ws.allocate, 'cop_A0', (1,))
+
+        # hull systems are written into the same buffers in every iteration
+        for i in range(2*gen.N):
+            gen.simulate()
+            gen.update()
+            gen.buildConstraints()
+
+            A0, B0 = gen._calculate_cop_hull_systems()
+            assert_(A0 is ws.cop_A0)
+            assert_(B0 is ws.cop_B0)
+
+            A0x, A0y, B0 = gen._calculate_foot_hull_systems()
+            assert_(A0x is ws.foot_A0x)
+
+            # compare foot constraints against explicit formula
+            q1 = gen.f_k_q
+            q2 = gen.F_k_q[0]
+            R1 = numpy.array([[ numpy.cos(q1), numpy.sin(q1)],
+                              [-numpy.sin(q1), numpy.cos(q1)]])
+            R2 = numpy.array([[ numpy.cos(q2), numpy.sin(q2)],
+                              [-numpy.sin(q2), numpy.cos(q2)]])
+            if gen.currentSupport.foot == 'left':
+                A1 = gen.A0r.dot(R1); A2 = gen.A0l.dot(R2); B1 = gen.ubB0r
+            else:
+                A1 = gen.A0l.dot(R1); A2 = gen.A0r.dot(R2); B1 = gen.ubB0l
+
+            nE = gen.nFootPosHullEdges
+            assert_allclose(A0x[:nE,0],  A1[:,0])
+            assert_allclose(A0x[nE:,0], -A2[:,0])
+            assert_allclose(A0y[nE:,1],  A2[:,1])
+            assert_allclose(
+                gen.ubBfoot[:nE], B1 + A1[:,0]*gen.f_k_x + A1[:,1]*gen.f_k_y
+            )
+
+        # debug mode needs tracemalloc
+        if workspace.tracemalloc is None:
+            assert_raises(ImportError, workspace.Workspace, debug=True)
+            assert_raises(ImportError, setattr, ws, 'debug', True)
+
+    @decorators.skipif(workspace.tracemalloc is None, 'debug mode needs tracemalloc')
+    def test_workspace_allocation_check(self):
+        ws = workspace.Workspace(debug=True)
+        buf = ws.allocate('buf', (4096,))
+
+        # in-place operations pass
+        with ws.check_allocations('in-place'):
+            numpy.multiply(buf, 2.0, out=buf)
+        assert_equal(ws.checks, 1)
+
+        # temporaries are detected although freed inside the block
+        def temporary():
+            with ws.check_allocations('temporary'):
+                tmp = buf * 2.0
+                buf[...] = tmp
+                del tmp
+        assert_raises(AssertionError, temporary)
+
+        # cache misses skip the check
+        class Cache(object):
+            misses = 0
+        cache = Cache()
+        with ws.check_allocations('miss', (cache,)):
+            tmp = buf * 2.0
+            cache.misses += 1
+        assert_equal(ws.skipped_checks, 1)
+
     def test_all_zero_when_idle(self):
         gen = Generator()
         # NOTE usage: assert_allclose(actual, desired, rtol, atol, err_msg, verbose)
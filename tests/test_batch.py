@@ -0,0 +1,103 @@
+import os
+import numpy
+numpy.set_printoptions(threshold=numpy.nan, linewidth =numpy.nan)
+from numpy.testing import *
+
+from walking_generator.combinedqp import NMPCGenerator
+from walking_generator.batch import BatchNMPCGenerator
+
+#define global tolerance for unittests
+ATOL = 1e-06
+RTOL = 1e-06
+
+class TestBatchNMPCGenerator(TestCase):
+    """
+    Test batched generator against independent NMPC generators
+    """
+
+    def test_against_single_generators(self):
+        # define initial values
+        comx = [0.00949035, 0.0, 0.0]
+        comy = [0.095,      0.0, 0.0]
+        comz = 0.814
+        footx = 0.00949035
+        footy = 0.095
+        footq = 0.0
+        state = (comx, comy, comz, footx, footy, footq, 'left')
+
+        # scenarios with different references and security margins
+        refs = numpy.array([[0.2, 0.0, 0.2], [0.1, 0.1, -0.2], [0.0, 0.2, 0.0]])
+        margins = numpy.array([0.09, 0.07, 0.05])
+        K = refs.shape[0]
+
+        batch = BatchNMPCGenerator(K, fsm_state='L/R', threads=2)
+        batch.set_security_margin(margins, 0.05)
+        batch.set_initial_values([state]*K)
+
+        gens = [NMPCGenerator(fsm_state='L/R') for k in range(K)]
+        for gen, margin in zip(gens, margins):
+            gen.set_security_margin(margin, 0.05)
+            gen.set_initial_values(*state)
+
+        # generators work on views of stacked arrays
+        assert_equal(batch.c_k_x.shape, (K, 3))
+        assert_equal(batch.V_kp1.shape, (K, batch.N, batch.nf))
+        assert_(batch.generators[1].c_k_x.base is batch.c_k_x)
+
+        for i in range(10):
+            batch.set_velocity_reference(refs)
+            batch.solve()
+            states = batch.update()
+            batch.set_initial_values(states)
+
+            for k, gen in enumerate(gens):
+                gen.set_velocity_reference(list(refs[k]))
+                gen.solve()
+                assert_allclose(batch.qp_g[k], gen.qp_g, rtol=RTOL, atol=ATOL)
+                assert_allclose(batch.qp_lbA[k], gen.qp_lbA, rtol=RTOL, atol=ATOL)
+                assert_allclose(batch.dofs[k], gen.dofs, rtol=RTOL, atol=ATOL)
+                gen.set_initial_values(*gen.update())
+
+                assert_equal(batch.qp_ret[k], gen.qp_ret)
+                assert_allclose(batch.c_k_x[k], gen.c_k_x, rtol=RTOL, atol=ATOL)
+                assert_allclose(batch.c_k_y[k], gen.c_k_y, rtol=RTOL, atol=ATOL)
+                assert_allclose(batch.F_k_x[k], gen.F_k_x, rtol=RTOL, atol=ATOL)
+
+    def test_solver_processes(self):
+        state = ([0.00949035, 0.0, 0.0], [0.095, 0.0, 0.0], 0.814, 0.00949035, 0.095, 0.0, 'left')
+        refs = numpy.array([[0.2, 0.0, 0.2], [0.1, 0.1, -0.2], [0.0, 0.2, 0.0]])
+        K = refs.shape[0]
+        assert_raises(ValueError, BatchNMPCGenerator, K, threads=2, processes=2)
+
+        # solvers moved to processes keep their warm start
+        batches = [
+            BatchNMPCGenerator(K, fsm_state='L/R'),
+            BatchNMPCGenerator(K, fsm_state='L/R', processes=2),
+        ]
+        for batch in batches:
+            batch.set_security_margin(0.09, 0.05)
+            batch.set_initial_values([state]*K)
+
+        for i in range(10):
+            for batch in batches:
+                batch.set_velocity_reference(refs)
+                batch.solve()
+                batch.set_initial_values(batch.update())
+            assert_allclose(batches[1].dofs, batches[0].dofs, rtol=RTOL, atol=ATOL)
+            assert_equal(batches[1].qp_nwsr, batches[0].qp_nwsr)
+
+        # processes are stopped on exit
+        processes = [p.process for p in batches[1]._processes]
+        with batches[1]:
+            pass
+        for process in processes:
+            assert_(not process.is_alive())
+
+
+if __name__ == '__main__':
+    try:
+        import nose
+        nose.runmodule()
+    except ImportError:
+        err_str = 'nose needed for unittests.\nPlease install using:\n   sudo pip install nose'
+        raise ImportError(err_str)
@@ -7,14 +7,8 @@ import matplotlib.pyplot as plt
 
 from walking_generator.classic import ClassicGenerator
 from walking_generator.utility import color_matrix
-try:
-    from qpoases import PyOptions as Options
-    from qpoases import PyPrintLevel as PrintLevel
-    from qpoases import PySQProblem as SQProblem
-    from qpoases import PySolutionAnalysis as SolutionAnalysis
-except ImportError:
-    err_str = 'Please install qpOASES python interface, else you will not be able to use this pattern generator.'
-    raise ImportError(err_str)
+from walking_generator.solvers import make_solver
+from walking_generator.solvers import SUCCESSFUL_RETURN, RET_QP_INFEASIBLE
 
 BASEDIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -107,16 +101,13 @@ class TestClassicGenerator(TestCase):
 
         # get solution
         assert_allclose(gen.ori_dofs, ori_x, rtol=RTOL, atol=ATOL)
-        assert_allclose(gen.ori_qp.getObjVal(), ori_f, rtol=RTOL, atol=ATOL)
+        assert_allclose(gen.ori_qp.get_objective_value(), ori_f, rtol=RTOL, atol=ATOL)
         assert_allclose(gen.pos_dofs, pos_x, rtol=RTOL, atol=ATOL)
-        assert_allclose(gen.pos_qp.getObjVal(), pos_f, rtol=RTOL, atol=ATOL)
+        assert_allclose(gen.pos_qp.get_objective_value(), pos_f, rtol=RTOL, atol=ATOL)
 
     def test_qp_setup_with_toy_example_hack_from_qpoases_manual(self):
         gen = ClassicGenerator()
 
-        options = Options()
-        options.printLevel = PrintLevel.LOW
-
 
         # define matrices from qpoases manual
         H   = numpy.array([ 1.0, 0.0, 0.0, 0.5 ]).reshape((2,2))
@@ -134,8 +125,7 @@ class TestClassicGenerator(TestCase):
         gen.ori_nv = 2
         gen.ori_nc = 1
         gen.ori_dofs = numpy.zeros((2,))
-        gen.ori_qp = SQProblem(gen.ori_nv, gen.ori_nc)
-        gen.ori_qp.setOptions(options)
+        gen.ori_qp = make_solver(gen.solver, gen.ori_nv, gen.ori_nc, print_level='low')
 
         gen.ori_H   = H
         gen.ori_A   = A
@@ -148,8 +138,7 @@ class TestClassicGenerator(TestCase):
         gen.pos_nv = 2
         gen.pos_nc = 1
         gen.pos_dofs = numpy.zeros((2,))
-        gen.pos_qp = SQProblem(gen.pos_nv, gen.pos_nc)
-        gen.pos_qp.setOptions(options)
+        gen.pos_qp = make_solver(gen.solver, gen.pos_nv, gen.pos_nc, print_level='low')
 
         gen.pos_H   = H
         gen.pos_A   = A
@@ -164,13 +153,13 @@ class TestClassicGenerator(TestCase):
 
         # get solution
         # NOTE post_process put entries into array that dont match anymore
-        gen.pos_qp.getPrimalSolution(gen.pos_dofs)
-        gen.ori_qp.getPrimalSolution(gen.ori_dofs)
+        gen.pos_qp.get_primal_solution(gen.pos_dofs)
+        gen.ori_qp.get_primal_solution(gen.ori_dofs)
 
         assert_allclose(gen.pos_dofs, x, rtol=RTOL, atol=ATOL)
-        assert_allclose(gen.pos_qp.getObjVal(), f, rtol=RTOL, atol=ATOL)
+        assert_allclose(gen.pos_qp.get_objective_value(), f, rtol=RTOL, atol=ATOL)
         assert_allclose(gen.ori_dofs, x, rtol=RTOL, atol=ATOL)
-        assert_allclose(gen.ori_qp.getObjVal(), f, rtol=RTOL, atol=ATOL)
+        assert_allclose(gen.ori_qp.get_objective_value(), f, rtol=RTOL, atol=ATOL)
 
         # define matrices for warmstart
         H_new   = numpy.array([ 1.0, 0.5, 0.5, 0.5 ]).reshape((2,2))
@@ -204,13 +193,13 @@ class TestClassicGenerator(TestCase):
 
         # get solution
         # NOTE post_process put entries into array that dont match anymore
-        gen.pos_qp.getPrimalSolution(gen.pos_dofs)
-        gen.ori_qp.getPrimalSolution(gen.ori_dofs)
+        gen.pos_qp.get_primal_solution(gen.pos_dofs)
+        gen.ori_qp.get_primal_solution(gen.ori_dofs)
 
         assert_allclose(gen.pos_dofs, x, rtol=RTOL, atol=ATOL)
-        assert_allclose(gen.pos_qp.getObjVal(), f, rtol=RTOL, atol=ATOL)
+        assert_allclose(gen.pos_qp.get_objective_value(), f, rtol=RTOL, atol=ATOL)
         assert_allclose(gen.ori_dofs, x, rtol=RTOL, atol=ATOL)
-        assert_allclose(gen.ori_qp.getObjVal(), f, rtol=RTOL, atol=ATOL)
+        assert_allclose(gen.ori_qp.get_objective_value(), f, rtol=RTOL, atol=ATOL)
 
     def test_classic_generator_weights(self):
         # weights defined for the Heirdt algorithm
@@ -434,6 +423,128 @@ class TestClassicGenerator(TestCase):
             #assert_allclose(gen.F_k_y, 0.0, rtol=RTOL, atol=ATOL)
             #assert_allclose(gen.F_k_q, 0.0, rtol=RTOL, atol=ATOL)
 
+    def test_eliminate_equalities(self):
+        # equality constraints eliminated by null space projection yield the
+        # same pattern as passing them to the solver
+        gens = [
+            ClassicGenerator(fsm_state='L/R', solver='activeset'),
+            ClassicGenerator(
+                fsm_state='L/R', solver='activeset', eliminate_equalities=True
+            ),
+        ]
+        for gen in gens:
+            gen.set_security_margin(0.09, 0.05)
+            gen.set_initial_values(
+                [0.00949035, 0.0, 0.0], [0.095, 0.0, 0.0], 0.814,
+                0.00949035, 0.095, 0.0, foot='left'
+            )
+            gen.set_velocity_reference([0.2, 0.0, 0.2])
+
+        for i in range(10):
+            for gen in gens:
+                gen.solve()
+            assert_allclose(gens[1].ori_dofs, gens[0].ori_dofs, rtol=1e-06, atol=1e-06)
+            assert_allclose(gens[1].pos_dofs, gens[0].pos_dofs, rtol=1e-06, atol=1e-06)
+
+            # support foot orientation freezing removes about half of the
+            # orientation variables
+            assert_(gens[1].ori_qp.qp.nv <= gens[1].ori_nv - gens[1].nc_fvel_eq/2)
+
+            for gen in gens:
+                gen.simulate()
+                comx, comy, comz, footx, footy, footq, foot, comq = gen.update()
+                gen.set_initial_values(
+                    comx, comy, comz, footx, footy, footq, foot, comq
+                )
+
+    def test_decoupled_xy_position_qp(self):
+        # straight walking with axis-aligned feet is solved by two QPs for
+        # x and y, which yields the same pattern as the coupled QP
+        gens = [
+            ClassicGenerator(fsm_state='L/R', solver='activeset'),
+            ClassicGenerator(fsm_state='L/R', solver='activeset', decouple_xy=True),
+            ClassicGenerator(
+                fsm_state='L/R', solver='activeset',
+                decouple_xy=True, parallel_xy=True
+            ),
+        ]
+        for gen in gens:
+            gen.set_security_margin(0.09, 0.05)
+            gen.set_initial_values(
+                [0.00949035, 0.0, 0.0], [0.095, 0.0, 0.0], 0.814,
+                0.00949035, 0.095, 0.0, foot='left'
+            )
+            gen.set_velocity_reference([0.2, 0.0, 0.0])
+
+        for i in range(10):
+            for gen in gens:
+                gen.solve()
+            for gen in gens[1:]:
+                assert_allclose(gen.pos_dofs, gens[0].pos_dofs, rtol=1e-06, atol=1e-06)
+
+            for gen in gens:
+                gen.simulate()
+                comx, comy, comz, footx, footy, footq, foot, comq = gen.update()
+                gen.set_initial_values(
+                    comx, comy, comz, footx, footy, footq, foot, comq
+                )
+
+        assert_equal(gens[0].pos_qp_path_counts['decoupled'], 0)
+        for gen in gens[1:]:
+            counts = gen.pos_qp_path_counts
+            assert_(counts['decoupled'] > 0)
+            assert_equal(counts['decoupled'] + counts['coupled'], 10)
+
+        # rotated feet couple the CoP constraints
+        gen = ClassicGenerator(fsm_state='L/R', solver='activeset', decouple_xy=True)
+        gen.set_initial_values(
+            [0.00949035, 0.0, 0.0], [0.095, 0.0, 0.0], 0.814,
+            0.00949035, 0.095, 0.3, foot='left'
+        )
+        gen.set_velocity_reference([0.2, 0.0, 0.0])
+        gen.solve()
+        assert_equal(gen.pos_qp_decoupled, 0.0)
+        assert_equal(gen.pos_qp_path_counts['coupled'], 1)
+        assert_equal(gen.pos_qp_path_counts['fallback'], 0)
+
+        # feet turned by 90 degrees are axis-aligned up to round-off
+        gens = [
+            ClassicGenerator(fsm_state='L/R', solver='activeset'),
+            ClassicGenerator(
+                fsm_state='L/R', solver='activeset',
+                decouple_xy=True, parallel_xy=True
+            ),
+        ]
+        for gen in gens:
+            gen.set_security_margin(0.09, 0.05)
+            gen.set_initial_values(
+                [0.00949035, 0.0, 0.0], [0.095, 0.0, 0.0], 0.814,
+                0.00949035, 0.095, numpy.pi/2, foot='left',
+                com_q=[numpy.pi/2, 0.0, 0.0]
+            )
+            gen.set_velocity_reference([0.2, 0.0, 0.0])
+            gen.solve()
+        assert_equal(gens[1].pos_qp_decoupled, 1.0)
+        assert_allclose(gens[1].pos_dofs, gens[0].pos_dofs, rtol=1e-06, atol=1e-06)
+
+        # failing QP of one coordinate falls back to the coupled QP
+        gen = gens[1]
+        qp_solve = gen.pos_qp_xy[0].solve
+        def failing_solve(*args):
+            ret, nwsr, cputime = qp_solve(*args)
+            return RET_QP_INFEASIBLE, nwsr, cputime
+        gen.pos_qp_xy[0].solve = failing_solve
+        gen.solve()
+        assert_equal(gen.pos_qp_decoupled, 0.0)
+        assert_equal(gen.pos_qp_ret, SUCCESSFUL_RETURN)
+        assert_equal(gen.pos_qp_path_counts['fallback'], 1)
+        assert_allclose(gen.pos_dofs, gens[0].pos_dofs, rtol=1e-06, atol=1e-06)
+
+        # thread pool is released
+        with gen:
+            pass
+        assert_(gen._xy_pool is None)
+
     def test_real_pattern_genererator_data(self):
         """ verify if data is reproducible """
         interp_data = numpy.loadtxt(
@@ -1,7 +1,9 @@
 import os
+import time
 import numpy
 numpy.set_printoptions(threshold=numpy.nan, linewidth =numpy.nan)
 from numpy.testing import *
+import numpy.testing.decorators as decorators
 import scipy.linalg as linalg
 import matplotlib.pyplot as plt
 
@@ -9,14 +11,9 @@ from walking_generator.visualization import Plotter
 from walking_generator.classic import ClassicGenerator
 from walking_generator.combinedqp import NMPCGenerator
 from walking_generator.utility import color_matrix
-try:
-    from qpoases import PyOptions as Options
-    from qpoases import PyPrintLevel as PrintLevel
-    from qpoases import PySQProblem as SQProblem
-    from qpoases import PySolutionAnalysis as SolutionAnalysis
-except ImportError:
-    err_str = 'Please install qpOASES python interface, else you will not be able to use this pattern generator.'
-    raise ImportError(err_str)
+from walking_generator.solvers import make_solver
+from walking_generator.solvers import SUCCESSFUL_RETURN, RET_DEADLINE_MISSED
+from walking_generator import workspace
 
 BASEDIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -53,10 +50,7 @@ class TestNMPCGenerator(TestCase):
 
         # setup problem
         gen.dofs = numpy.zeros(gen.nv)
-        gen.qp   = SQProblem(gen.nv, gen.nc)
-
-        # load NMPC options
-        #gen.qp.setOptions(gen.options)
+        gen.qp   = make_solver(gen.solver, gen.nv, gen.nc)
 
         gen.H   =  numpy.eye(gen.nv,gen.nv)
         gen.A   =  numpy.zeros((gen.nc,gen.nv))
@@ -319,6 +313,88 @@ class TestNMPCGenerator(TestCase):
         assert_allclose(classic_ori_lbA, nmpc_lbA_ori, atol=ATOL, rtol=RTOL)
         assert_allclose(classic_ori_ubA, nmpc_ubA_ori, atol=ATOL, rtol=RTOL)
 
+    def test_cached_hessian_blocks(self):
+        # define initial values
+        comx = [0.00949035, 0.0, 0.0]
+        comy = [0.095,      0.0, 0.0]
+        comz = 0.814
+        footx = 0.00949035
+        footy = 0.095
+        footq = 0.0
+
+        nmpc = NMPCGenerator()
+        nmpc.set_velocity_reference([0.2,0.0,-0.2])
+        nmpc.set_security_margin(0.04, 0.04)
+        nmpc.set_initial_values(comx, comy, comz, footx, footy, footq, foot='left')
+
+        N  = nmpc.N
+        nf = nmpc.nf
+        for i in range(12):
+            nmpc._preprocess_solution()
+
+            # recompute Hessian blocks from scratch
+            Pvu = nmpc.Pvu; Pzu = nmpc.Pzu; V_kp1 = nmpc.V_kp1
+            Q_k_x = numpy.zeros((N+nf, N+nf))
+            Q_k_x[:N,:N] = nmpc.a * Pvu.T.dot(Pvu) \
+                         + nmpc.c * Pzu.T.dot(Pzu) + nmpc.d * numpy.eye(N)
+            Q_k_x[:N,N:] = - nmpc.c * Pzu.T.dot(V_kp1)
+            Q_k_x[N:,:N] = Q_k_x[:N,N:].T
+            Q_k_x[N:,N:] =   nmpc.c * V_kp1.T.dot(V_kp1)
+
+            assert_allclose(nmpc.Q_k_x, Q_k_x)
+
+            # shift selection matrices as during update
+            nmpc._update_selection_matrices()
+
+        # change of weights invalidates cached block
+        nmpc.d = 1e-03
+        nmpc._preprocess_solution()
+        assert_allclose(
+            nmpc.Q_k_x[:N,:N],
+            nmpc.a * Pvu.T.dot(Pvu) + nmpc.c * Pzu.T.dot(Pzu) + 1e-03*numpy.eye(N)
+        )
+
+        # overwritten block, e.g. by reset of generator, is recomputed
+        nmpc.Q_k_x[:N,:N] = 0.0
+        nmpc._preprocess_solution()
+        assert_allclose(
+            nmpc.Q_k_x[:N,:N],
+            nmpc.a * Pvu.T.dot(Pvu) + nmpc.c * Pzu.T.dot(Pzu) + 1e-03*numpy.eye(N)
+        )
+
+    def test_cached_hessian_blocks_parameter_change(self):
+        # define initial values
+        comx = [0.00949035, 0.0, 0.0]
+        comy = [0.095,      0.0, 0.0]
+        footx = 0.00949035
+        footy = 0.095
+        footq = 0.0
+
+        def generator(comz, c):
+            nmpc = NMPCGenerator()
+            nmpc.c = c
+            nmpc.set_velocity_reference([0.2,0.0,-0.2])
+            nmpc.set_security_margin(0.04, 0.04)
+            nmpc.set_initial_values(comx, comy, comz, footx, footy, footq, foot='left')
+            return nmpc
+
+        nmpc = generator(0.814, 1e-06)
+        nmpc.solve()
+
+        # changed weight and CoM height between two solves yield the same
+        # Hessian as a freshly built generator
+        for comz, c in ((0.814, 1e-02), (0.6, 1e-02)):
+            nmpc.c = c
+            nmpc.set_initial_values(comx, comy, comz, footx, footy, footq, foot='left')
+            nmpc.solve()
+
+            ref = generator(comz, c)
+            ref.solve()
+
+            assert_allclose(nmpc.Q_k_x,  ref.Q_k_x,  rtol=1e-12, atol=0.0)
+            assert_allclose(nmpc.Q_k_qR, ref.Q_k_qR, rtol=1e-12, atol=0.0)
+            assert_allclose(nmpc.Q_k_qL, ref.Q_k_qL, rtol=1e-12, atol=0.0)
+
     def test_new_generator(self):
         # define initial values
         comx = [0.00949035, 0.0, 0.0]
@@ -349,6 +425,166 @@ class TestNMPCGenerator(TestCase):
         print nmpc.qp_nwsr
         print nmpc.qp_cputime
 
+    def test_deadline_fallback(self):
+        # define initial values
+        comx = [0.00949035, 0.0, 0.0]
+        comy = [0.095,      0.0, 0.0]
+        comz = 0.814
+        footx = 0.00949035
+        footy = 0.095
+        footq = 0.0
+
+        # scenario of nmpc_standalone.py
+        nmpc = NMPCGenerator(fsm_state='L/R')
+        nmpc.set_velocity_reference([0.2,0.0, 0.2])
+        nmpc.set_security_margin(0.09, 0.05)
+        nmpc.set_initial_values(comx, comy, comz, footx, footy, footq, foot='left')
+
+        # generous deadline solves the QP within its budget
+        nmpc.solve(deadline=time.time() + 10.0)
+        assert_equal(nmpc.qp_ret, SUCCESSFUL_RETURN)
+        assert_equal(nmpc.qp_fallback, 0.0)
+        assert_(0.0 < nmpc.qp_budget <= 10000.0)
+        dddC_k_x = nmpc.dddC_k_x.copy()
+        F_k_x = nmpc.F_k_x.copy()
+        nmpc.update()
+
+        # missed deadline continues with the shifted previous solution
+        nmpc.solve(deadline=time.time() - 1.0)
+        assert_equal(nmpc.qp_ret, RET_DEADLINE_MISSED)
+        assert_equal(nmpc.qp_fallback, 1.0)
+        assert_equal(nmpc.qp_budget, 0.0)
+        assert_allclose(nmpc.dddC_k_x[:-1], dddC_k_x[1:])
+        assert_allclose(nmpc.dddC_k_x[-1], dddC_k_x[-1])
+        assert_allclose(nmpc.F_k_x, F_k_x)
+        nmpc.update()
+
+        # status of every tick is recorded
+        assert_equal(nmpc.data.data['qp_ret'], [SUCCESSFUL_RETURN, RET_DEADLINE_MISSED])
+        assert_equal(nmpc.data.data['qp_fallback'], [0.0, 1.0])
+
+    def test_sqp_iterations(self):
+        # define initial values
+        comx = [0.00949035, 0.0, 0.0]
+        comy = [0.095,      0.0, 0.0]
+        comz = 0.814
+        footx = 0.00949035
+        footy = 0.095
+        footq = 0.0
+
+        # scenario of nmpc_standalone.py
+        rti = NMPCGenerator(fsm_state='L/R')
+        sqp = NMPCGenerator(fsm_state='L/R', sqp_iterations=5)
+        for gen in (rti, sqp):
+            gen.set_velocity_reference([0.2,0.0, 0.2])
+            gen.set_security_margin(0.09, 0.05)
+            gen.set_initial_values(comx, comy, comz, footx, footy, footq, foot='left')
+            gen.solve()
+
+        # real time iteration applies full step of single QP
+        assert_equal(rti.sqp_iter, 1)
+        assert_equal(rti.sqp_alpha, 1.0)
+
+        # SQP iterates until convergence on nonlinear constraints
+        assert_(1 < sqp.sqp_iter <= 5)
+        assert_(0.0 < sqp.sqp_alpha <= 1.0)
+        assert_(sqp.sqp_kkt  <= sqp.sqp_tol_kkt
+             or sqp.sqp_step <= sqp.sqp_tol_step)
+        assert_allclose(sqp.sqp_viol, 0.0, atol=ATOL)
+
+        # converged KKT residual is recorded per tick
+        sqp.update()
+        assert_equal(sqp.data.data['sqp_iter'], [sqp.sqp_iter])
+        assert_equal(sqp.data.data['sqp_kkt'], [sqp.sqp_kkt])
+
+    def test_receding_horizon_shift(self):
+        # define initial values
+        comx = [0.00949035, 0.0, 0.0]
+        comy = [0.095,      0.0, 0.0]
+        comz = 0.814
+        footx = 0.00949035
+        footy = 0.095
+        footq = 0.0
+
+        # scenario of nmpc_standalone.py
+        nmpc = NMPCGenerator(fsm_state='L/R')
+        nmpc.set_velocity_reference([0.2,0.0, 0.2])
+        nmpc.set_security_margin(0.09, 0.05)
+        nmpc.set_initial_values(comx, comy, comz, footx, footy, footq, foot='left')
+
+        # rows of a sample move to the preceding one, first ones drop out
+        nv = nmpc.nv
+        row_map = nmpc._shift_row_maps[False]
+        assert_equal(row_map[:nv+nmpc.nFootEdge], -1)
+        assert_equal(row_map[nv+nmpc.nFootEdge:nv+nmpc.nc_cop], numpy.arange(nv, nv+nmpc.nc_cop-nmpc.nFootEdge))
+        a = nv + nmpc.nc_cop
+        b = a + nmpc.nc_foot_position
+        assert_equal(row_map[a:b], numpy.arange(a, b))
+        assert_equal(nmpc._shift_row_maps[True][a:a+nmpc.nFootPosHullEdges], -1)
+
+        nwsr = []
+        for i in range(16):
+            nmpc.solve()
+            nwsr.append(nmpc.qp_nwsr)
+            dddC_k_x = nmpc.dddC_k_x.copy()
+            F_k_x = nmpc.F_k_x.copy()
+            f_k_x = nmpc.f_k_x
+
+            comx, comy, comz, footx, footy, footq, foot, comq = nmpc.update()
+            nmpc.set_initial_values(comx, comy, comz, footx, footy, footq, foot, comq)
+
+            # controls are shifted by one sample
+            assert_allclose(nmpc.dddC_k_x[:-1], dddC_k_x[1:])
+            assert_allclose(nmpc.dddC_k_x[-1], dddC_k_x[-1])
+
+            # after a step the last stride is repeated for the new last step
+            if nmpc._support_changed:
+                assert_allclose(nmpc.F_k_x[0], F_k_x[1])
+                assert_allclose(nmpc.F_k_x[1], F_k_x[0] + F_k_x[1] - f_k_x)
+            else:
+                assert_allclose(nmpc.F_k_x, F_k_x)
+
+        # warm start from shifted solution needs few working set changes
+        assert_(numpy.mean(nwsr[1:]) < nwsr[0])
+
+    @decorators.skipif(workspace.tracemalloc is None, 'debug mode needs tracemalloc')
+    def test_steady_state_allocations(self):
+        nmpc = NMPCGenerator(fsm_state='L/R')
+        nmpc.set_velocity_reference([0.2,0.0, 0.2])
+        nmpc.set_security_margin(0.09, 0.05)
+        nmpc.set_initial_values(
+            [0.00949035, 0.0, 0.0], [0.095, 0.0, 0.0], 0.814,
+            0.00949035, 0.095, 0.0, foot='left'
+        )
+
+        def tick():
+            nmpc.solve()
+            nmpc.set_initial_values(*nmpc.update())
+
+        # fill caches over two gait cycles
+        for i in range(32):
+            tick()
+
+        # steady state ticks stay below the fixed bound of the workspace,
+        # i.e. do not allocate new arrays
+        ws = nmpc.workspace
+        ws.debug = True
+        ws.max_bytes = 8192
+        for i in range(16):
+            tick()
+        assert_(ws.checks > 0)
+        assert_(ws.peak <= ws.max_bytes)
+
+        # allocation introduced into each tick is detected, i.e. a
+        # temporary of the size of the position constraint matrix
+        assert_(nmpc.A_pos_x.nbytes > ws.max_bytes)
+        calculate_gradients = nmpc._calculate_gradients
+        def allocating_gradients():
+            calculate_gradients()
+            nmpc.p_k_x[0] += 0.0 * nmpc.A_pos_x.copy()[0,0]
+        nmpc._calculate_gradients = allocating_gradients
+        assert_raises(AssertionError, tick)
+
 
 if __name__ == '__main__':
     try:
@@ -1,10 +1,15 @@
 import os
+import sys
+import tempfile
+import subprocess
 import numpy
 numpy.set_printoptions(threshold=numpy.nan, linewidth =numpy.nan)
 from numpy.testing import *
 import scipy.linalg as linalg
 
 from walking_generator.interpolation import *
+from walking_generator.helper import CoMStateType, ZMPStateType, FootStateType
+from walking_generator.combinedqp import NMPCGenerator
 
 BASEDIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -19,6 +24,167 @@ class TestInterpolation(TestCase):
     def test_dummy(self):
         pass
 
+    def test_without_matplotlib(self):
+        # interpolation and its generators do not depend on the plotting
+        # backend, checked in a fresh interpreter
+        code = (
+            'import sys\n'
+            'import walking_generator.interpolation\n'
+            'import walking_generator.classic\n'
+            'assert "matplotlib" not in sys.modules\n'
+        )
+        cwd = os.path.dirname(BASEDIR)
+        assert_equal(subprocess.call([sys.executable, '-c', code], cwd=cwd), 0)
+
+    def test_lipm_buffers(self):
+        for commandPeriod in (0.005, 0.004, 0.01):
+            self.check_lipm_buffers(LIPM(0.1, commandPeriod, 0.814))
+
+        # interpolation matrices are shared between instances
+        lipm = LIPM(0.1, 0.005, 0.814)
+        assert_(lipm.matrices is LIPM(0.1, 0.005, 0.814).matrices)
+        assert_(not lipm.matrices.S.flags.writeable)
+
+    def check_lipm_buffers(self, lipm):
+        n = lipm.intervaleSize
+
+        curCoM = numpy.zeros((), dtype=CoMStateType)
+        curCoM['x'] = [0.01, 0.1, -0.2]
+        curCoM['y'] = [0.09, -0.05, 0.3]
+        CoMbuffer = numpy.zeros((n,), dtype=CoMStateType)
+        ZMPbuffer = numpy.zeros((n,), dtype=ZMPStateType)
+
+        # dynamics of one interpolation sample
+        T = lipm.T
+        A = numpy.array([[1.0, T, T*T/2.0], [0.0, 1.0, T], [0.0, 0.0, 1.0]])
+        B = numpy.array([T*T*T/6.0, T*T/2.0, T])
+        C = numpy.array([1.0, 0.0, -lipm.h_com/lipm.g])
+
+        x = curCoM['x'].copy()
+        y = curCoM['y'].copy()
+        jerkX = 0.5; jerkY = -1.5
+        lipm.interpolate(jerkX, jerkY, curCoM, ZMPbuffer, CoMbuffer)
+
+        # buffers hold the sample by sample recursion
+        for i in range(n):
+            assert_allclose(CoMbuffer['x'][i], x, rtol=self.RTOL, atol=self.ATOL)
+            assert_allclose(CoMbuffer['y'][i], y, rtol=self.RTOL, atol=self.ATOL)
+            assert_allclose(ZMPbuffer['x'][i], x.dot(C), rtol=self.RTOL, atol=self.ATOL)
+            assert_allclose(ZMPbuffer['y'][i], y.dot(C), rtol=self.RTOL, atol=self.ATOL)
+            x = A.dot(x) + B*jerkX
+            y = A.dot(y) + B*jerkY
+
+        # current state is advanced by one control period
+        assert_allclose(curCoM['x'], x, rtol=self.RTOL, atol=self.ATOL)
+        assert_allclose(curCoM['y'], y, rtol=self.RTOL, atol=self.ATOL)
+
+    def test_polynome_evaluate(self):
+        p5 = Polynome5()
+        p5.setParameters(0.7, 0.3, 0.01, 0.2, -0.5)
+        p4 = Polynome4()
+        p4.setParameters(0.7, 0.05, 0.0, 0.0)
+
+        # times outside of [0, FT] are clamped
+        times = numpy.linspace(-0.2, 1.0, 25)
+        for p in (p5, p4):
+            r, dr, ddr = p.evaluate(times)
+            assert_equal(r.shape, times.shape)
+            assert_allclose(r, [p.compute(t) for t in times], rtol=self.RTOL, atol=self.ATOL)
+            assert_allclose(dr, [p.computeDerivative(t) for t in times], rtol=self.RTOL, atol=self.ATOL)
+            assert_allclose(ddr, [p.computeSecDerivative(t) for t in times], rtol=self.RTOL, atol=self.ATOL)
+
+        # boundary conditions
+        r, dr, ddr = p5.evaluate(numpy.array([0.0, 0.7]))
+        assert_allclose(r, [0.01, 0.3], rtol=self.RTOL, atol=self.ATOL)
+        assert_allclose(dr, [0.2, 0.0], rtol=self.RTOL, atol=self.ATOL)
+        assert_allclose(ddr, [-0.5, 0.0], rtol=self.RTOL, atol=self.ATOL)
+        assert_allclose(p4.evaluate(0.35)[0], 0.05, rtol=self.RTOL, atol=self.ATOL)
+
+    def test_trajectories(self):
+        gen = NMPCGenerator(fsm_state='L/R')
+        gen.set_security_margin(0.09, 0.05)
+        gen.set_initial_values(
+            [0.00949035, 0.0, 0.0], [0.095, 0.0, 0.0], 0.814,
+            0.00949035, 0.095, 0.0, foot='left'
+        )
+        interp = Interpolation(0.005, gen)
+        n = interp.lipm.intervaleSize
+        # trajectories start with 30 periods of the initial state
+        m = 30*n
+        c_k_x = []
+        for i in range(3):
+            gen.set_velocity_reference([0.2, 0.0, 0.2])
+            gen.solve()
+            c_k_x.append(gen.c_k_x[0])
+            interp.interpolate(i*gen.T)
+            gen.simulate()
+            gen.set_initial_values(*gen.update())
+
+        # trajectories are structured arrays of all samples
+        assert_equal(interp.comTraj.dtype, CoMStateType)
+        assert_equal(interp.leftFootTraj.dtype, FootStateType)
+        assert_equal(interp.comTraj.shape, (m + 3*n,))
+        assert_equal(interp.zmpTraj.shape, (m + 3*n,))
+        # first period is double support, then the left foot is support foot
+        assert_equal(interp.leftFootTraj['supportFoot'][m:m+n], 0)
+        assert_equal(interp.leftFootTraj['supportFoot'][m+n:], 1)
+        assert_equal(interp.rightFootTraj['supportFoot'][m:], 0)
+        assert_allclose(interp.comTraj['x'][m::n,0], c_k_x, rtol=self.RTOL, atol=self.ATOL)
+
+        fd, filename = tempfile.mkstemp(suffix='.txt')
+        os.close(fd)
+        try:
+            interp.save_to_file(filename)
+            data = numpy.loadtxt(filename)
+        finally:
+            os.remove(filename)
+        assert_equal(data.shape, (m + 3*n, 20))
+        assert_allclose(data[:,0], interp.comTraj['x'][:,0], rtol=self.RTOL, atol=self.ATOL)
+
+    def test_interpolate_horizon(self):
+        gen = NMPCGenerator(fsm_state='L/R')
+        gen.set_security_margin(0.09, 0.05)
+        gen.set_initial_values(
+            [0.00949035, 0.0, 0.0], [0.095, 0.0, 0.0], 0.814,
+            0.00949035, 0.095, 0.0, foot='left'
+        )
+        interp = Interpolation(0.005, gen)
+        n = interp.interval
+
+        # ticks of double support, single support and change of support
+        for i in range(10):
+            gen.set_velocity_reference([0.2, 0.0, 0.2])
+            gen.solve()
+            com, zmp, lf, rf = [a.copy() for a in interp.interpolate_horizon(i*gen.T)]
+            interp.interpolate(i*gen.T)
+
+            assert_equal(com.shape, (gen.N*n,))
+            assert_equal(lf.shape, (gen.N*n,))
+
+            # first QP sampling period equals interpolate
+            for horizon, buf in (
+                (com, interp.CoMbuffer), (zmp, interp.ZMPbuffer),
+                (lf, interp.LFbuffer), (rf, interp.RFbuffer),
+            ):
+                for key in buf.dtype.names:
+                    assert_allclose(horizon[key][:n], buf[key], rtol=self.RTOL, atol=self.ATOL)
+
+            # CoM passes through predicted states of the generator
+            C_kp1_x = gen.Pps.dot(gen.c_k_x) + gen.Ppu.dot(gen.dddC_k_x)
+            C_kp1_y = gen.Pps.dot(gen.c_k_y) + gen.Ppu.dot(gen.dddC_k_y)
+            assert_allclose(com['x'][n::n,0], C_kp1_x[:-1], rtol=self.RTOL, atol=self.ATOL)
+            assert_allclose(com['y'][n::n,0], C_kp1_y[:-1], rtol=self.RTOL, atol=self.ATOL)
+
+            # feet land on the previewed steps
+            if gen.currentSupport.foot == 'left':
+                F_x = (rf['x'][-1], lf['x'][-1])
+            else:
+                F_x = (lf['x'][-1], rf['x'][-1])
+            assert_allclose(F_x, gen.F_k_x, rtol=self.RTOL, atol=self.ATOL)
+
+            gen.simulate()
+            gen.set_initial_values(*gen.update())
+
 if __name__ == '__main__':
     try:
         import nose
@@ -0,0 +1,135 @@
+import os
+import time
+import shutil
+import tempfile
+import numpy
+numpy.set_printoptions(threshold=numpy.nan, linewidth =numpy.nan)
+from numpy.testing import *
+
+from walking_generator.recorder import Recorder, GeneratorRecorder, load_recording
+from walking_generator.combinedqp import NMPCGenerator
+
+class FailingRecorder(Recorder):
+    def _write_header(self, n, spare=0):
+        if n > 0:
+            raise IOError('disk full')
+        super(FailingRecorder, self)._write_header(n, spare)
+
+class TestRecorder(TestCase):
+    """
+    Test streaming recording of per tick data
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def wait_for_records(self, filename, n, timeout=5.0):
+        """ records are written in background """
+        t0 = time.time()
+        while load_recording(filename).shape[0] < n and time.time() - t0 < timeout:
+            time.sleep(0.01)
+        return load_recording(filename)
+
+    def test_append_and_partial_file(self):
+        filename = os.path.join(self.tmpdir, 'rec.npy')
+        rec = Recorder(filename, chunk_size=4, nchunks=4)
+        for i in range(10):
+            rec.record({'i': i, 'x': [i, -i], 's': 'L/R'})
+
+        # two full chunks are readable while recording
+        partial = self.wait_for_records(filename, 8)
+        assert_equal(partial['i'], range(8))
+        assert_equal(partial['x'][:,1], -numpy.arange(8))
+        assert_equal(numpy.load(filename)['i'], range(8))
+
+        rec.close()
+        assert_equal(rec.written, 10)
+        assert_equal(rec.dropped, 0)
+        assert_raises(ValueError, rec.record, {'i': 0, 'x': [0, 0], 's': ''})
+
+        # closed recording is a regular .npy file
+        data = numpy.load(filename)
+        assert_equal(data['i'], range(10))
+        assert_equal(data['s'], ['L/R']*10)
+
+        # incomplete trailing record of interrupted recording is ignored
+        with open(filename, 'ab') as f:
+            f.write('\0' * (data.dtype.itemsize // 2))
+        assert_equal(load_recording(filename)['i'], range(10))
+
+    def test_writer_error(self):
+        filename = os.path.join(self.tmpdir, 'rec.npy')
+        rec = FailingRecorder(filename, chunk_size=4, nchunks=4)
+        for i in range(4):
+            rec.record({'i': i})
+
+        # error of writer thread is raised in calling thread
+        rec._writer.join(5.0)
+        assert_(not rec._writer.is_alive())
+        assert_raises(IOError, rec.record, {'i': 4})
+        assert_raises(IOError, rec.close)
+
+    def test_bounded_memory(self):
+        # without free chunk, records of full chunks are dropped
+        filename = os.path.join(self.tmpdir, 'rec.npy')
+        rec = Recorder(filename, chunk_size=4, nchunks=1)
+        for i in range(10):
+            rec.record({'i': i})
+        rec.close()
+        assert_equal(rec.dropped, 8)
+        assert_equal(numpy.load(filename)['i'], [8, 9])
+
+    def test_blocking(self):
+        # blocking recorder waits for the writer instead of dropping
+        filename = os.path.join(self.tmpdir, 'rec.npy')
+        rec = Recorder(filename, chunk_size=4, nchunks=1, blocking=True)
+        for i in range(10):
+            rec.record({'i': i})
+        rec.close()
+        assert_equal(rec.dropped, 0)
+        assert_equal(numpy.load(filename)['i'], range(10))
+
+        # error of writer is raised instead of waiting forever for the
+        # chunk, i.e. writing the data fails on the closed file
+        rec = Recorder(filename, chunk_size=4, nchunks=1, blocking=True)
+        rec.record({'i': 0})
+        rec._file.close()
+        for i in range(1, 3):
+            rec.record({'i': i})
+        assert_raises(ValueError, rec.record, {'i': 3})
+
+    def test_generator_recorder(self):
+        filename = os.path.join(self.tmpdir, 'walk.npy')
+        gen = NMPCGenerator(fsm_state='L/R')
+        ref = NMPCGenerator(fsm_state='L/R')
+        gen.data = GeneratorRecorder(filename, gen, chunk_size=4)
+
+        for g in (gen, ref):
+            g.set_security_margin(0.09, 0.05)
+            g.set_initial_values(
+                [0.00949035, 0.0, 0.0], [0.095, 0.0, 0.0], 0.814,
+                0.00949035, 0.095, 0.0, foot='left'
+            )
+            for i in range(10):
+                g.set_velocity_reference([0.2, 0.0, 0.2])
+                g.solve()
+                g.simulate()
+                g.set_initial_values(*g.update())
+        gen.data.close()
+
+        data = load_recording(filename)
+        assert_equal(data.shape, (10,))
+        for key in ('c_k_x', 'f_k_x', 'F_k_x', 'C_kp1_x', 'lfoot', 'fsm_state'):
+            assert_equal(data[key], ref.data.data[key])
+
+
+if __name__ == '__main__':
+    try:
+        import nose
+        nose.runmodule()
+    except ImportError:
+        err_str = 'nose needed for unittests.\nPlease install using:\n   sudo pip install nose'
+        raise ImportError(err_str)
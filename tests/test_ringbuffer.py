@@ -0,0 +1,127 @@
+import threading
+import numpy
+numpy.set_printoptions(threshold=numpy.nan, linewidth =numpy.nan)
+from numpy.testing import *
+
+from walking_generator.ringbuffer import RingBuffer
+from walking_generator.helper import InterpolationSampleType
+from walking_generator.interpolation import Interpolation
+from walking_generator.combinedqp import NMPCGenerator
+
+SampleType = numpy.dtype([('i', int), ('x', float, (3,))])
+
+def samples(start, stop):
+    s = numpy.zeros((stop - start,), dtype=SampleType)
+    s['i'] = numpy.arange(start, stop)
+    s['x'] = s['i'][:,numpy.newaxis]
+    return s
+
+class TestRingBuffer(TestCase):
+    """
+    Test queue of interpolated samples
+    """
+
+    def test_wrap_around(self):
+        queue = RingBuffer(5, SampleType)
+        assert_equal(queue.push(samples(0, 3)), 3)
+        assert_equal(queue.pop()['i'], 0)
+        assert_equal(queue.pop()['i'], 1)
+
+        # slots are reused after wrap around
+        assert_equal(queue.push(samples(3, 7)), 4)
+        assert_equal(len(queue), 5)
+        assert_equal(queue.peek(10)['i'], range(2, 7))
+
+        out = numpy.zeros((), dtype=SampleType)
+        for i in range(2, 7):
+            assert_(queue.pop(out) is out)
+            assert_equal(out['i'], i)
+            assert_equal(out['x'], [i, i, i])
+        assert_equal(queue.overruns, 0)
+        assert_equal(queue.underruns, 0)
+
+    def test_overrun_and_underrun(self):
+        queue = RingBuffer(4, SampleType)
+        assert_(queue.pop() is None)
+        assert_equal(queue.underruns, 1)
+
+        # samples of full queue are dropped
+        assert_equal(queue.push(samples(0, 6)), 4)
+        assert_equal(queue.push(samples(6, 8)), 0)
+        assert_equal(queue.overruns, 4)
+
+        # popped samples are copies
+        sample = queue.pop()
+        queue.push(samples(10, 11))
+        assert_equal(sample['i'], 0)
+        assert_equal(queue.peek(4)['i'], [1, 2, 3, 10])
+
+        queue.clear()
+        assert_equal(len(queue), 0)
+        assert_(queue.pop() is None)
+        assert_equal(queue.underruns, 2)
+
+    def test_threads(self):
+        queue = RingBuffer(64, SampleType)
+        total = 20000
+        popped = []
+
+        def consume():
+            out = numpy.zeros((), dtype=SampleType)
+            while len(popped) + queue.overruns < total:
+                if queue.pop(out) is not None:
+                    popped.append(int(out['i']))
+
+        consumer = threading.Thread(target=consume)
+        consumer.start()
+        for start in range(0, total, 20):
+            queue.push(samples(start, start + 20))
+        consumer.join(10.0)
+        assert_(not consumer.is_alive())
+
+        # samples are consumed in order, apart from the dropped ones
+        assert_equal(len(popped) + queue.overruns, total)
+        assert_((numpy.diff(popped) > 0).all())
+
+    def test_interpolation_queue(self):
+        gen = NMPCGenerator(fsm_state='L/R')
+        gen.set_security_margin(0.09, 0.05)
+        gen.set_initial_values(
+            [0.00949035, 0.0, 0.0], [0.095, 0.0, 0.0], 0.814,
+            0.00949035, 0.095, 0.0, foot='left'
+        )
+        queue = RingBuffer(50, InterpolationSampleType)
+        interp = Interpolation(0.005, gen, queue=queue)
+        n = interp.interval
+
+        sample = numpy.zeros((), dtype=InterpolationSampleType)
+        for i in range(3):
+            gen.set_velocity_reference([0.2, 0.0, 0.2])
+            gen.solve()
+            interp.interpolate(i*gen.T)
+
+            # controller consumes samples of one QP sampling period
+            assert_equal(len(queue), n)
+            for j in range(n):
+                queue.pop(sample)
+                assert_equal(sample['com'], interp.CoMbuffer[j])
+                assert_equal(sample['zmp'], interp.ZMPbuffer[j])
+                assert_equal(sample['lf'], interp.LFbuffer[j])
+                assert_equal(sample['rf'], interp.RFbuffer[j])
+
+            gen.simulate()
+            gen.set_initial_values(*gen.update())
+
+        # queue replaces the full trajectories
+        assert_equal(interp.comTraj.shape, (0,))
+        assert_equal(queue.underruns, 0)
+        assert_equal(queue.overruns, 0)
+
+
+if __name__ == '__main__':
+    try:
+        import nose
+        nose.runmodule()
+    except ImportError:
+        err_str = 'nose needed for unittests.\nPlease install using:\n   sudo pip install nose'
+        raise ImportError(err_str)
@@ -0,0 +1,135 @@
+import numpy
+numpy.set_printoptions(threshold=numpy.nan, linewidth =numpy.nan)
+from numpy.testing import *
+
+from walking_generator.runtime import Runtime, LatencyHistogram, DoubleBuffer
+from walking_generator.interpolation import Interpolation
+from walking_generator.combinedqp import NMPCGenerator
+
+def initialized_generator(cls=NMPCGenerator):
+    gen = cls(fsm_state='L/R')
+    gen.set_security_margin(0.09, 0.05)
+    gen.set_initial_values(
+        [0.00949035, 0.0, 0.0], [0.095, 0.0, 0.0], 0.814,
+        0.00949035, 0.095, 0.0, foot='left'
+    )
+    gen.set_velocity_reference([0.2, 0.0, 0.2])
+    return gen
+
+class FailingGenerator(NMPCGenerator):
+    def solve(self):
+        raise ValueError('solver failed')
+
+class RecordingGenerator(NMPCGenerator):
+    deadlines = None
+    fallbacks = None
+
+    def solve(self, deadline=None):
+        super(RecordingGenerator, self).solve(deadline=deadline)
+        self.deadlines.append(deadline)
+        self.fallbacks.append(self.qp_fallback)
+
+class TestRuntime(TestCase):
+    """
+    Test asynchronous pattern generator runtime
+    """
+
+    def test_latency_histogram(self):
+        hist = LatencyHistogram(edges=[0.001, 0.01, 0.1])
+        for duration in [0.0005]*5 + [0.005]*4 + [0.05]:
+            hist.add(duration)
+
+        assert_equal(hist.counts, [5, 4, 1, 0])
+        assert_allclose(hist.mean(), 0.00725)
+        assert_equal(hist.percentile(50), 0.001)
+        assert_equal(hist.percentile(90), 0.01)
+        assert_equal(hist.percentile(100), 0.05)
+        assert_equal(hist.summary()['count'], 10)
+
+    def test_double_buffer(self):
+        state = DoubleBuffer([('tick', int), ('x', float, (3,))])
+        assert_(state.read() is None)
+
+        state.back()['tick'] = 1
+        state.publish()
+        # back buffer is written without changing the published record
+        state.back()['tick'] = 2
+        assert_equal(state.read()['tick'], 1)
+        state.publish()
+        assert_equal(state.read()['tick'], 2)
+        assert_equal(state.version, 2)
+
+    def test_against_serial_loop(self):
+        ticks = 12
+        ref = initialized_generator()
+        interp = Interpolation(0.005, ref)
+        expected = []
+        for i in range(ticks):
+            ref.solve()
+            ref.simulate()
+            interp.interpolate(i*ref.T)
+            expected.append(interp.CoMbuffer['x'].copy())
+            ref.set_initial_values(*ref.update())
+        expected = numpy.concatenate(expected)
+
+        gen = initialized_generator()
+        runtime = Runtime(gen, realtime=False)
+        samples = []
+        runtime.start(ticks=ticks, controller=lambda s: samples.append(s['com']['x'].copy()))
+        runtime.set_velocity_reference([0.2, 0.0, 0.2])
+        runtime.join()
+
+        # samples are streamed in order without gaps
+        n = runtime.interpolation.interval
+        assert_equal(len(samples), ticks*n)
+        assert_equal(runtime.queue.overruns, 0)
+        assert_equal(runtime.queue.underruns, 0)
+        assert_allclose(samples, expected)
+
+        # state after the last tick
+        state = runtime.state()
+        assert_equal(state['tick'], ticks)
+        assert_equal(state['c_k_x'], gen.c_k_x)
+        assert_equal(state['F_k_x'], gen.F_k_x)
+
+        stats = runtime.statistics()
+        assert_equal(stats['solve']['count'], ticks)
+        assert_equal(stats['control']['count'], ticks*n)
+        assert_equal(stats['command']['count'], 1)
+
+    def test_solver_error(self):
+        gen = FailingGenerator(fsm_state='L/R')
+        runtime = Runtime(gen, realtime=False)
+        runtime.start(ticks=5, controller=lambda s: None)
+        assert_raises(ValueError, runtime.join)
+        assert_equal(runtime.tick, 0)
+
+    def test_deadline(self):
+        ticks = 8
+        gen = initialized_generator(RecordingGenerator)
+        gen.deadlines = []
+        gen.fallbacks = []
+        runtime = Runtime(gen, use_deadline=True)
+        runtime.start(ticks=ticks, controller=lambda s: None)
+        runtime.join()
+
+        # first tick is solved without deadline, later ones before the
+        # controller runs out of samples
+        assert_equal(len(gen.deadlines), ticks)
+        assert_(gen.deadlines[0] is None)
+        assert_(None not in gen.deadlines[1:])
+        assert_equal(gen.fallbacks, [0.0]*ticks)
+
+        # deadlines need a realtime controller and a generator supporting them
+        assert_raises(ValueError, Runtime, gen, realtime=False, use_deadline=True)
+        gen = FailingGenerator(fsm_state='L/R')
+        assert_raises(ValueError, Runtime, gen, use_deadline=True)
+
+
+if __name__ == '__main__':
+    try:
+        import nose
+        nose.runmodule()
+    except ImportError:
+        err_str = 'nose needed for unittests.\nPlease install using:\n   sudo pip install nose'
+        raise ImportError(err_str)
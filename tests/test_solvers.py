@@ -0,0 +1,260 @@
+import os
+import numpy
+numpy.set_printoptions(threshold=numpy.nan, linewidth =numpy.nan)
+from numpy.testing import *
+
+from walking_generator import solvers
+from walking_generator.solvers import make_solver, ADMMSolver, ActiveSetSolver
+from walking_generator.solvers import NullSpaceSolver
+from walking_generator.solvers import SUCCESSFUL_RETURN, RET_QP_INFEASIBLE
+
+#define global tolerance for unittests
+ATOL = 1e-06
+RTOL = 1e-06
+
+# toy example from qpOASES manual and its warm start
+H   = numpy.array([ 1.0, 0.0, 0.0, 0.5 ]).reshape((2,2))
+A   = numpy.array([ 1.0, 1.0 ]).reshape((1,2))
+g   = numpy.array([ 1.5, 1.0 ])
+lb  = numpy.array([ 0.5, -2.0 ])
+ub  = numpy.array([ 5.0, 2.0 ])
+lbA = numpy.array([ -1.0 ])
+ubA = numpy.array([ 2.0 ])
+
+H_new   = numpy.array([ 1.0, 0.5, 0.5, 0.5 ]).reshape((2,2))
+A_new   = numpy.array([ 1.0, 5.0 ]).reshape((1,2))
+g_new   = numpy.array([ 1.0, 1.5 ])
+lb_new  = numpy.array([ 0.0, -1.0 ])
+ub_new  = numpy.array([ 5.0, -0.5 ])
+lbA_new = numpy.array([ -2.0 ])
+ubA_new = numpy.array([ 1.0 ])
+
+class TestSolvers(TestCase):
+    """
+    Test QP solver backends on toy examples
+    """
+
+    def check_backend(self, qp):
+        x = numpy.zeros((2,))
+        y = numpy.zeros((3,))
+
+        ret, nwsr, cputime = qp.solve(H, g, A, lb, ub, lbA, ubA, 100, 0)
+        assert_equal(ret, SUCCESSFUL_RETURN)
+        assert_(qp.is_initialized)
+
+        qp.get_primal_solution(x)
+        qp.get_dual_solution(y)
+        assert_allclose(x, [0.5, -1.5], rtol=RTOL, atol=ATOL)
+        assert_allclose(qp.get_objective_value(), -6.25e-02, rtol=RTOL, atol=ATOL)
+
+        # lower bound of x_0 and lower bound of A*x are active, i.e. positive
+        # multipliers fulfilling stationarity H*x + g = C^T * y
+        C = numpy.vstack((numpy.eye(2), A))
+        assert_allclose(H.dot(x) + g, C.transpose().dot(y), rtol=RTOL, atol=ATOL)
+        assert_(y[0] > 0.0)
+        assert_(y[2] > 0.0)
+        assert_allclose(y[1], 0.0, rtol=RTOL, atol=ATOL)
+
+        # warm start
+        ret, nwsr, cputime = qp.solve(
+            H_new, g_new, A_new, lb_new, ub_new, lbA_new, ubA_new, 100, 0
+        )
+        assert_equal(ret, SUCCESSFUL_RETURN)
+        qp.get_primal_solution(x)
+        assert_allclose(x, [0.5, -0.5], rtol=RTOL, atol=ATOL)
+        assert_allclose(qp.get_objective_value(), -1.875e-01, rtol=RTOL, atol=ATOL)
+
+        qp.reset()
+        assert_(not qp.is_initialized)
+
+    def test_admm_backend(self):
+        self.check_backend(make_solver('admm', 2, 1))
+
+    def test_activeset_backend(self):
+        self.check_backend(make_solver('activeset', 2, 1))
+
+    def test_qpoases_backend(self):
+        if solvers.qpoases is None:
+            assert_raises(ImportError, make_solver, 'qpoases', 2, 1)
+        else:
+            self.check_backend(make_solver('qpoases', 2, 1))
+
+    def test_admm_warm_start(self):
+        # random strictly convex QP with box and general constraints
+        numpy.random.seed(0)
+        nv = 20; nc = 30
+        M = numpy.random.randn(nv, nv)
+        H = M.transpose().dot(M) + numpy.eye(nv)
+        g = numpy.random.randn(nv)
+        A = numpy.random.randn(nc, nv)
+        lb  = -numpy.ones((nv,))
+        ub  =  numpy.ones((nv,))
+        lbA = -numpy.ones((nc,))*1e+08
+        ubA =  numpy.ones((nc,))*0.5
+
+        qp = ADMMSolver(nv, nc, polish=False)
+        ret, cold, cputime = qp.solve(H, g, A, lb, ub, lbA, ubA, 100, 0)
+        assert_equal(ret, SUCCESSFUL_RETURN)
+        x = numpy.zeros((nv,))
+        qp.get_primal_solution(x)
+        assert_((A.dot(x) <= ubA + 1e-04).all())
+
+        # slightly perturbed problem converges faster from last solution
+        ret, warm, cputime = qp.solve(H, g + 1e-03, A, lb, ub, lbA, ubA, 100, 0)
+        assert_equal(ret, SUCCESSFUL_RETURN)
+        assert_(warm < cold)
+
+    def test_activeset_warm_start(self):
+        # random QP with two identical diagonal blocks like the position QP
+        numpy.random.seed(0)
+        nh = 10; nv = 2*nh; nc = 30
+        M = numpy.random.randn(nh, nh)
+        H = numpy.zeros((nv, nv))
+        H[:nh,:nh] = M.transpose().dot(M) + numpy.eye(nh)
+        H[nh:,nh:] = H[:nh,:nh]
+        g = numpy.random.randn(nv)
+        A = numpy.random.randn(nc, nv)
+        lb  = -numpy.ones((nv,))
+        ub  =  numpy.ones((nv,))
+        lbA = -numpy.ones((nc,))*1e+08
+        ubA =  numpy.ones((nc,))*0.5
+        # equality constraints
+        lbA[:2] = ubA[:2] = 0.1
+
+        qp = ActiveSetSolver(nv, nc)
+        ret, cold, cputime = qp.solve(H, g, A, lb, ub, lbA, ubA, 100, 0)
+        assert_equal(ret, SUCCESSFUL_RETURN)
+        assert_equal(qp.qp._blocks, 2)
+
+        # KKT conditions
+        x = numpy.zeros((nv,))
+        y = numpy.zeros((nv+nc,))
+        qp.get_primal_solution(x)
+        qp.get_dual_solution(y)
+        C = numpy.vstack((numpy.eye(nv), A))
+        Cx = C.dot(x)
+        l = numpy.hstack((lb, lbA))
+        u = numpy.hstack((ub, ubA))
+        assert_((Cx >= l - ATOL).all() and (Cx <= u + ATOL).all())
+        assert_allclose(H.dot(x) + g, C.transpose().dot(y), rtol=RTOL, atol=ATOL)
+        assert_allclose(y*numpy.where(y > 0.0, Cx - l, u - Cx), 0.0, atol=ATOL)
+
+        # same problem is solved without working set changes
+        ret, warm, cputime = qp.solve(H, g, A, lb, ub, lbA, ubA, 100, 0)
+        assert_equal(ret, SUCCESSFUL_RETURN)
+        assert_equal(warm, 0)
+        assert_(cold > 0)
+
+        # working set recalculations are bounded by nwsr
+        qp.reset()
+        ret, nwsr, cputime = qp.solve(H, g, A, lb, ub, lbA, ubA, 1, 0)
+        assert_equal(ret, solvers.RET_MAX_NWSR_REACHED)
+
+    def test_nullspace_elimination(self):
+        # random QP with variable fixing and general equality constraints
+        numpy.random.seed(1)
+        nv = 20; nc = 30
+        M = numpy.random.randn(nv, nv)
+        H = M.transpose().dot(M) + numpy.eye(nv)
+        g = numpy.random.randn(nv)
+        A = numpy.random.randn(nc, nv)
+        lb  = -numpy.ones((nv,))*1e+08
+        ub  =  numpy.ones((nv,))*1e+08
+        lb[:2] = -1.0
+        ub[:2] =  1.0
+        lbA = -numpy.ones((nc,))*1e+08
+        ubA =  numpy.ones((nc,))*0.5
+        A[0] = 0.0; A[0,5] = 1.0
+        lbA[:3] = ubA[:3] = 0.1
+        A[3] = 0.0
+
+        full = make_solver('activeset', nv, nc)
+        ret, nwsr, cputime = full.solve(H, g, A, lb, ub, lbA, ubA, 100, 0)
+        assert_equal(ret, SUCCESSFUL_RETURN)
+        x_ref = numpy.zeros((nv,))
+        full.get_primal_solution(x_ref)
+
+        qp = make_solver('activeset', nv, nc, eliminate_equalities=True)
+        assert_(isinstance(qp, NullSpaceSolver))
+        ret, nwsr, cputime = qp.solve(H, g, A, lb, ub, lbA, ubA, 100, 0)
+        assert_equal(ret, SUCCESSFUL_RETURN)
+
+        # smaller QP without equalities
+        assert_equal(qp.qp.nv, nv - 3)
+        assert_(qp.qp.nc < nc)
+
+        # recovered primal and dual solution
+        x = numpy.zeros((nv,))
+        y = numpy.zeros((nv+nc,))
+        qp.get_primal_solution(x)
+        qp.get_dual_solution(y)
+        assert_allclose(x, x_ref, rtol=RTOL, atol=ATOL)
+        assert_allclose(qp.get_objective_value(), full.get_objective_value(), rtol=RTOL, atol=ATOL)
+        assert_allclose(A[:3].dot(x), lbA[:3], rtol=RTOL, atol=ATOL)
+        C = numpy.vstack((numpy.eye(nv), A))
+        assert_allclose(H.dot(x) + g, C.transpose().dot(y), rtol=RTOL, atol=ATOL)
+
+    def test_nullspace_degenerate_problems(self):
+        H = numpy.eye(3)
+        g = numpy.array([1.0, -1.0, 0.5])
+        lb = -numpy.ones((3,))*1e+08
+        ub =  numpy.ones((3,))*1e+08
+        x = numpy.zeros((3,))
+
+        # no linear constraints
+        qp = make_solver('activeset', 3, 0, eliminate_equalities=True)
+        ret, nwsr, cputime = qp.solve(H, g, numpy.zeros((0,3)), lb, ub,
+            numpy.zeros((0,)), numpy.zeros((0,)), 100, 0)
+        assert_equal(ret, SUCCESSFUL_RETURN)
+        qp.get_primal_solution(x)
+        assert_allclose(x, -g, rtol=RTOL, atol=ATOL)
+
+        # equalities fix all variables, inequality only depends on them
+        A   = numpy.vstack((numpy.eye(3), [1.0, 1.0, 0.0]))
+        lbA = numpy.array([1.0, 2.0, 3.0, -1e+08])
+        ubA = numpy.array([1.0, 2.0, 3.0,  4.0])
+        qp = make_solver('activeset', 3, 4, eliminate_equalities=True)
+        ret, nwsr, cputime = qp.solve(H, g, A, lb, ub, lbA, ubA, 100, 0)
+        assert_equal(ret, SUCCESSFUL_RETURN)
+        qp.get_primal_solution(x)
+        assert_allclose(x, [1.0, 2.0, 3.0], rtol=RTOL, atol=ATOL)
+
+        # violated inequality resp. bound of eliminated variables
+        ubA[3] = 2.5
+        ret, nwsr, cputime = qp.solve(H, g, A, lb, ub, lbA, ubA, 100, 0)
+        assert_equal(ret, RET_QP_INFEASIBLE)
+
+        ubA[3] = 4.0
+        ub[2] = 2.0
+        ret, nwsr, cputime = qp.solve(H, g, A, lb, ub, lbA, ubA, 100, 0)
+        assert_equal(ret, RET_QP_INFEASIBLE)
+
+        # violated bound of eliminated variable with x_2 remaining free
+        lbA[:3] = ubA[:3] = [1.0, 2.0, 0.0]
+        A[2] = 0.0; A[2,0] = 1.0; lbA[2] = ubA[2] = 1.0
+        ub[2] = 1e+08
+        lb[1] = 2.5
+        ret, nwsr, cputime = qp.solve(H, g, A, lb, ub, lbA, ubA, 100, 0)
+        assert_equal(ret, RET_QP_INFEASIBLE)
+
+        # inconsistent equalities
+        lb[1] = -1e+08
+        lbA[2] = ubA[2] = 0.0
+        ret, nwsr, cputime = qp.solve(H, g, A, lb, ub, lbA, ubA, 100, 0)
+        assert_equal(ret, RET_QP_INFEASIBLE)
+
+    def test_make_solver(self):
+        assert_raises(KeyError, make_solver, 'unknown', 2, 1)
+        assert_raises(KeyError, make_solver, 'unknown', 2, 1, eliminate_equalities=True)
+        assert_(isinstance(make_solver('admm', 2, 1), ADMMSolver))
+        assert_(isinstance(make_solver('activeset', 2, 1), ActiveSetSolver))
+        assert_(solvers.default_solver() in solvers.SOLVERS)
+
+
+if __name__ == '__main__':
+    try:
+        import nose
+        nose.runmodule()
+    except ImportError:
+        err_str = 'nose needed for unittests.\nPlease install using:\n   sudo pip install nose'
+        raise ImportError(err_str)
@@ -0,0 +1,133 @@
+import os
+import tempfile
+import numpy
+numpy.set_printoptions(threshold=numpy.nan, linewidth =numpy.nan)
+from numpy.testing import *
+
+from walking_generator import sweep
+from walking_generator.sweep import parameter_grid, run, run_sweep, load_results
+from walking_generator.sweep import STANDALONE_SCHEDULE, METRIC_KEYS
+from walking_generator.sweep import DEFAULT_INITIAL_STATE
+
+#define global tolerance for unittests
+ATOL = 1e-07
+RTOL = 1e-07
+
+# metrics depending on the machine load
+TIMING_KEYS = ('mean_qp_time', 'max_qp_time', 'tick_time')
+
+class TestSweep(TestCase):
+    """
+    Test parameter sweeps of closed-loop simulations
+    """
+    schedules = {'default': STANDALONE_SCHEDULE}
+
+    def test_parameter_grid(self):
+        grid = parameter_grid(a=[1.0, 0.1], N=[16, 20, 24])
+        assert_equal(len(grid), 6)
+        assert_equal(grid[0], {'a': 1.0, 'N': 16})
+        assert_equal(grid[-1], {'a': 0.1, 'N': 24})
+
+    def test_reused_generator(self):
+        params = {'a': 0.5, 'SecurityMarginX': 0.09, 'SecurityMarginY': 0.05}
+        sweep._GENERATORS.clear()
+        fresh = run(params, self.schedules, 20)
+
+        # run with other parameters and CoM height, then repeat on reset
+        # generator
+        lower = DEFAULT_INITIAL_STATE[:2] + (0.7,) + DEFAULT_INITIAL_STATE[3:]
+        run({'a': 2.0, 'd': 1e-04}, self.schedules, 15, lower)
+        reused = run(params, self.schedules, 20)
+        assert_equal(len(sweep._GENERATORS), 1)
+
+        assert_equal(fresh['failed'], 0)
+        assert_equal(fresh['ticks'], 20)
+        assert_(fresh['max_cop_violation'] < ATOL)
+        for key in METRIC_KEYS:
+            if key not in TIMING_KEYS:
+                assert_allclose(reused[key], fresh[key], rtol=RTOL, atol=ATOL)
+
+    def test_run_sweep(self):
+        grid = parameter_grid(
+            generator=['nmpc', 'classic'], SecurityMarginX=[0.04, 0.09]
+        )
+        fd, filename = tempfile.mkstemp(suffix='.npy')
+        os.close(fd)
+        try:
+            failed = run_sweep(grid, STANDALONE_SCHEDULE, 10, filename, processes=2)
+            assert_equal(failed, 0)
+            results = numpy.array(load_results(filename))
+        finally:
+            os.remove(filename)
+
+        # one record per run with fields of parameters and metrics
+        assert_equal(results['run'], range(len(grid)))
+        assert_equal(list(results['generator']), [p['generator'] for p in grid])
+        assert_allclose(results['SecurityMarginX'], [p['SecurityMarginX'] for p in grid])
+        assert_equal(results['ticks'], 10)
+
+        # same metrics as in calling process
+        for n, params in enumerate(grid):
+            metrics = run(params, {'default': STANDALONE_SCHEDULE}, 10)
+            for key in METRIC_KEYS:
+                if key not in TIMING_KEYS:
+                    assert_allclose(results[key][n], metrics[key], rtol=RTOL, atol=ATOL)
+
+    def test_aborted_sweep(self):
+        grid = parameter_grid(SecurityMarginX=[0.04, 0.06, 0.09])
+        fd, filename = tempfile.mkstemp(suffix='.npy')
+        os.close(fd)
+
+        # abort sweep in the third run
+        run_task = sweep._run_task
+        def aborting_task(task):
+            if task[0] == 2:
+                raise KeyboardInterrupt
+            return run_task(task)
+        sweep._run_task = aborting_task
+        try:
+            assert_raises(KeyboardInterrupt,
+                run_sweep, grid, STANDALONE_SCHEDULE, 5, filename, processes=0
+            )
+            results = numpy.array(load_results(filename))
+        finally:
+            sweep._run_task = run_task
+            os.remove(filename)
+
+        # finished runs were written before the abort
+        assert_equal(results['run'], [0, 1])
+        assert_allclose(results['SecurityMarginX'], [0.04, 0.06])
+        assert_equal(results['ticks'], 5)
+
+    def test_cop_violation(self):
+        gen = sweep._new_generator(dict(sweep.DEFAULT_PARAMETERS))
+        gen.set_security_margin(0.09, 0.05)
+        gen.set_initial_values(*DEFAULT_INITIAL_STATE)
+        gen.set_velocity_reference([0.2, 0.0, 0.2])
+        gen.solve()
+        gen.simulate()
+
+        # generator is not modified
+        state = dict(
+            (key, val.copy()) for key, val in gen.__dict__.items()
+            if isinstance(val, numpy.ndarray)
+        )
+        violation = sweep._cop_violation(gen)
+        for key, val in state.items():
+            assert_equal(getattr(gen, key), val)
+
+        # first rows of rebuilt constraints
+        gen.buildConstraints()
+        U_k = numpy.hstack((gen.dddC_k_x, gen.F_k_x, gen.dddC_k_y, gen.F_k_y))
+        nEdges = gen.nFootEdge
+        Acop_U = gen.Acop[:nEdges].dot(U_k)
+        assert_allclose(violation, numpy.max(Acop_U - gen.ubBcop[:nEdges]), rtol=RTOL, atol=ATOL)
+
+
+if __name__ == '__main__':
+    try:
+        import nose
+        nose.runmodule()
+    except ImportError:
+        err_str = 'nose needed for unittests.\nPlease install using:\n   sudo pip install nose'
+        raise ImportError(err_str)
@@ -0,0 +1,87 @@
+import os
+import json
+import tempfile
+import numpy
+numpy.set_printoptions(threshold=numpy.nan, linewidth =numpy.nan)
+from numpy.testing import *
+
+from walking_generator.datalog import DataLog, load_npz
+from walking_generator.visualization import Plotter
+from walking_generator.combinedqp import NMPCGenerator
+
+class TestDataLog(TestCase):
+    """
+    Test columnar logging of generator data
+    """
+
+    def test_growth(self):
+        log = DataLog(('x', 's', 'e'), capacity=2)
+        for i in range(5):
+            log.append('x', [i, 2*i])
+        log.append('s', 'D')
+        log.append('s', 'L/R')
+
+        assert_equal(log['x'], [[0,0],[1,2],[2,4],[3,6],[4,8]])
+        assert_equal(log['s'], ['D', 'L/R'])
+        assert_equal(log['e'].shape, (0,))
+        assert_raises(ValueError, log.append, 'x', [1, 2, 3])
+
+        # buffers are kept
+        log.clear()
+        assert_equal(log['x'].shape, (0, 2))
+        log.append('x', [1, 1])
+        assert_equal(log['x'], [[1, 1]])
+
+    def test_save_and_load(self):
+        gen = NMPCGenerator(fsm_state='L/R')
+        gen.set_security_margin(0.09, 0.05)
+        gen.set_initial_values(
+            [0.00949035, 0.0, 0.0], [0.095, 0.0, 0.0], 0.814,
+            0.00949035, 0.095, 0.0, foot='left'
+        )
+        for i in range(12):
+            gen.set_velocity_reference([0.2, 0.0, 0.2])
+            gen.solve()
+            gen.simulate()
+            gen.set_initial_values(*gen.update())
+
+        data = gen.data.data
+        assert_equal(data['c_k_x'].shape, (12, 3))
+        assert_equal(data['C_kp1_x'].shape, (12, gen.N))
+
+        fd, npz_file = tempfile.mkstemp(suffix='.npz')
+        os.close(fd)
+        fd, json_file = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        try:
+            gen.data.save_to_file(npz_file)
+            gen.data.save_to_file(json_file)
+
+            # arrays are memory mapped
+            loaded = load_npz(npz_file)
+            assert_(isinstance(loaded['C_kp1_x'], numpy.memmap))
+            assert_equal(sorted(loaded), sorted(data.keys()))
+            for key in data:
+                assert_equal(loaded[key], data[key])
+
+            # json export holds the same data
+            with open(json_file, 'r') as f:
+                exported = json.load(f)
+            for key in data:
+                assert_equal(exported[key], data[key].tolist())
+
+            plotter = Plotter.__new__(Plotter)
+            plotter.load_from_file(npz_file)
+            assert_equal(plotter.data['time'], data['time'])
+        finally:
+            os.remove(npz_file)
+            os.remove(json_file)
+
+
+if __name__ == '__main__':
+    try:
+        import nose
+        nose.runmodule()
+    except ImportError:
+        err_str = 'nose needed for unittests.\nPlease install using:\n   sudo pip install nose'
+        raise ImportError(err_str)
@@ -0,0 +1,381 @@
+import time
+import numpy
+from scipy.linalg import solve_triangular
+
+# status of DualActiveSet.solve()
+SUCCESS    = 0
+MAX_NWSR   = 1
+INFEASIBLE = 2
+
+class DualActiveSet(object):
+    """
+    Dense dual active set method of Goldfarb and Idnani for QPs of the form
+
+    min_x 1/2 * x^T * H * x + x^T g
+    s.t.   l <= C * x <= u
+
+    tuned for the walking QPs:
+
+    * H is factorized once as H = L * L^T and the factorization is reused as
+      long as H does not change, which is the case within a gait phase.
+      When H consists of two identical diagonal blocks, like the position
+      QP of the ClassicGenerator with Q_k for x and y, only one block is
+      factorized.
+
+    * The method works in the transformed space v = L^-1 * c of the
+      constraint normals. The Schur complement M = V^T * V of the active
+      constraints is kept as Cholesky factor M = R^T * R, which is updated
+      by appending a column when a constraint enters and by Givens
+      rotations when a constraint leaves the active set.
+
+    * The active set of the last solution is used as starting point of the
+      next one, constraints with negative multipliers are dropped until the
+      start is dual feasible, cf. qpOASES hotstart.
+
+    Semi-definite H are augmented on the equality constraints, cf.
+    factorize(), and regularized by reg * max(diag(H)) * I as last resort.
+    """
+
+    # bounds beyond are treated as infinite
+    INFTY = 1e+07
+
+    def __init__(self, nv, reg=1e-09, eps_feas=1e-10, eps_dep=1e-12):
+        """
+        Parameters
+        ----------
+
+        nv: int
+            number of variables
+
+        reg: float
+            relative regularization of semi-definite Hessians
+
+        eps_feas: float
+            tolerance of constraint violation relative to the row norm
+
+        eps_dep: float
+            relative tolerance for linear dependence of constraints
+        """
+        self.nv = nv
+        self.reg = reg
+        self.eps_feas = eps_feas
+        self.eps_dep = eps_dep
+
+        # factorization of the Hessian, cf. factorize()
+        self._H = None
+        self._Ceq = None
+        self._rho = 0.0
+        self._Linv = None
+        self._blocks = 1
+
+        # active set: transformed normals V, Cholesky factor R of V^T * V,
+        # constraint rows, sides (+1 lower, -1 upper), equality flags and
+        # multipliers
+        self._V = numpy.zeros((nv, nv), dtype=float)
+        self._R = numpy.zeros((nv, nv), dtype=float)
+        self._k = 0
+        self._rows = []
+        self._sides = []
+        self._eq = []
+        self._lam = []
+
+        self.nwsr = 0
+
+    def factorize(self, H, Ceq):
+        """
+        factorize H, reused when called with equal H and equalities again.
+        Hessians which are only definite on the null space of the equality
+        constraints Ceq * x = beq, e.g. the orientation QP fixing the swing
+        foot, are augmented by rho * Ceq^T * Ceq. Together with the gradient
+        term -rho * Ceq^T * beq the augmentation vanishes on the feasible
+        set and keeps solution and multipliers.
+        """
+        if self._H is not None and numpy.array_equal(H, self._H) \
+        and numpy.array_equal(Ceq, self._Ceq):
+            return
+        self._H = H.copy()
+        self._Ceq = Ceq.copy()
+        self._rho = 0.0
+
+        d = numpy.abs(H.diagonal()).max()
+        try:
+            self._factorize_blocks(H)
+            return
+        except numpy.linalg.LinAlgError:
+            pass
+
+        if Ceq.shape[0]:
+            self._rho = d / (Ceq*Ceq).sum(axis=1).max()
+            H = H + self._rho * Ceq.transpose().dot(Ceq)
+            try:
+                self._factorize_blocks(H)
+                return
+            except numpy.linalg.LinAlgError:
+                pass
+
+        self._factorize_blocks(H + self.reg * max(d, 1.0) * numpy.eye(self.nv), check=False)
+
+    def _factorize_blocks(self, H, check=True):
+        """ factorize H exploiting two identical diagonal blocks """
+        n = self.nv
+        h = n // 2
+        if n % 2 == 0 and not H[:h,h:].any() and not H[h:,:h].any() \
+        and numpy.array_equal(H[:h,:h], H[h:,h:]):
+            Lb = self._cholesky(H[:h,:h], check)
+            self._blocks = 2
+            self._Linv = numpy.zeros((n, n), dtype=float)
+            self._Linv[:h,:h] = Lb
+            self._Linv[h:,h:] = Lb
+        else:
+            self._Linv = self._cholesky(H, check)
+            self._blocks = 1
+
+    def _cholesky(self, H, check=True):
+        """ inverse of lower Cholesky factor of H """
+        L = numpy.linalg.cholesky(H)
+        if check and L.diagonal().min()**2 < self.reg * numpy.abs(H.diagonal()).max():
+            raise numpy.linalg.LinAlgError('Hessian is not positive definite')
+        return solve_triangular(L, numpy.eye(H.shape[0]), lower=True)
+
+    def _transform(self, C):
+        """ return W = L^-1 * C^T exploiting block structure of L """
+        Linv = self._Linv
+        if self._blocks == 2:
+            h = self.nv // 2
+            W = numpy.empty((self.nv, C.shape[0]), dtype=float)
+            W[:h] = Linv[:h,:h].dot(C[:,:h].transpose())
+            W[h:] = Linv[:h,:h].dot(C[:,h:].transpose())
+            return W
+        return Linv.dot(C.transpose())
+
+    def _append(self, v):
+        """ append column v to Cholesky factor, False when dependent """
+        k = self._k
+        if k == self.nv:
+            return False
+
+        V = self._V
+        R = self._R
+        a = solve_triangular(R[:k,:k], V[:,:k].transpose().dot(v), trans='T') \
+            if k else numpy.zeros((0,))
+        rho2 = v.dot(v) - a.dot(a)
+        if rho2 <= self.eps_dep * v.dot(v):
+            return False
+
+        V[:,k] = v
+        R[:k,k] = a
+        R[k,:k] = 0.0
+        R[k,k]  = numpy.sqrt(rho2)
+        self._k = k + 1
+        return True
+
+    def _remove(self, i):
+        """ remove i-th active constraint and restore triangular R """
+        k = self._k
+        V = self._V
+        R = self._R
+
+        V[:,i:k-1] = V[:,i+1:k]
+        R[:k,i:k-1] = R[:k,i+1:k]
+
+        # R is upper Hessenberg from column i on, rotate subdiagonal away
+        for j in range(i, k-1):
+            a = R[j,j]; b = R[j+1,j]
+            r = numpy.hypot(a, b)
+            c = a / r; s = b / r
+            Rj  = R[j,  j:k-1].copy()
+            Rj1 = R[j+1,j:k-1]
+            R[j,  j:k-1] =  c*Rj + s*Rj1
+            R[j+1,j:k-1] = -s*Rj + c*Rj1
+            R[j+1,j] = 0.0
+
+        self._k = k - 1
+        for lst in (self._rows, self._sides, self._eq, self._lam):
+            del lst[i]
+
+    def _solve_M(self, b):
+        """ return M^-1 * b with M = R^T * R """
+        k = self._k
+        R = self._R[:k,:k]
+        return solve_triangular(R, solve_triangular(R, b, trans='T'))
+
+    def remap(self, row_map):
+        """
+        move active set to rows row_map[row], rows mapped to -1 are dropped.
+        The factorization is rebuilt by the next solve.
+        """
+        rows = []; sides = []
+        for row, side in zip(self._rows, self._sides):
+            if row_map[row] >= 0:
+                rows.append(row_map[row])
+                sides.append(side)
+        self.reset()
+        self._rows = rows
+        self._sides = sides
+
+    def reset(self):
+        """ clear active set """
+        self._k = 0
+        self._rows = []
+        self._sides = []
+        self._eq = []
+        self._lam = []
+
+    def solve(self, H, g, C, l, u, max_nwsr, cpu_time=0.0):
+        """
+        solve QP starting from the current active set
+
+        Returns
+        -------
+
+        status: int
+            SUCCESS, MAX_NWSR or INFEASIBLE
+        x: numpy.ndarray((nv,))
+            primal solution
+        y: numpy.ndarray((m,))
+            multipliers of the rows of C, positive for active lower bounds
+        """
+        t0 = time.time()
+        self.nwsr = 0
+
+        row_norms = numpy.sqrt((C*C).sum(axis=1))
+        tol = self.eps_feas * row_norms + 1e-300
+
+        # rows without coefficients can not become active
+        has_l = (l > -self.INFTY) & (row_norms > 0.0)
+        has_u = (u <  self.INFTY) & (row_norms > 0.0)
+        is_eq = ((u - l) <= tol) & (row_norms > 0.0)
+
+        Ceq = C[is_eq]
+        self.factorize(H, Ceq)
+        if self._rho:
+            g = g - self._rho * Ceq.transpose().dot(l[is_eq])
+
+        Linv = self._Linv
+        W = self._transform(C)
+
+        # unconstrained minimizer x0 = -H^-1 * g, x = x0 + L^-T * w
+        x0 = -Linv.transpose().dot(Linv.dot(g))
+        Cx0 = C.dot(x0)
+        norms = numpy.sqrt((W*W).sum(axis=0))
+        norms[norms == 0.0] = 1.0
+
+        # rebuild active set of last solution on new data
+        rows, sides = self._rows, self._sides
+        self.reset()
+        for row, side in zip(rows, sides):
+            if (side > 0 and not has_l[row]) or (side < 0 and not has_u[row]):
+                continue
+            if self._append(side * W[:,row]):
+                self._rows.append(row)
+                self._sides.append(side)
+                self._eq.append(is_eq[row])
+                self._lam.append(0.0)
+
+        # multipliers on active set, drop negative ones until dual feasible
+        while self._k:
+            rows = numpy.array(self._rows)
+            sides = numpy.array(self._sides)
+            b = numpy.where(sides > 0, l[rows], -u[rows]) - sides * Cx0[rows]
+            lam = self._solve_M(b)
+            self._lam = list(lam)
+            free = numpy.array(self._eq)
+            lam_ineq = numpy.where(free, 0.0, lam)
+            i = lam_ineq.argmin()
+            if lam_ineq[i] >= 0.0:
+                break
+            self._remove(i)
+            self.nwsr += 1
+
+        k = self._k
+        w = self._V[:,:k].dot(numpy.array(self._lam)) if k else numpy.zeros((self.nv,))
+
+        skip = numpy.zeros(has_l.shape, dtype=bool)
+        status = SUCCESS
+        while True:
+            # slacks of all constraint sides
+            Cx = Cx0 + W.transpose().dot(w)
+            sl = numpy.where(has_l, (Cx - l) / norms, numpy.inf)
+            su = numpy.where(has_u, (u - Cx) / norms, numpy.inf)
+
+            # active rows are fulfilled up to round-off
+            sl[self._rows] = numpy.inf
+            su[self._rows] = numpy.inf
+            sl[skip] = numpy.inf
+            su[skip] = numpy.inf
+
+            # most violated constraint enters
+            il = sl.argmin(); iu = su.argmin()
+            if sl[il] <= su[iu]:
+                row, side, viol = il, 1, sl[il]*norms[il]
+            else:
+                row, side, viol = iu, -1, su[iu]*norms[iu]
+            if viol >= -tol[row]:
+                break
+
+            if self.nwsr >= max_nwsr \
+            or (cpu_time and time.time() - t0 > cpu_time):
+                status = MAX_NWSR
+                break
+
+            v = side * W[:,row]
+            lam_p = 0.0
+            while True:
+                k = self._k
+                V = self._V[:,:k]
+                lam = numpy.array(self._lam)
+                if k:
+                    r = self._solve_M(V.transpose().dot(v))
+                    z = v - V.dot(r)
+                else:
+                    r = numpy.zeros((0,))
+                    z = v
+                zn = z.dot(z)
+
+                # dual step length, equalities have free multipliers
+                t1 = numpy.inf; i1 = -1
+                for i in range(k):
+                    if not self._eq[i] and r[i] > 0.0:
+                        ti = lam[i] / r[i]
+                        if ti < t1:
+                            t1 = ti; i1 = i
+
+                # primal step length
+                dependent = zn <= self.eps_dep * v.dot(v)
+                t2 = numpy.inf if dependent else -viol / zn
+
+                # violation of constraints depending on the active ones is
+                # round-off, when it is small, skip them instead of dual steps
+                if dependent and lam_p == 0.0 and viol >= -100.*tol[row]:
+                    skip[row] = True
+                    break
+
+                t = min(t1, t2)
+                if numpy.isinf(t):
+                    status = INFEASIBLE
+                    break
+
+                w = w + t*z
+                self._lam = list(lam - t*r)
+                lam_p += t
+                viol += t*zn
+
+                self.nwsr += 1
+                if t2 <= t1:
+                    if self._append(v):
+                        self._rows.append(row)
+                        self._sides.append(side)
+                        self._eq.append(is_eq[row])
+                        self._lam.append(lam_p)
+                    break
+                self._remove(i1)
+
+            if status != SUCCESS:
+                break
+
+        x = x0 + Linv.transpose().dot(w)
+        y = numpy.zeros((C.shape[0],), dtype=float)
+        for row, side, lam in zip(self._rows, self._sides, self._lam):
+            y[row] += side * lam
+
+        return status, x, y
@@ -2,10 +2,14 @@ import os, sys
 import numpy
 from math import cos, sin
 from copy import deepcopy
+from numpy.lib.stride_tricks import as_strided
 
 from helper import BaseTypeFoot, BaseTypeSupportFoot
 from helper import ZMPState, CoMState
-from visualization import PlotData
+from datalog import PlotData
+from constraints import CoPConstraint
+from cache import LRUCache, preview_matrices, MaskedGramCache
+from workspace import Workspace
 
 class BaseGenerator(object):
     """
@@ -224,6 +228,10 @@ class BaseGenerator(object):
         self.E_FR = self.E_F[:, :self.N]
         self.E_FL = self.E_F[:, self.N:]
 
+        # diagonals of E_FR, E_FL as boolean masks for row selection
+        self.E_FR_mask = numpy.zeros((self.N,), dtype=bool)
+        self.E_FL_mask = numpy.zeros((self.N,), dtype=bool)
+
         # foot angular velocity selection matrices objective
 
         self.E_F_bar  = numpy.zeros((self.N, 2*self.N), dtype=float)
@@ -239,18 +247,19 @@ class BaseGenerator(object):
         self.Z_kp1_y = numpy.zeros((N,), dtype=float)
 
         # transformation matrices
+        # NOTE read-only matrices shared between generators, cf.
+        #      _initialize_constant_matrices, _initialize_cop_matrices
+        self.Pps = None
+        self.Ppu = None
 
-        self.Pps = numpy.zeros((N,3), dtype=float)
-        self.Ppu = numpy.zeros((N,N), dtype=float)
-
-        self.Pvs = numpy.zeros((N,3), dtype=float)
-        self.Pvu = numpy.zeros((N,N), dtype=float)
+        self.Pvs = None
+        self.Pvu = None
 
-        self.Pas = numpy.zeros((N,3), dtype=float)
-        self.Pau = numpy.zeros((N,N), dtype=float)
+        self.Pas = None
+        self.Pau = None
 
-        self.Pzs = numpy.zeros((N,3), dtype=float)
-        self.Pzu = numpy.zeros((N,N), dtype=float)
+        self.Pzs = None
+        self.Pzu = None
 
         # convex hulls used to bound the free placement of the foot
         self.nFootPosHullEdges = 5
@@ -331,17 +340,6 @@ class BaseGenerator(object):
         self.A0dlf   = numpy.zeros((self.nFootEdge,2), dtype=float)
         self.ubB0dlf = numpy.zeros((self.nFootEdge,),  dtype=float)
 
-        # transformation matrix for the constraints in buildCoPconstraint()
-        # constant in variables but varying in time, because of V_kp1
-        # PzuV = ( PzuVx )
-        #        ( PzuVy )
-        #      = ( Pzu | -V_kp1 |   0 |      0 )
-        #        (   0 |      0 | Pzu | -V_kp1 )
-
-        self.PzuV  = numpy.zeros((2*self.N, 2*(self.N + self.nf)), dtype=float )
-        self.PzuVx = self.PzuV[:self.N,:]
-        self.PzuVy = self.PzuV[self.N:,:]
-
         # TODO tidy this up, because lots of redundant matrices
         # PzsC = ( PzsCx )
         #        ( PzsCy )
@@ -363,11 +361,21 @@ class BaseGenerator(object):
         self.D_kp1y = self.D_kp1[:,-N:] # view on big matrix
         self.b_kp1 = numpy.zeros( (self.nFootEdge*self.N,), dtype=float )
 
+        # views on the diagonal blocks of D_kp1x,y and b_kp1, i.e.
+        # D_kp1x_blocks[i,k] = D_kp1x[i*nFootEdge+k, i]
+        self.D_kp1x_blocks = diagonal_block_view(self.D_kp1x, self.nFootEdge)
+        self.D_kp1y_blocks = diagonal_block_view(self.D_kp1y, self.nFootEdge)
+        self.b_kp1_blocks  = self.b_kp1.reshape((self.N, self.nFootEdge))
+
         # Constraint matrices
+        # NOTE Acop = D_kp1 * PzuV is stored in block structure, where
+        # PzuV = ( Pzu | -V_kp1 |   0 |      0 )
+        #        (   0 |      0 | Pzu | -V_kp1 )
+        #      dense matrix is available as Acop property
         self.nc_cop = self.N*self.nFootEdge
-        self.Acop = numpy.zeros(
-            (self.nc_cop, 2*(self.N+self.nf)),
-             dtype=float
+        self.cop_constraint = CoPConstraint(
+            self.N, self.nf, self.nFootEdge,
+            dx=self.D_kp1x_blocks, dy=self.D_kp1y_blocks
         )
         self.lbBcop = -numpy.ones((self.nc_cop), dtype=float)*1e+08
         self.ubBcop =  numpy.zeros((self.nc_cop), dtype=float)
@@ -397,6 +405,11 @@ class BaseGenerator(object):
         self.supportDeque[0].ds = 1
         self.supportDeque[8].ds = 1
 
+        # array copy of support order for vectorized constraint assembly
+        # NOTE kept consistent with supportDeque by _calculate_support_order
+        self.supportStepNumbers = numpy.zeros((N,), dtype=int)
+        self.supportIsRight     = numpy.zeros((N,), dtype=bool)
+
         """
         NOTE number of foot steps in prediction horizon changes between
         nf and nf+1, because when robot takes first step nf steps are
@@ -405,6 +418,55 @@ class BaseGenerator(object):
         self.v_kp1 = numpy.zeros((N,),   dtype=int)
         self.V_kp1 = numpy.zeros((N,self.nf), dtype=int)
 
+        # NOTE set when the support foot changed with the last update, i.e.
+        #      the planned foot steps moved by one to the front
+        self._support_changed = False
+        self._f_km1_x = 0.0
+        self._f_km1_y = 0.0
+
+        # cache of QP matrices only depending on the gait phase, which repeats
+        # periodically during steady walking, cf. _gait_phase_matrices
+        # NOTE hits and misses are counted by the cache
+        self.gait_phase_cache = LRUCache(maxsize=4*int(self.T_step/self.T))
+
+        # preallocated work buffers for allocation free QP assembly
+        # NOTE derived generators add their buffers on construction
+        self.workspace = ws = Workspace()
+
+        # CoP constraints, cf. _calculate_cop_hull_systems
+        nf = self.nf
+        nE = self.nFootEdge
+        ws.allocate('cop_theta',     (nf+1,))
+        ws.allocate('cop_cos',       (nf+1,))
+        ws.allocate('cop_sin',       (nf+1,))
+        ws.allocate('cop_R',         (nf+1, 2, 2))
+        ws.allocate('cop_dR',        (nf+1, 2, 2))
+        ws.allocate('cop_R_samples', (N, 2, 2))
+        ws.allocate('cop_ds',        (N,), dtype=int)
+        ws.allocate('cop_hull',      (N,), dtype=int)
+        ws.allocate('cop_H',         (N, nE, 2))
+        ws.allocate('cop_A0',        (N, nE, 2))
+        ws.allocate('cop_B0',        (N, nE))
+        ws.allocate('cop_tmp',       (N, nE))
+        ws.allocate('cop_zx',        (N,))
+        ws.allocate('cop_zy',        (N,))
+
+        # foot position constraints, cf. _calculate_foot_hull_systems
+        nE = self.nFootPosHullEdges
+        ws.allocate('foot_R1',  (2, 2))
+        ws.allocate('foot_R2',  (2, 2))
+        ws.allocate('foot_A1',  (nE, 2))
+        ws.allocate('foot_A2',  (nE, 2))
+        ws.allocate('foot_A0x', (nf*nE, nf))
+        ws.allocate('foot_A0y', (nf*nE, nf))
+        ws.allocate('foot_B0',  (nf*nE,))
+        ws.allocate('foot_tmp', (nE,))
+
+        # foot rotation constraints
+        ws.allocate('rot_dfq',  (3,))
+        ws.allocate('rot_tmpR', (N,))
+        ws.allocate('rot_tmpL', (N,))
+
         # initialize all elementary problem matrices, e.g.
         # state transformation matrices, constraints, etc.
         self._initialize_constant_matrices()
@@ -412,6 +474,9 @@ class BaseGenerator(object):
         self._initialize_selection_matrix()
         self._initialize_convex_hull_systems()
 
+        # NOTE edge normals are zero until first call of buildCoPconstraint
+        self.cop_constraint.update(self.Pzu, self.V_kp1)
+
         self.data = PlotData(self)
 
     def _update_foot_selection_matrices(self):
@@ -423,6 +488,8 @@ class BaseGenerator(object):
 
         i = 0
         for j,supp in enumerate(self.supportDeque):
+            self.E_FR_mask[j] = supp.foot == 'left'
+            self.E_FL_mask[j] = supp.foot != 'left'
             if supp.foot == 'left':
                 self.E_FR    [i,j] = 1.0
                 self.E_FL    [i,j] = 0.0
@@ -441,45 +508,36 @@ class BaseGenerator(object):
         """
         Initializes the constant transformation matrices, e.g. Pps, Ppu, Pvs,
         Pvu, Pas, Pau.
+
+        .. NOTE: matrices are taken from the process wide preview matrix cache
+                 and are read-only.
         """
-        # renaming for convenience
-        T_step = self.T_step
-        T = self.T
-        N = self.N
-        nf = self.nf
+        M = preview_matrices(self.N, self.T, self.h_com, self.g)
 
-        for i in range(N):
-            j = i+1
-            self.Pps[i, :] = (1.,   j*T,           (j**2*T**2)/2.)
-            self.Pvs[i, :] = (0.,    1.,                      j*T)
-            self.Pas[i, :] = (0.,    0.,                       1.)
+        self.Pps = M.Pps
+        self.Ppu = M.Ppu
+
+        self.Pvs = M.Pvs
+        self.Pvu = M.Pvu
 
-            for j in range(N):
-                if j <= i:
-                    self.Ppu[i, j] = (3.*(i-j)**2 + 3.*(i-j) + 1.)*T**3/6.
-                    self.Pvu[i, j] = (2.*(i-j) + 1.)*T**2/2.
-                    self.Pau[i, j] = T
+        self.Pas = M.Pas
+        self.Pau = M.Pau
+
+        # Pvu^T * E^T * E * Pvu for diagonal foot selection matrices E
+        self.Pvu_gram = MaskedGramCache(self.Pvu)
 
     def _initialize_cop_matrices(self):
         """
         Initialize center of pressure matrices, which are dependent on current
         height of center of mass (self.h_com).
-        """
-        # renaming for convenience
-        T_step = self.T_step
-        T = self.T
-        N = self.N
-        nf = self.nf
-        h_com = self.h_com
-        g = self.g
 
-        for i in range(N):
-            j = i+1
-            self.Pzs[i, :] = (1.,   j*T, (j**2*T**2)/2. - h_com/g)
+        .. NOTE: matrices are taken from the process wide preview matrix cache
+                 and are read-only.
+        """
+        M = preview_matrices(self.N, self.T, self.h_com, self.g)
 
-            for j in range(N):
-                if j <= i:
-                    self.Pzu[i, j] = (3.*(i-j)**2 + 3.*(i-j) + 1.)*T**3/6. - T*h_com/g
+        self.Pzs = M.Pzs
+        self.Pzu = M.Pzu
 
     def _initialize_selection_matrix(self):
         """ Initialize selection vector and matrix. """
@@ -579,14 +637,19 @@ class BaseGenerator(object):
         # concatenate last entry
         self.V_kp1[-1, -1] = first_entry_v_kp1
 
+        self._support_changed = False
+
         # when first column of selection matrix becomes zero,
         # then shift columns by one to the front
         if (self.v_kp1 == 0).all():
+            self._support_changed = True
             self.v_kp1[:] = self.V_kp1[:,0]
             self.V_kp1[:,:-1] = self.V_kp1[:,1:]
             self.V_kp1[:,-1] = 0
 
-            # update support foot
+            # update support foot and keep last one, cf. _shift_controls
+            self._f_km1_x = self.f_k_x
+            self._f_km1_y = self.f_k_y
             self.f_k_x = self.F_k_x[0]
             self.f_k_y = self.F_k_y[0]
             self.f_k_q = self.F_k_q[0]
@@ -641,6 +704,16 @@ class BaseGenerator(object):
         self.ComputeLinearSystem(self.dscophull, "left",  self.A0dlf, self.ubB0dlf)
         self.ComputeLinearSystem(self.dscophull, "right", self.A0drf, self.ubB0drf)
 
+        # stacked CoP hull systems indexed by
+        # supportIsRight + 2 * double support, i.e.
+        # ( left, right, double support left, double support right )
+        self._cop_hulls_A = numpy.array(
+            (self.A0lf, self.A0rf, self.A0dlf, self.A0drf), dtype=float
+        )
+        self._cop_hulls_B = numpy.array(
+            (self.ubB0lf, self.ubB0rf, self.ubB0dlf, self.ubB0drf), dtype=float
+        )
+
     def ComputeLinearSystem(self, hull, foot, A0, B0 ):
         """
         automatically calculate linear constraints from polygon description
@@ -719,6 +792,11 @@ class BaseGenerator(object):
                 timeLimit = timeLimit + self.T_step
             self.supportDeque[i].timeLimit = timeLimit
 
+        # update array copy of support order
+        for i, supp in enumerate(self.supportDeque):
+            self.supportStepNumbers[i] = supp.stepNumber
+            self.supportIsRight[i]     = supp.foot != 'left'
+
     def set_security_margin(self, margin_x = 0.04, margin_y=0.04):
         """
         define security margins for constraints CoP constraints
@@ -919,6 +997,34 @@ class BaseGenerator(object):
     def _update_data(self):
         self.data.update()
 
+    def _shift_controls(self):
+        """
+        shift the solution on the horizon by one sampling period, s.t. it
+        continues the previous solution from the current time on, i.e. the
+        receding horizon shift after update(). The last jerks are repeated,
+        planned foot steps are shifted only when the support foot changed
+        with the last update. Then the new last step repeats the last
+        stride of the same foot.
+        """
+        for u in (self.dddC_k_x, self.dddC_k_y, self.dddF_k_qR, self.dddF_k_qL):
+            u[:-1] = u[1:]
+
+        if not self._support_changed:
+            return
+
+        # P = (f_km1, F_k) are the positions before the change, the new
+        # last step is P[-2] + (P[-1] - P[-3]), where P[-2] is the last
+        # position of the same foot and P[-1] - P[-3] the stride of the other
+        for F, f_km1 in (
+            (self.F_k_x, self._f_km1_x),
+            (self.F_k_y, self._f_km1_y),
+        ):
+            stride = F[-1] - (F[-3] if self.nf > 2 else f_km1)
+            last = F[-2] + stride if self.nf > 1 else F[-1]
+            F[:-1] = F[1:]
+            F[-1] = last
+        self.F_k_q[:-1] = self.F_k_q[1:]
+
     def simulate(self):
         """
         integrates model for given initial CoM states, jerks and feet positions
@@ -968,47 +1074,110 @@ class BaseGenerator(object):
 
         NOTE problems are assembled in the solver implementations
         """
-        self.buildCoPconstraint()
-        self.buildFootEqConstraint()
-        self.buildFootIneqConstraint()
-        self.buildFootRotationConstraints()
-        self.buildRotIneqConstraint()
+        caches = (self.gait_phase_cache, self.Pvu_gram.cache)
+        with self.workspace.check_allocations('buildConstraints', caches):
+            self.buildCoPconstraint()
+            self.buildFootEqConstraint()
+            self.buildFootIneqConstraint()
+            self.buildFootRotationConstraints()
+            self.buildRotIneqConstraint()
+
+    def _cop_rotation_stack(self, derivative=False):
+        """
+        stacked rotation matrices for the support foot orientations on the
+        horizon, i.e. R[j] = R(theta_j) with theta = (f_k_q, F_k_q)
+
+        Parameters
+        ----------
+
+        derivative: bool
+            if True the derivative of the rotation matrices with respect to
+            theta is returned instead.
+
+        .. NOTE: returns a work buffer, which is overwritten by next call
+        """
+        ws = self.workspace
+
+        theta = ws.cop_theta
+        theta[0]  = self.f_k_q
+        theta[1:] = self.F_k_q
+        c = numpy.cos(theta, out=ws.cop_cos)
+        s = numpy.sin(theta, out=ws.cop_sin)
+
+        if not derivative:
+            R = ws.cop_R
+            # R = ( cos(theta), sin(theta) )
+            #     (-sin(theta), cos(theta) )
+            R[:,0,0] =  c; R[:,0,1] = s
+            R[:,1,0] = -s; R[:,1,1] = c
+        else:
+            R = ws.cop_dR
+            # dR/dtheta = (-sin(theta), cos(theta) )
+            #             (-cos(theta),-sin(theta) )
+            R[:,0,0] = -s; R[:,0,1] =  c
+            R[:,1,0] = -c; R[:,1,1] = -s
+        return R
+
+    def _calculate_cop_hull_systems(self, derivative=False):
+        """
+        calculate the rotated CoP hull systems for all samples of the horizon
+        at once, i.e.
+
+        A0[i] = A0_hull(i) * R(theta_stepNumber(i)),  B0[i] = B0_hull(i)
+
+        where hull(i) is the left, right or double support hull of sample i.
+
+        Returns
+        -------
+
+        A0: numpy.ndarray((N, nFootEdge, 2))
+        B0: numpy.ndarray((N, nFootEdge))
+
+        .. NOTE: returns work buffers, which are overwritten by next call
+        """
+        ws = self.workspace
+
+        # rotation matrices of the sample's support foot
+        # NOTE mode='clip' avoids buffering of out, indices are always valid
+        R = numpy.take(
+            self._cop_rotation_stack(derivative), self.supportStepNumbers,
+            axis=0, out=ws.cop_R_samples, mode='clip'
+        )
+
+        # double support is used when sample belongs to a step in state 'D'
+        ds = ws.cop_ds
+        ds[...] = 0
+        for j in range(self.nf):
+            if self.fsm_states[j] == 'D':
+                numpy.add(ds, self.V_kp1[:,j], out=ds)
+
+        # hull = supportIsRight + 2*ds
+        hull = numpy.multiply(ds, 2, out=ws.cop_hull)
+        numpy.add(hull, self.supportIsRight, out=hull)
+
+        H  = numpy.take(self._cop_hulls_A, hull, axis=0, out=ws.cop_H, mode='clip')
+        B0 = numpy.take(self._cop_hulls_B, hull, axis=0, out=ws.cop_B0, mode='clip')
+
+        # A0 = H * R
+        A0  = ws.cop_A0
+        tmp = ws.cop_tmp
+        for c in range(2):
+            numpy.multiply(H[:,:,0], R[:,0,c,numpy.newaxis], out=A0[:,:,c])
+            numpy.multiply(H[:,:,1], R[:,1,c,numpy.newaxis], out=tmp)
+            numpy.add(A0[:,:,c], tmp, out=A0[:,:,c])
+
+        return A0, B0
 
     def _update_cop_constraint_transformation(self):
         """ update foot constraint transformation matrices. """
         # every time instant in the pattern generator constraints
         # depend on the support order
-        theta_vec = [self.f_k_q,self.F_k_q[0],self.F_k_q[1]]
-        for i in range(self.N):
-            theta = theta_vec[self.supportDeque[i].stepNumber]
-            rotMat = numpy.array([[cos(theta), sin(theta)],[-sin(theta), cos(theta)]])
-            if self.supportDeque[i].foot == "left" :
-                A0 = self.A0lf.dot(rotMat)
-                B0 = self.ubB0lf
-                D0 = self.A0dlf.dot(rotMat)
-                d0 = self.ubB0dlf
-            else :
-                A0 = self.A0rf.dot(rotMat)
-                B0 = self.ubB0rf
-                D0 = self.A0drf.dot(rotMat)
-                d0 = self.ubB0drf
-
-            # get support foot and check if it is double support
-            for j in range(self.nf):
-                if self.V_kp1[i,j] == 1:
-                    if self.fsm_states[j] == 'D':
-                        A0 = D0
-                        B0 = d0
-                else:
-                    pass
-
-            for k in range(self.nFootEdge):
-                # get d_i+1^x(f^theta)
-                self.D_kp1x[i*self.nFootEdge+k, i] = A0[k][0]
-                # get d_i+1^y(f^theta)
-                self.D_kp1y[i*self.nFootEdge+k, i] = A0[k][1]
-                # get right hand side of equation
-                self.b_kp1 [i*self.nFootEdge+k]    = B0[k]
+        A0, B0 = self._calculate_cop_hull_systems()
+
+        # get d_i+1^x(f^theta), d_i+1^y(f^theta) and right hand side
+        self.D_kp1x_blocks[...] = A0[:,:,0]
+        self.D_kp1y_blocks[...] = A0[:,:,1]
+        self.b_kp1_blocks [...] = B0
 
     def buildCoPconstraint(self):
         """
@@ -1019,10 +1188,6 @@ class BaseGenerator(object):
         self._update_cop_constraint_transformation()
 
         #rename for convenience
-        D_kp1 = self.D_kp1
-        PzuV  = self.PzuV
-        PzuVx = self.PzuVx
-        PzuVy = self.PzuVy
         PzsC  = self.PzsC
         PzsCx = self.PzsCx
         PzsCy = self.PzsCy
@@ -1030,33 +1195,35 @@ class BaseGenerator(object):
         v_kp1fc_x = self.v_kp1fc_x
         v_kp1fc_y = self.v_kp1fc_y
 
-        # build constraint transformation matrices
-        # PzuV = ( PzuVx )
-        #        ( PzuVy )
-
-        # PzuVx = ( Pzu | -V_kp1 |   0 |      0 )
-        PzuVx[:,      :self.N        ] =  self.Pzu # TODO this is constant in matrix and should go into the build up matrice part
-        PzuVx[:,self.N:self.N+self.nf] = -self.V_kp1
-
-        # PzuVy = (   0 |      0 | Pzu | -V_kp1 )
-        PzuVy[:,-self.N-self.nf:-self.nf] =  self.Pzu # TODO this is constant in matrix and should go into the build up matrice part
-        PzuVy[:,       -self.nf:       ] = -self.V_kp1
+        # build constraint transformation, i.e. Acop = D_kp1 * PzuV
+        # PzuV = ( PzuVx ) = ( Pzu | -V_kp1 |   0 |      0 )
+        #        ( PzuVy )   (   0 |      0 | Pzu | -V_kp1 )
+        # NOTE D_kp1 is block diagonal, so Acop is never formed explicitly
+        self.cop_constraint.update(self.Pzu, self.V_kp1)
 
-        # PzuV = ( PzsCx ) = ( Pzs * c_k_x)
+        # PzsC = ( PzsCx ) = ( Pzs * c_k_x)
         #        ( PzsCy )   ( Pzs * c_k_y)
-        PzsCx[...] = self.Pzs.dot(self.c_k_x) #+ self.v_kp1.dot(self.f_k_x)
-        PzsCy[...] = self.Pzs.dot(self.c_k_y) #+ self.v_kp1.dot(self.f_k_y)
+        numpy.dot(self.Pzs, self.c_k_x, out=PzsCx) #+ self.v_kp1.dot(self.f_k_x)
+        numpy.dot(self.Pzs, self.c_k_y, out=PzsCy) #+ self.v_kp1.dot(self.f_k_y)
 
         # v_kp1fc = ( v_kp1fc_x ) = ( v_kp1 * f_k_x)
         #           ( v_kp1fc_y )   ( v_kp1 * f_k_y)
-        v_kp1fc_x[...] = self.v_kp1.dot(self.f_k_x)
-        v_kp1fc_y[...] = self.v_kp1.dot(self.f_k_y)
+        numpy.multiply(self.v_kp1, self.f_k_x, out=v_kp1fc_x)
+        numpy.multiply(self.v_kp1, self.f_k_y, out=v_kp1fc_y)
 
         # build CoP linear constraints
+        # ubBcop = b_kp1 - D_kp1 * (PzsC - v_kp1fc)
         # NOTE D_kp1 is member and D_kp1 = ( D_kp1x | D_kp1y )
         #      D_kp1x,y contains entries from support polygon
-        self.Acop[...]   = D_kp1.dot(PzuV)
-        self.ubBcop[...] = self.b_kp1 - D_kp1.dot(PzsC) + D_kp1.dot(v_kp1fc)
+        zx = numpy.subtract(PzsCx, v_kp1fc_x, out=self.workspace.cop_zx)
+        zy = numpy.subtract(PzsCy, v_kp1fc_y, out=self.workspace.cop_zy)
+        self.cop_constraint.project(zx, zy, out=self.ubBcop)
+        numpy.subtract(self.b_kp1, self.ubBcop, out=self.ubBcop)
+
+    @property
+    def Acop(self):
+        """ dense CoP constraint matrix Acop = D_kp1 * PzuV """
+        return self.cop_constraint.dense()
 
     def buildFootEqConstraint(self):
         """
@@ -1090,49 +1257,100 @@ class BaseGenerator(object):
         # inequality constraint on both feet A u + B <= 0
         # A0 R(theta) [Fx_k+1 - Fx_k] <= ubB0
         #             [Fy_k+1 - Fy_k]
+        A0x, A0y, B0 = self._calculate_foot_hull_systems()
 
-        matSelec = numpy.array([ [1, 0],[-1, 1] ])
-        footSelec = numpy.array([ [self.f_k_x, 0],[self.f_k_y, 0] ])
-        theta_vec = [self.f_k_q,self.F_k_q[0]]
-
-        # rotation matrice from F_k+1 to F_k
-        rotMat1 = numpy.array([[cos(theta_vec[0]), sin(theta_vec[0])],[-sin(theta_vec[0]), cos(theta_vec[0])]])
-        rotMat2 = numpy.array([[cos(theta_vec[1]), sin(theta_vec[1])],[-sin(theta_vec[1]), cos(theta_vec[1])]])
+        # rename for convenience
+        N  = self.N
         nf = self.nf
-        nEdges = self.A0l.shape[0]
-        N = self.N
-        ncfoot = nf * nEdges
+
+        # Afoot = ( 0 | A0x | 0 | A0y )
+        self.Afoot[:,     :N     ] = 0.0
+        self.Afoot[:,    N:N+nf  ] = A0x
+        self.Afoot[:, N+nf:2*N+nf] = 0.0
+        self.Afoot[:,  -nf:      ] = A0y
+        self.ubBfoot[...] = B0
+
+    def _rotation_matrix(self, theta, out, derivative=False):
+        """
+        write rotation matrix R(theta) or its derivative into out
+
+        R = ( cos(theta), sin(theta) ),  dR/dtheta = (-sin(theta), cos(theta) )
+            (-sin(theta), cos(theta) )               (-cos(theta),-sin(theta) )
+        """
+        c = cos(theta)
+        s = sin(theta)
+        if not derivative:
+            out[0,0] =  c; out[0,1] = s
+            out[1,0] = -s; out[1,1] = c
+        else:
+            out[0,0] = -s; out[0,1] =  c
+            out[1,0] = -c; out[1,1] = -s
+        return out
+
+    def _calculate_foot_hull_systems(self, derivative=False):
+        """
+        calculate linear systems of the foot position hulls of the foot steps
+        on the horizon rotated into the frame of the preceding step, i.e.
+
+        A0x * F_k_x + A0y * F_k_y <= B0
+
+        Parameters
+        ----------
+
+        derivative: bool
+            if True the derivative of the rotation matrices with respect to
+            theta is used instead.
+
+        Returns
+        -------
+
+        A0x, A0y: numpy.ndarray((nf*nFootPosHullEdges, nf))
+        B0: numpy.ndarray((nf*nFootPosHullEdges,))
+
+        .. NOTE: returns work buffers, which are overwritten by next call
+        """
+        ws = self.workspace
+        nEdges = self.nFootPosHullEdges
+
+        # rotation matrices from F_k+1 to F_k
+        rotMat1 = self._rotation_matrix(self.f_k_q,    ws.foot_R1, derivative)
+        rotMat2 = self._rotation_matrix(self.F_k_q[0], ws.foot_R2, derivative)
 
         if self.currentSupport.foot == "left":
-            A_f1 = self.A0r.dot(rotMat1)
-            A_f2 = self.A0l.dot(rotMat2)
+            A_f1 = numpy.dot(self.A0r, rotMat1, out=ws.foot_A1)
+            A_f2 = numpy.dot(self.A0l, rotMat2, out=ws.foot_A2)
             B_f1 = self.ubB0r
             B_f2 = self.ubB0l
         else :
-            A_f1 = self.A0l.dot(rotMat1)
-            A_f2 = self.A0r.dot(rotMat2)
+            A_f1 = numpy.dot(self.A0l, rotMat1, out=ws.foot_A1)
+            A_f2 = numpy.dot(self.A0r, rotMat2, out=ws.foot_A2)
             B_f1 = self.ubB0l
             B_f2 = self.ubB0r
 
-        tmp1 = numpy.array( [A_f1[:,0],numpy.zeros((nEdges,),dtype=float)] )
-        tmp2 = numpy.array( [numpy.zeros((nEdges,),dtype=float),A_f2[:,0]] )
-        tmp3 = numpy.array( [A_f1[:,1],numpy.zeros((nEdges,),dtype=float)] )
-        tmp4 = numpy.array( [numpy.zeros(nEdges,),A_f2[:,1]] )
-
-        X_mat = numpy.concatenate( (tmp1.T,tmp2.T) , 0)
-        A0x = X_mat.dot(matSelec)
-        Y_mat = numpy.concatenate( (tmp3.T,tmp4.T) , 0)
-        A0y = Y_mat.dot(matSelec)
-
-        B0full = numpy.concatenate( (B_f1, B_f2) , 0 )
-        B0 = B0full + X_mat.dot(footSelec[0,:]) + Y_mat.dot(footSelec[1,:])
-
-        self.Afoot[...] = numpy.concatenate ((
-            numpy.zeros((ncfoot,N),dtype=float), A0x,
-            numpy.zeros((ncfoot,N),dtype=float), A0y
-            ), 1
-        )
-        self.ubBfoot[...] = B0
+        # A0x = X_mat * matSelec, A0y = Y_mat * matSelec, where
+        # X_mat = ( A_f1[:,0]         0 ), Y_mat = ( A_f1[:,1]         0 )
+        #         (         0 A_f2[:,0] )          (         0 A_f2[:,1] )
+        # matSelec = ( 1 0 )
+        #            (-1 1 )
+        A0x = ws.foot_A0x
+        A0y = ws.foot_A0y
+        for A0, c in ((A0x, 0), (A0y, 1)):
+            A0[:nEdges,0] = A_f1[:,c]
+            A0[:nEdges,1] = 0.0
+            numpy.negative(A_f2[:,c], out=A0[nEdges:,0])
+            A0[nEdges:,1] = A_f2[:,c]
+
+        # B0 = ( B_f1 ) + X_mat * ( f_k_x ) + Y_mat * ( f_k_y )
+        #      ( B_f2 )           (     0 )           (     0 )
+        B0  = ws.foot_B0
+        tmp = ws.foot_tmp
+        numpy.multiply(A_f1[:,0], self.f_k_x, out=tmp)
+        numpy.add(B_f1, tmp, out=B0[:nEdges])
+        numpy.multiply(A_f1[:,1], self.f_k_y, out=tmp)
+        numpy.add(B0[:nEdges], tmp, out=B0[:nEdges])
+        B0[nEdges:] = B_f2
+
+        return A0x, A0y, B0
 
     def buildFootRotationConstraints(self):
         """ constraints that freeze foot orientation for support leg """
@@ -1155,8 +1373,6 @@ class BaseGenerator(object):
         # ( - E_FL_bar * Pvs * f_k_qL)
 
         # rename for convenience
-        A_fvel_eq_R = self.A_fvel_eq[:, :self.N]
-        A_fvel_eq_L = self.A_fvel_eq[:, self.N:]
         B_fvel_eq   = self.B_fvel_eq
 
         # calculate proper selection matrices
@@ -1169,49 +1385,118 @@ class BaseGenerator(object):
         # B_fvel_eq =
         # ( - E_FR_bar * Pvs * f_k_qR)
         # ( - E_FL_bar * Pvs * f_k_qL)
-        A_fvel_eq_R[...] = self.E_FR_bar.dot(self.Pvu)
-        A_fvel_eq_L[...] = self.E_FL_bar.dot(self.Pvu)
-
-        B_fvel_eq[...]   = -self.E_FR_bar.dot(self.Pvs).dot(self.f_k_qR) \
-                           -self.E_FL_bar.dot(self.Pvs).dot(self.f_k_qL)
+        # NOTE A_fvel_eq only depends on the gait phase
+        self.A_fvel_eq[...] = self._gait_phase_matrices()['A_fvel_eq']
+
+        # NOTE E_FR_bar = diag(E_FL_mask) and E_FL_bar = diag(E_FR_mask)
+        ws = self.workspace
+        tmpR = numpy.dot(self.Pvs, self.f_k_qR, out=ws.rot_tmpR)
+        tmpL = numpy.dot(self.Pvs, self.f_k_qL, out=ws.rot_tmpL)
+        numpy.multiply(tmpR, self.E_FL_mask, out=tmpR)
+        numpy.multiply(tmpL, self.E_FR_mask, out=tmpL)
+        numpy.add(tmpR, tmpL, out=B_fvel_eq)
+        numpy.negative(B_fvel_eq, out=B_fvel_eq)
 
     def buildRotIneqConstraint(self):
         """ constraints on relative angular velocity """
         # rename for convenience
-        A_fpos_ineq   = self.A_fpos_ineq
-        A_fpos_ineq_R = A_fpos_ineq[:, :self.N]
-        A_fpos_ineq_L = A_fpos_ineq[:, self.N:]
         ubB_fpos_ineq = self.ubB_fpos_ineq
         lbB_fpos_ineq = self.lbB_fpos_ineq
 
-        A_fvel_ineq   = self.A_fvel_ineq
-        A_fvel_ineq_R = A_fvel_ineq[:, :self.N]
-        A_fvel_ineq_L = A_fvel_ineq[:, self.N:]
         ubB_fvel_ineq = self.ubB_fvel_ineq
         lbB_fvel_ineq = self.lbB_fvel_ineq
 
         # calculate proper selection matrices
         self._update_foot_selection_matrices()
+        phase = self._gait_phase_matrices()
 
         # build foot position constraints
         # || F_kp1_qR - F_kp1_qL ||_2^2 <= 0.09 ~ 5 degrees
         # <=>
         # -0.09 <= F_kp1_qR - F_kp1_qL <= 0.09
         # -0.09 - Pps(f_k_qR - f_k_qL) <= Ppu * ( 1 | -1 ) U_k <= 0.09 - Pps(f_k_qR - f_k_qL)
-        A_fpos_ineq_R[...] =  numpy.eye(self.N)
-        A_fpos_ineq_L[...] = -numpy.eye(self.N)
-        A_fpos_ineq[...]   = self.Ppu.dot(A_fpos_ineq)
+        self.A_fpos_ineq[...] = phase['A_fpos_ineq']
 
-        ubB_fpos_ineq[...] =  0.09 - self.Pps.dot(self.f_k_qR - self.f_k_qL)
-        lbB_fpos_ineq[...] = -0.09 - self.Pps.dot(self.f_k_qR - self.f_k_qL)
+        ws = self.workspace
+        dfq = numpy.subtract(self.f_k_qR, self.f_k_qL, out=ws.rot_dfq)
+        tmp = numpy.dot(self.Pps, dfq, out=ws.rot_tmpR)
+        numpy.subtract( 0.09, tmp, out=ubB_fpos_ineq)
+        numpy.subtract(-0.09, tmp, out=lbB_fpos_ineq)
 
         # build foot velocity constraints
-        A_fvel_ineq_R[...] =  numpy.eye(self.N)
-        A_fvel_ineq_L[...] = -numpy.eye(self.N)
-        A_fvel_ineq[...]   = self.Pvu.dot(A_fvel_ineq)
+        self.A_fvel_ineq[...] = phase['A_fvel_ineq']
+
+        tmp = numpy.dot(self.Pvs, dfq, out=ws.rot_tmpR)
+        numpy.subtract( 0.22, tmp, out=ubB_fvel_ineq)
+        numpy.subtract(-0.22, tmp, out=lbB_fvel_ineq)
+
+    def _gait_phase_key(self):
+        """
+        key of the current gait phase, i.e. the support pattern given by
+        v_kp1, V_kp1, the support order and the finite state machine.
+
+        .. NOTE: CoM height and weights are part of the key, because cached
+                 Hessian blocks depend on them.
+        """
+        return (
+            self.v_kp1.tostring(),
+            self.V_kp1.tostring(),
+            self.supportIsRight.tostring(),
+            self.currentSupport.foot,
+            tuple(self.fsm_states),
+            self.h_com, self.a, self.b, self.c, self.d,
+        )
+
+    def _gait_phase_matrices(self):
+        """
+        return QP matrices only depending on the current gait phase. In steady
+        walking the support pattern repeats with period T_step/T, such that
+        matrices are only built once per phase and then looked up.
+
+        .. NOTE: requires up to date foot selection matrices, i.e. call
+                 _update_foot_selection_matrices beforehand.
+        """
+        def factory():
+            matrices = self._build_gait_phase_matrices()
+            for M in matrices.values():
+                M.flags.writeable = False
+            return matrices
+
+        return self.gait_phase_cache.get(self._gait_phase_key(), factory)
+
+    def _build_gait_phase_matrices(self):
+        """
+        build the state independent constraint matrices for current gait
+        phase. Derived generators extend the returned
+        dictionary by their Hessian blocks.
+        """
+        N = self.N
 
-        ubB_fvel_ineq[...] =  0.22 - self.Pvs.dot(self.f_k_qR - self.f_k_qL)
-        lbB_fvel_ineq[...] = -0.22   - self.Pvs.dot(self.f_k_qR - self.f_k_qL)
+        # A_fvel_eq =
+        # (E_FR_bar * Pvu              0 )
+        # (             0 E_FL_bar * Pvu )
+        A_fvel_eq = numpy.zeros(self.A_fvel_eq.shape, dtype=float)
+        A_fvel_eq[:, :N] = self.E_FR_bar.dot(self.Pvu)
+        A_fvel_eq[:, N:] = self.E_FL_bar.dot(self.Pvu)
+
+        # A_fpos_ineq = Ppu * ( 1 | -1 )
+        A_fpos_ineq = numpy.zeros(self.A_fpos_ineq.shape, dtype=float)
+        A_fpos_ineq[:, :N] =  numpy.eye(N)
+        A_fpos_ineq[:, N:] = -numpy.eye(N)
+        A_fpos_ineq = self.Ppu.dot(A_fpos_ineq)
+
+        # A_fvel_ineq = Pvu * ( 1 | -1 )
+        A_fvel_ineq = numpy.zeros(self.A_fvel_ineq.shape, dtype=float)
+        A_fvel_ineq[:, :N] =  numpy.eye(N)
+        A_fvel_ineq[:, N:] = -numpy.eye(N)
+        A_fvel_ineq = self.Pvu.dot(A_fvel_ineq)
+
+        matrices = {
+            'A_fvel_eq'   : A_fvel_eq,
+            'A_fpos_ineq' : A_fpos_ineq,
+            'A_fvel_ineq' : A_fvel_ineq,
+        }
+        return matrices
 
     def solve(self):
         """
@@ -1219,3 +1504,24 @@ class BaseGenerator(object):
         """
         err_str = 'Please derive from this class to implement your problem and solver'
         raise NotImplementedError(err_str)
+
+
+def diagonal_block_view(M, nrows):
+    """
+    strided view on the diagonal column blocks of matrix M, i.e.
+
+    view[i,k] = M[i*nrows + k, i]
+
+    Parameters
+    ----------
+
+    M: numpy.ndarray((n*nrows, m))
+        matrix, e.g. a view like D_kp1x, which is block diagonal with column
+        blocks of size (nrows, 1)
+
+    nrows: int
+        number of rows per block
+    """
+    n = M.shape[0] // nrows
+    s0, s1 = M.strides
+    return as_strided(M, shape=(n, nrows), strides=(nrows*s0 + s1, s0))
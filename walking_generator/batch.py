@@ -0,0 +1,483 @@
+import numpy
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+from combinedqp import NMPCGenerator
+from solvers import QPSolver
+
+class BatchNMPCGenerator(object):
+    """
+    Batch of K independent NMPC walking problems, e.g. what-if scenarios
+    with different reference velocities and security margins, which are
+    solved together in each call.
+
+    The states of all problems are stored in stacked arrays with a leading
+    batch axis, e.g. c_k_x of shape (K,3) and V_kp1 of shape (K,N,nf). The
+    K NMPCGenerator instances in generators work on views of these arrays,
+    s.t. everything depending on the individual support feet and foot
+    orientations, i.e. the constraint matrices and their derivatives, is
+    assembled per problem, while the linear parts of the objective, the QP
+    gradients and the constraint bounds are assembled for all problems at
+    once. The QPs are solved on a thread pool or on solver processes, each
+    generator keeps its own solver and thus its warm start.
+
+    .. NOTE:: All problems share horizon, sampling times and weights of
+              the objective, they differ in states, references and
+              constraints.
+
+    .. NOTE:: Threads only solve concurrently inside backends releasing the
+              GIL, e.g. in LAPACK calls of NumPy, and the per problem
+              assembly runs in the calling thread in any case. Solver
+              processes solve concurrently, but the QP data of each problem
+              is sent to them in every call, i.e. they only pay off when
+              solving takes longer than copying O(nv*(nv+nc)) floats.
+    """
+
+    # per problem arrays, which are stacked along the batch axis
+    _stacked_keys = (
+        # states and controls
+        'c_k_x', 'c_k_y', 'c_k_q', 'f_k_qR', 'f_k_qL',
+        'dddC_k_x', 'dddC_k_y', 'F_k_x', 'F_k_y', 'F_k_q',
+        'dddF_k_qR', 'dddF_k_qL',
+        # support foot selection
+        'v_kp1', 'V_kp1', 'E_FR_mask', 'E_FL_mask',
+        # references
+        'dC_kp1_x_ref', 'dC_kp1_y_ref', 'dC_kp1_q_ref',
+        # objective and constraints
+        'Q_k_x', 'Q_k_qR', 'Q_k_qL', 'p_k_x', 'p_k_y', 'p_k_qR', 'p_k_qL',
+        'A_pos_x', 'lbA_pos', 'ubA_pos', 'A_ori', 'lbA_ori', 'ubA_ori',
+        # QP data
+        'dofs', 'qp_H', 'qp_g', 'qp_A', 'qp_lbA', 'qp_ubA',
+    )
+
+    # thread pool resp. solver processes, cf. close()
+    _pool = None
+    _processes = ()
+
+    def __init__(
+        self, K, N=16, T=0.1, T_step=0.8,
+        fsm_state='D', fsm_sl=1, solver=None, threads=0, processes=0
+    ):
+        """
+        Parameters
+        ----------
+
+        K: int
+            number of walking problems
+
+        N, T, T_step, fsm_state, fsm_sl, solver:
+            cf. NMPCGenerator
+
+        threads: int
+            number of threads solving the QPs, 0 solves them one after
+            another in the calling thread
+
+        processes: int
+            number of processes solving the QPs instead of threads, each
+            one owns the solvers of every processes-th problem. Processes
+            and threads are released by close().
+        """
+        if threads and processes:
+            raise ValueError('QPs are solved either by threads or by processes')
+
+        self.K = K
+        self.generators = [
+            NMPCGenerator(N, T, T_step, fsm_state, fsm_sl, solver)
+            for k in range(K)
+        ]
+
+        # rename for convenience
+        gen = self.generators[0]
+        self.N  = gen.N
+        self.nf = gen.nf
+        self.nv = gen.nv
+        self.nc = gen.nc
+
+        # stack arrays and let generators work on views of them
+        for key in self._stacked_keys:
+            stack = numpy.array([getattr(g, key) for g in self.generators])
+            for k, g in enumerate(self.generators):
+                setattr(g, key, stack[k])
+            setattr(self, key, stack)
+
+        # save solver data of all problems
+        self.qp_ret     = numpy.zeros((K,), dtype=int)
+        self.qp_nwsr    = numpy.zeros((K,), dtype=int)
+        self.qp_cputime = numpy.zeros((K,), dtype=float)
+
+        self._pool = ThreadPool(threads) if threads else None
+
+        # generators solve through proxies of their solvers, which are
+        # moved to the processes
+        self._processes = []
+        for i in range(processes):
+            gens = self.generators[i::processes]
+            process = _SolverProcess(dict((id(g), g.qp) for g in gens))
+            for g in gens:
+                g.qp = _RemoteSolver(process, id(g), g.qp)
+            self._processes.append(process)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        """ terminate threads resp. processes solving the QPs """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        for process in self._processes:
+            process.close()
+        self._processes = []
+
+    def set_velocity_reference(self, local_vel_ref):
+        """
+        set reference velocities
+
+        Parameters
+        ----------
+
+        local_vel_ref: [dx,dy,dq] or numpy.ndarray((K,3))
+            reference velocity of all problems or of each problem
+        """
+        refs = numpy.broadcast_to(local_vel_ref, (self.K, 3))
+        for gen, ref in zip(self.generators, refs):
+            gen.set_velocity_reference(list(ref))
+
+    def set_security_margin(self, margin_x=0.04, margin_y=0.04):
+        """
+        set security margins of all problems, cf. BaseGenerator
+
+        Parameters
+        ----------
+
+        margin_x, margin_y: float or numpy.ndarray((K,))
+            security margins of all problems or of each problem
+        """
+        mx = numpy.broadcast_to(margin_x, (self.K,))
+        my = numpy.broadcast_to(margin_y, (self.K,))
+        for gen, x, y in zip(self.generators, mx, my):
+            gen.set_security_margin(x, y)
+
+    def set_initial_values(self, states):
+        """
+        initial value embedding of all problems
+
+        Parameters
+        ----------
+
+        states: list
+            K tuples of arguments of BaseGenerator.set_initial_values, e.g.
+            the return value of update()
+        """
+        for gen, state in zip(self.generators, states):
+            gen.set_initial_values(*state)
+
+    def update(self):
+        """ update all problems, returns list of their states, cf. BaseGenerator """
+        return [gen.update() for gen in self.generators]
+
+    def solve(self):
+        """ assemble and solve QPs of all problems """
+        gens = self.generators
+
+        # inject dofs, cf. NMPCGenerator._get_controls
+        self._get_controls()
+
+        # per problem matrices depending on support feet and orientations
+        for gen in gens:
+            gen._calculate_common_expressions()
+            gen._calculate_derivatives()
+            gen._update_qp_matrices()
+
+        # batched vectors
+        self._calculate_gradients()
+        self._update_qp_vectors()
+
+        if self._processes:
+            # start all QPs before waiting for the first result
+            for gen in gens:
+                gen.qp.submit(
+                    gen.qp_H, gen.qp_g, gen.qp_A, gen.qp_lb, gen.qp_ub,
+                    gen.qp_lbA, gen.qp_ubA, gen.nwsr, gen.cpu_time
+                )
+            map(self._solve_qp, range(self.K))
+        elif self._pool is not None:
+            self._pool.map(self._solve_qp, range(self.K))
+        else:
+            map(self._solve_qp, range(self.K))
+
+        for k, gen in enumerate(gens):
+            self.qp_ret[k]     = gen.qp_ret
+            self.qp_nwsr[k]    = gen.qp_nwsr
+            self.qp_cputime[k] = gen.qp_cputime
+
+        self._postprocess_solution()
+
+    def _solve_qp(self, k):
+        """ solve QP of k-th problem with its own solver """
+        gen = self.generators[k]
+        gen._solve_qp(gen.cpu_time)
+
+    def _get_controls(self):
+        """ copy controls of all problems into stacked dofs """
+        # rename for convenience
+        N  = self.N
+        nf = self.nf
+        dofs = self.dofs
+
+        dofs[:,0  :0+N   ] = self.dddC_k_x
+        dofs[:,0+N:0+N+nf] = self.F_k_x
+
+        a = N+nf
+        dofs[:,a  :a+N   ] = self.dddC_k_y
+        dofs[:,a+N:a+N+nf] = self.F_k_y
+
+        a = 2*(N+nf)
+        dofs[:,  a:a+N]    = self.dddF_k_qR
+        dofs[:, -N:]       = self.dddF_k_qL
+
+    def _calculate_gradients(self):
+        """
+        batched NMPCGenerator._calculate_gradients, i.e. products of the
+        preview matrices with stacked states are matrix products
+        """
+        # rename for convenience
+        N  = self.N
+        nf = self.nf
+        gens = self.generators
+
+        # weights
+        alpha = gens[0].a
+        gamma = gens[0].c
+
+        # matrices, NOTE ZMP matrices depend on CoM height of each problem
+        Pvs = gens[0].Pvs
+        Pvu = gens[0].Pvu
+        Pzs = numpy.array([gen.Pzs for gen in gens])
+        Pzu = numpy.array([gen.Pzu for gen in gens])
+
+        f_k_x = numpy.array([gen.f_k_x for gen in gens])
+        f_k_y = numpy.array([gen.f_k_y for gen in gens])
+
+        # p_k_xX = a * Pvu^T * (Pvs * c_k_x - dC_kp1_x_ref)
+        #        + c * Pzu^T * (Pzs * c_k_x - v_kp1 * f_k_x)
+        # p_k_xF = -c * V_kp1^T * (Pzs * c_k_x - v_kp1 * f_k_x)
+        for p_k, c_k, f_k, dC_kp1_ref in (
+            (self.p_k_x, self.c_k_x, f_k_x, self.dC_kp1_x_ref),
+            (self.p_k_y, self.c_k_y, f_k_y, self.dC_kp1_y_ref),
+        ):
+            res = c_k.dot(Pvs.transpose()) - dC_kp1_ref
+            z = numpy.einsum('knj,kj->kn', Pzs, c_k) - self.v_kp1 * f_k[:,numpy.newaxis]
+            p_k[:,:N] = alpha * res.dot(Pvu) + gamma * numpy.einsum('kn,kni->ki', z, Pzu)
+            p_k[:,-nf:] = -gamma * numpy.einsum('knf,kn->kf', self.V_kp1, z)
+
+        # p_k_qR = a * Pvu^T * E_FR^T * (E_FR * Pvs * f_k_qR - dC_kp1_q_ref)
+        for p_k_q, f_k_q, mask in (
+            (self.p_k_qR, self.f_k_qR, self.E_FR_mask),
+            (self.p_k_qL, self.f_k_qL, self.E_FL_mask),
+        ):
+            res = (f_k_q.dot(Pvs.transpose()) - self.dC_kp1_q_ref) * mask
+            p_k_q[...] = alpha * res.dot(Pvu)
+
+    def _update_qp_vectors(self):
+        """
+        batched NMPCGenerator._update_qp_vectors, i.e. QP gradients and
+        constraint bounds of all problems at their current dofs
+        """
+        # rename for convenience
+        N  = self.N
+        nf = self.nf
+        nc_pos = self.generators[0].nc_pos
+        U_k    = self.dofs
+        U_k_xy = U_k[:,:2*(N+nf)]
+        U_k_q  = U_k[:,-2*N:]
+
+        # g = H * U_k + p, NOTE H is block diagonal with Q_k_x, Q_k_qR, ...
+        g = self.qp_g
+        numpy.einsum('kij,kj->ki', self.qp_H, U_k, out=g)
+        a = N + nf
+        g[:,  :a]      += self.p_k_x
+        g[:, a:2*a]    += self.p_k_y
+        g[:,2*a:2*a+N] += self.p_k_qR
+        g[:, -N:]      += self.p_k_qL
+
+        # linearized constraints are given by
+        # lbA - A * U_k <= nablaA * Delta_U_k <= ubA - A * U_k
+        tmp = numpy.einsum('kij,kj->ki', self.A_pos_x, U_k_xy)
+        numpy.subtract(self.lbA_pos, tmp, out=self.qp_lbA[:,:nc_pos])
+        numpy.subtract(self.ubA_pos, tmp, out=self.qp_ubA[:,:nc_pos])
+
+        tmp = numpy.einsum('kij,kj->ki', self.A_ori, U_k_q)
+        numpy.subtract(self.lbA_ori, tmp, out=self.qp_lbA[:,nc_pos:])
+        numpy.subtract(self.ubA_ori, tmp, out=self.qp_ubA[:,nc_pos:])
+
+    def _postprocess_solution(self):
+        """ add increments of all problems to their controls """
+        # rename for convenience
+        N  = self.N
+        nf = self.nf
+        dofs = self.dofs
+
+        self.dddC_k_x  += dofs[:,0  :0+N   ]
+        self.F_k_x     += dofs[:,0+N:0+N+nf]
+
+        a = N + nf
+        self.dddC_k_y  += dofs[:,a  :a+N   ]
+        self.F_k_y     += dofs[:,a+N:a+N+nf]
+
+        a = 2*(N + nf)
+        self.dddF_k_qR += dofs[:,  a:a+N]
+        self.dddF_k_qL += dofs[:, -N:]
+
+        for gen in self.generators:
+            gen.qp_fallback = 0.0
+            gen.sqp_iter    = 1
+            gen.sqp_alpha   = 1.0
+            gen.sqp_step    = numpy.abs(gen.dofs).max()
+
+
+def _serve(conn, solvers):
+    """
+    loop of a solver process, i.e. executes the requests of the
+    _RemoteSolver instances with the solvers of its problems
+    """
+    while True:
+        msg = conn.recv()
+        if msg is None:
+            break
+
+        cmd, key, args = msg
+        qp = solvers[key]
+        if cmd == 'solve':
+            try:
+                ret, nwsr, cputime = qp.solve(*args)
+                x = numpy.zeros((qp.nv,), dtype=float)
+                y = numpy.zeros((qp.nv + qp.nc,), dtype=float)
+                qp.get_primal_solution(x)
+                qp.get_dual_solution(y)
+                result = (ret, nwsr, cputime, x, y, qp.get_objective_value())
+            except Exception as e:
+                result = e
+            conn.send((key, result))
+        elif cmd == 'shift':
+            qp.shift_working_set(*args)
+        elif cmd == 'reset':
+            qp.reset()
+
+
+class _SolverProcess(object):
+    """
+    Process owning the solvers of some problems of a batch, cf. _serve
+    """
+
+    def __init__(self, solvers):
+        """
+        Parameters
+        ----------
+
+        solvers: dict
+            QPSolver instances by key of their problem, which are copied
+            into the process
+        """
+        self.conn, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_serve, args=(child, solvers))
+        self.process.daemon = True
+        self.process.start()
+        child.close()
+
+        # results received while waiting for another problem
+        self._results = {}
+
+    def send(self, cmd, key, args=()):
+        """ send request of problem key to process """
+        self.conn.send((cmd, key, args))
+
+    def result(self, key):
+        """ wait for solution of problem key, re-raises errors of the solver """
+        while key not in self._results:
+            k, result = self.conn.recv()
+            self._results[k] = result
+        result = self._results.pop(key)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def close(self):
+        """ stop process """
+        self.conn.send(None)
+        self.process.join()
+        self.conn.close()
+
+
+class _RemoteSolver(QPSolver):
+    """
+    Proxy of a solver moved to a _SolverProcess, i.e. warm start
+    information is kept in the process and solutions are copied back.
+    """
+
+    def __init__(self, process, key, qp):
+        """
+        Parameters
+        ----------
+
+        process: _SolverProcess
+            process owning the solver
+
+        key: int
+            key of the problem in process
+
+        qp: QPSolver
+            solver moved to process
+        """
+        super(_RemoteSolver, self).__init__(qp.nv, qp.nc, qp.print_level)
+        self.process = process
+        self.key = key
+        self.is_initialized = qp.is_initialized
+        self._submitted = False
+
+        self.x = numpy.zeros((qp.nv,), dtype=float)
+        self.y = numpy.zeros((qp.nv + qp.nc,), dtype=float)
+        self._obj_val = 0.0
+
+    def submit(self, H, g, A, lb, ub, lbA, ubA, nwsr, cpu_time):
+        """ start solve in process, cf. solve() for its result """
+        self.process.send(
+            'solve', self.key, (H, g, A, lb, ub, lbA, ubA, nwsr, cpu_time)
+        )
+        self._submitted = True
+
+    def solve(self, H, g, A, lb, ub, lbA, ubA, nwsr, cpu_time):
+        # NOTE a QP started by submit() is not sent again
+        if not self._submitted:
+            self.submit(H, g, A, lb, ub, lbA, ubA, nwsr, cpu_time)
+        self._submitted = False
+
+        ret, nwsr, cputime, x, y, obj_val = self.process.result(self.key)
+        self.x[...] = x
+        self.y[...] = y
+        self._obj_val = obj_val
+        self.is_initialized = True
+        return ret, nwsr, cputime
+
+    def get_primal_solution(self, out):
+        out[...] = self.x
+
+    def get_objective_value(self):
+        return self._obj_val
+
+    def get_dual_solution(self, out):
+        out[...] = self.y
+
+    def reset(self):
+        super(_RemoteSolver, self).reset()
+        self.process.send('reset', self.key)
+
+    def shift_working_set(self, row_map):
+        self.process.send('shift', self.key, (row_map,))
@@ -0,0 +1,254 @@
+import numpy
+from collections import OrderedDict, namedtuple
+
+class LRUCache(object):
+    """
+    Simple least recently used cache with fixed capacity. Values are built
+    by a factory on a miss and the least recently used entry is evicted when
+    the capacity is exceeded.
+    """
+
+    def __init__(self, maxsize=16):
+        """
+        Parameters
+        ----------
+
+        maxsize: int
+            maximum number of cached entries
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, factory, *args):
+        """
+        return cached value for key, on a miss value = factory(*args) is
+        stored before it is returned
+        """
+        try:
+            # re-insert to mark entry as most recently used
+            value = self._data.pop(key)
+            self.hits += 1
+        except KeyError:
+            value = factory(*args)
+            self.misses += 1
+
+        self._data[key] = value
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+        return value
+
+    def discard(self, key):
+        """ remove entry of key if present """
+        self._data.pop(key, None)
+
+    def clear(self):
+        """ remove all entries and reset counters """
+        self._data.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+PreviewMatrices = namedtuple(
+    'PreviewMatrices', ('Pps', 'Ppu', 'Pvs', 'Pvu', 'Pas', 'Pau', 'Pzs', 'Pzu')
+)
+
+# process wide cache of the preview matrices, shared by all generators
+PREVIEW_MATRIX_CACHE = LRUCache(maxsize=16)
+
+def preview_matrices(N, T, h_com, g=9.81):
+    """
+    return the transformation matrices of the piecewise jerk CoM dynamics
+    over the preview horizon
+
+        C_kp1 = Pps * c_k + Ppu * dddC_k     (position)
+        dC_kp1 = Pvs * c_k + Pvu * dddC_k    (velocity)
+        ddC_kp1 = Pas * c_k + Pau * dddC_k   (acceleration)
+        Z_kp1 = Pzs * c_k + Pzu * dddC_k     (zero moment point)
+
+    The matrices only depend on the horizon, i.e. (N, T, h_com), and are
+    therefore cached process wide and shared between generators.
+
+    .. NOTE: returned matrices are read-only, copy them before modification.
+
+    Parameters
+    ----------
+
+    N: int
+        number of samples on the preview horizon
+
+    T: float
+        sampling time of the preview horizon
+
+    h_com: float
+        height of center of mass
+
+    g: float
+        gravity constant
+    """
+    key = (int(N), float(T), float(h_com), float(g))
+    return PREVIEW_MATRIX_CACHE.get(key, _build_preview_matrices, *key)
+
+def _build_preview_matrices(N, T, h_com, g):
+    """ closed form assembly of the preview matrices, cf. preview_matrices """
+    # j = 1, ..., N for the state matrices
+    j = numpy.arange(1, N+1, dtype=float)
+
+    # d = i - j for the lower triangular control matrices
+    d = numpy.subtract.outer(numpy.arange(N), numpy.arange(N)).astype(float)
+    lower = d >= 0.
+
+    Pps = numpy.zeros((N,3), dtype=float)
+    Pps[:,0] = 1.
+    Pps[:,1] = j*T
+    Pps[:,2] = (j**2*T**2)/2.
+
+    Pvs = numpy.zeros((N,3), dtype=float)
+    Pvs[:,1] = 1.
+    Pvs[:,2] = j*T
+
+    Pas = numpy.zeros((N,3), dtype=float)
+    Pas[:,2] = 1.
+
+    Pzs = Pps.copy()
+    Pzs[:,2] = (j**2*T**2)/2. - h_com/g
+
+    Ppu = numpy.where(lower, (3.*d**2 + 3.*d + 1.)*T**3/6., 0.)
+    Pvu = numpy.where(lower, (2.*d + 1.)*T**2/2., 0.)
+    Pau = numpy.where(lower, T, 0.)
+    Pzu = numpy.where(lower, (3.*d**2 + 3.*d + 1.)*T**3/6. - T*h_com/g, 0.)
+
+    matrices = PreviewMatrices(Pps, Ppu, Pvs, Pvu, Pas, Pau, Pzs, Pzu)
+    for M in matrices:
+        M.flags.writeable = False
+
+    return matrices
+
+InterpolationMatrices = namedtuple(
+    'InterpolationMatrices', ('S', 'U', 'Zs', 'Zu', 'Ac', 'Bc')
+)
+
+# process wide cache of the LIPM interpolation matrices
+INTERPOLATION_MATRIX_CACHE = LRUCache(maxsize=16)
+
+def interpolation_matrices(n, T, Tc, h_com, g=9.81):
+    """
+    return the transformation matrices of the piecewise jerk CoM dynamics
+    from the beginning of one control period to its n interpolated samples
+
+        c_i = S[i] * c_0 + U[i] * dddc    (CoM state at time i*T)
+        z_i = Zs[i] * c_0 + Zu[i] * dddc  (zero moment point at time i*T)
+        c_1 = Ac * c_0 + Bc * dddc        (CoM state after control period)
+
+    i.e. S and U are the stacked state transitions and inputs of all
+    samples. Like the preview matrices they only depend on (n, T, Tc, h_com)
+    and are cached process wide.
+
+    .. NOTE: returned matrices are read-only, copy them before modification.
+
+    Parameters
+    ----------
+
+    n: int
+        number of interpolated samples
+
+    T: float
+        interpolation sampling time
+
+    Tc: float
+        control period
+
+    h_com: float
+        height of center of mass
+
+    g: float
+        gravity constant
+    """
+    key = (int(n), float(T), float(Tc), float(h_com), float(g))
+    return INTERPOLATION_MATRIX_CACHE.get(key, _build_interpolation_matrices, *key)
+
+def _build_interpolation_matrices(n, T, Tc, h_com, g):
+    """ closed form assembly, cf. interpolation_matrices """
+    # sample times t_i = i*T
+    t = numpy.arange(n, dtype=float)*T
+
+    S = numpy.zeros((n,3,3), dtype=float)
+    S[:,0,0] = 1.
+    S[:,0,1] = t
+    S[:,0,2] = t**2/2.
+    S[:,1,1] = 1.
+    S[:,1,2] = t
+    S[:,2,2] = 1.
+
+    U = numpy.zeros((n,3), dtype=float)
+    U[:,0] = t**3/6.
+    U[:,1] = t**2/2.
+    U[:,2] = t
+
+    # z = c - h_com/g * ddc
+    C = numpy.array((1., 0., -h_com/g))
+    Zs = C.dot(S)
+    Zu = U.dot(C)
+
+    Ac = numpy.array(((1., Tc, Tc**2/2.), (0., 1., Tc), (0., 0., 1.)))
+    Bc = numpy.array((Tc**3/6., Tc**2/2., Tc))
+
+    matrices = InterpolationMatrices(S, U, Zs, Zu, Ac, Bc)
+    for M in matrices:
+        M.flags.writeable = False
+
+    return matrices
+
+class MaskedGramCache(object):
+    """
+    Cache of Gram products of a fixed matrix M under 0/1 diagonal selection
+    matrices E = diag(mask), i.e.
+
+        M^T * E^T * E * M = M[mask]^T * M[mask]
+
+    Products are computed by row selection and cached per distinct mask, so
+    periodically repeating support patterns only result in a lookup.
+
+    .. NOTE: returned matrices are read-only.
+    """
+
+    def __init__(self, M, maxsize=64):
+        """
+        Parameters
+        ----------
+
+        M: numpy.ndarray((N, n))
+            matrix selected row-wise
+
+        maxsize: int
+            maximum number of cached masks
+        """
+        self.M = M
+        self.cache = LRUCache(maxsize=maxsize)
+
+    def __call__(self, mask):
+        """
+        return M[mask]^T * M[mask]
+
+        Parameters
+        ----------
+
+        mask: numpy.ndarray((N,), dtype=bool)
+            diagonal of the selection matrix
+        """
+        mask = numpy.asarray(mask, dtype=bool)
+        return self.cache.get(mask.tostring(), self._gram, mask.copy())
+
+    def _gram(self, mask):
+        Ms = self.M[mask]
+        G = Ms.transpose().dot(Ms)
+        G.flags.writeable = False
+        return G
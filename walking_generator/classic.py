@@ -1,19 +1,11 @@
 import sys
+import time
 import numpy
-import utility
+from multiprocessing.pool import ThreadPool
 
 from base import BaseGenerator
-from visualization import PlotData
-
-# Try to get qpOASES SQP Problem class
-try:
-    from qpoases import PyOptions as Options
-    from qpoases import PyPrintLevel as PrintLevel
-    from qpoases import PySQProblem as SQProblem
-    from qpoases import PySolutionAnalysis as SolutionAnalysis
-except ImportError:
-    err_str = 'Please install qpOASES python interface, else you will not be able to use this pattern generator.'
-    raise ImportError(err_str)
+from datalog import PlotData
+from solvers import make_solver, default_solver, SUCCESSFUL_RETURN
 
 
 class ClassicGenerator(BaseGenerator):
@@ -27,13 +19,33 @@ class ClassicGenerator(BaseGenerator):
     """
     def __init__(
         self, N=16, T=0.1, T_step=0.8,
-        fsm_state='D', fsm_sl=1
+        fsm_state='D', fsm_sl=1, solver=None, eliminate_equalities=False,
+        decouple_xy=False, parallel_xy=False
     ):
         """
         Initialize pattern generator matrices through base class
         and allocate two QPs one for optimzation of orientation and
         one for position of CoM and feet.
 
+        Parameters
+        ----------
+
+        solver: str
+            QP solver backend, cf. solvers.SOLVERS. Defaults to qpOASES when
+            available, else the native active set backend is used.
+
+        eliminate_equalities: bool
+            eliminate equality constraints, i.e. foot position and support
+            foot orientation freezing, by null space projection before the
+            solve, cf. solvers.NullSpaceSolver
+
+        decouple_xy: bool
+            solve position QP as two independent QPs for x and y, whenever
+            the constraints allow for it, cf. _solve_pos_qp_decoupled
+
+        parallel_xy: bool
+            solve the decoupled QPs concurrently on a thread pool, which is
+            released by close()
         """
         super(ClassicGenerator, self).__init__(
             N, T, T_step, fsm_state, fsm_sl
@@ -56,12 +68,11 @@ class ClassicGenerator(BaseGenerator):
         N  = self.N
         nf = self.nf
 
-        # define some qpOASES specific things
+        # define some solver specific things
+        self.solver   = solver or default_solver()
+        self.eliminate_equalities = eliminate_equalities
         self.cpu_time = 0.1 # upper bound on CPU time, 0 is no upper limit
         self.nwsr     = 100      # number of working set recalculations
-        self.options = Options()
-        self.options.setToMPC()
-        self.options.printLevel = PrintLevel.LOW
 
         # FOR ORIENTATIONS
         # define dimensions
@@ -74,8 +85,10 @@ class ClassicGenerator(BaseGenerator):
 
         # setup problem
         self.ori_dofs = numpy.zeros(self.ori_nv)
-        self.ori_qp = SQProblem(self.ori_nv, self.ori_nc)
-        self.ori_qp.setOptions(self.options) # load NMPC options
+        self.ori_qp = make_solver(
+            self.solver, self.ori_nv, self.ori_nc, print_level='low',
+            eliminate_equalities=eliminate_equalities
+        )
 
         self.ori_H   =  numpy.zeros((self.ori_nv,self.ori_nv))
         self.ori_A   =  numpy.zeros((self.ori_nc,self.ori_nv))
@@ -90,6 +103,7 @@ class ClassicGenerator(BaseGenerator):
         # save computation time and working set recalculations
         self.ori_qp_nwsr    = 0.0
         self.ori_qp_cputime = 0.0
+        self.ori_qp_ret     = SUCCESSFUL_RETURN
 
         # FOR POSITIONS
         # define dimensions
@@ -102,8 +116,10 @@ class ClassicGenerator(BaseGenerator):
 
         # setup problem
         self.pos_dofs = numpy.zeros(self.pos_nv)
-        self.pos_qp = SQProblem(self.pos_nv, self.pos_nc)
-        self.pos_qp.setOptions(self.options)
+        self.pos_qp = make_solver(
+            self.solver, self.pos_nv, self.pos_nc, print_level='low',
+            eliminate_equalities=eliminate_equalities
+        )
 
         self.pos_H   = numpy.zeros((self.pos_nv,self.pos_nv))
         self.pos_A   = numpy.zeros((self.pos_nc,self.pos_nv))
@@ -118,6 +134,24 @@ class ClassicGenerator(BaseGenerator):
         # save computation time and working set recalculations
         self.pos_qp_nwsr    = 0.0
         self.pos_qp_cputime = 0.0
+        self.pos_qp_ret     = SUCCESSFUL_RETURN
+
+        # x/y decoupled position QPs of half size with all rows of pos_A,
+        # rows not belonging to the respective coordinate are left free
+        self.decouple_xy = decouple_xy
+        self.pos_qp_decoupled = 0.0
+        self.pos_qp_path_counts = {'coupled': 0, 'decoupled': 0, 'fallback': 0}
+        self._xy_pool = None
+        if decouple_xy:
+            nh = self.N + self.nf
+            self.pos_qp_xy = [
+                make_solver(
+                    self.solver, nh, self.pos_nc, print_level='low',
+                    eliminate_equalities=eliminate_equalities
+                ) for i in range(2)
+            ]
+            if parallel_xy:
+                self._xy_pool = ThreadPool(2)
 
         # dummy matrices
         self._ori_Q = numpy.zeros((2*self.N, 2*self.N))
@@ -125,18 +159,54 @@ class ClassicGenerator(BaseGenerator):
         self._pos_Q = numpy.zeros((self.N + self.nf, self.N + self.nf))
         self._pos_p = numpy.zeros((self.N + self.nf,))
 
+        # work buffers, cf. Workspace
+        ws = self.workspace
+        ws.allocate('ori_res', (N,))
+        ws.allocate('pos_res', (N,))
+        ws.allocate('pos_z',   (N,))
+        ws.allocate('pos_tmp', (N,))
+        ws.allocate('pos_NN',  (N, N))
+        ws.allocate('pos_NF',  (N, nf))
+        ws.allocate('pos_FF',  (nf, nf), dtype=self.V_kp1.dtype)
+        if decouple_xy:
+            for c in ('x', 'y'):
+                ws.allocate('pos_A_'   + c, (self.pos_nc, N+nf))
+                ws.allocate('pos_lbA_' + c, (self.pos_nc,))
+                ws.allocate('pos_ubA_' + c, (self.pos_nc,))
+                ws.allocate('pos_lb_'  + c, (N+nf,))
+                ws.allocate('pos_ub_'  + c, (N+nf,))
+                ws.allocate('pos_dofs_' + c, (N+nf,))
+
         # add additional keys that should be saved
         self._data_keys.append('ori_qp_nwsr')
         self._data_keys.append('ori_qp_cputime')
+        self._data_keys.append('ori_qp_ret')
         self._data_keys.append('pos_qp_nwsr')
         self._data_keys.append('pos_qp_cputime')
+        self._data_keys.append('pos_qp_ret')
+        self._data_keys.append('pos_qp_decoupled')
 
         # reinitialize plot data structure
         self.data = PlotData(self)
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """ terminate thread pool of the decoupled position QPs """
+        if self._xy_pool is not None:
+            self._xy_pool.close()
+            self._xy_pool.join()
+            self._xy_pool = None
+
     def solve(self):
         """ Process and solve problem, s.t. pattern generator data is consistent """
-        self._preprocess_solution()
+        caches = (self.gait_phase_cache, self.Pvu_gram.cache)
+        with self.workspace.check_allocations('_preprocess_solution', caches):
+            self._preprocess_solution()
         self._solve_qp()
         self._postprocess_solution()
 
@@ -161,10 +231,11 @@ class ClassicGenerator(BaseGenerator):
             # this requires changes to the python interface
 
         # define QP matrices
+        # NOTE Hessians only depend on the gait phase and are cached
+        phase = self._gait_phase_matrices()
 
         # H = ( Q_k_q )
-        self._update_ori_Q() # updates values in _Q
-        self.ori_H  [:,:] = self._ori_Q
+        self.ori_H  [:,:] = phase['ori_Q']
 
         # g = ( p_k_q )
         self._update_ori_p() # updates values in _p
@@ -219,9 +290,8 @@ class ClassicGenerator(BaseGenerator):
 
         # H = ( Q_k   0 )
         #     (   0 Q_k )
-        self._update_pos_Q() # updates values in _Q
-        self.pos_H  [ :N+nf,  :N+nf] = self._pos_Q
-        self.pos_H  [-N-nf:, -N-nf:] = self._pos_Q
+        self.pos_H  [ :N+nf,  :N+nf] = phase['pos_Q']
+        self.pos_H  [-N-nf:, -N-nf:] = phase['pos_Q']
 
         # g = ( p_k_x )
         #     ( p_k_y )
@@ -238,7 +308,7 @@ class ClassicGenerator(BaseGenerator):
         # CoP constraints
         a = 0
         b = self.nc_cop
-        self.pos_A  [a:b] = self.Acop
+        self.cop_constraint.dense(out=self.pos_A[a:b])
         self.pos_lbA[a:b] = self.lbBcop
         self.pos_ubA[a:b] = self.ubBcop
 
@@ -260,6 +330,18 @@ class ClassicGenerator(BaseGenerator):
         #self.pos_lb [...] = 0.0
         #self.pos_ub [...] = 0.0
 
+    def _build_gait_phase_matrices(self):
+        """ extend gait phase matrices by Hessians of both QPs """
+        matrices = super(ClassicGenerator, self)._build_gait_phase_matrices()
+
+        self._update_ori_Q() # updates values in _Q
+        matrices['ori_Q'] = self._ori_Q.copy()
+
+        self._update_pos_Q() # updates values in _Q
+        matrices['pos_Q'] = self._pos_Q.copy()
+
+        return matrices
+
     def _update_ori_Q(self):
         '''
         Update Hessian block Q according to walking report
@@ -280,17 +362,17 @@ class ClassicGenerator(BaseGenerator):
         delta = self.d
 
         # matrices
-        E_FR = self.E_FR
-        E_FL = self.E_FL
-
-        Pvu = self.Pvu
+        # NOTE E_FR, E_FL are diagonal 0/1 selectors, hence
+        #      Pvu^T * E_FR^T * E_FR * Pvu = Pvu[E_FR_mask]^T * Pvu[E_FR_mask]
+        #      which is cached per support pattern
+        Pvu_gram = self.Pvu_gram
 
         # assemble Hessian matrix
         # QR = ( a * Pvu^T * E_FR^T * E_FR * Pvu )
         a = 0; b = N
         c = 0; d = N
         QR = self._ori_Q[a:b,c:d]
-        QR[...] = alpha * Pvu.transpose().dot(E_FR.transpose()).dot(E_FR).dot(Pvu)
+        QR[...] = alpha * Pvu_gram(self.E_FR_mask)
 
         # QL = ( a * Pvu^T * E_FL^T * E_FL * Pvu )
         # Q = ( * , * )
@@ -298,7 +380,7 @@ class ClassicGenerator(BaseGenerator):
         a = N; b = 2*N
         c = N; d = 2*N
         QL = self._ori_Q[a:b,c:d]
-        QL[...] = alpha * Pvu.transpose().dot(E_FL.transpose()).dot(E_FL).dot(Pvu)
+        QL[...] = alpha * Pvu_gram(self.E_FL_mask)
 
     def _update_ori_p(self):
         """
@@ -319,9 +401,8 @@ class ClassicGenerator(BaseGenerator):
         gamma = self.c
 
         # matrices
-        E_FR = self.E_FR
-        E_FL = self.E_FL
-
+        # NOTE E_FR, E_FL are diagonal 0/1 selectors, hence
+        #      E_FR^T * (E_FR * v - w) = E_FR_mask * (v - w)
         f_k_qR = self.f_k_qR
         f_k_qL = self.f_k_qL
 
@@ -330,18 +411,26 @@ class ClassicGenerator(BaseGenerator):
 
         dC_kp1_q_ref = self.dC_kp1_q_ref
 
-        # pR = ( a * Pvu^T * E_FL^T * (E_FL * Pvs * f_k_qL + dC_kp1_q_ref) )
+        res = self.workspace.ori_res
+
+        # pR = ( a * Pvu^T * E_FR^T * (E_FR * Pvs * f_k_qR - dC_kp1_q_ref) )
         # p = ([*]) =
         #     ( * )
         a = 0; b = N
-        self._ori_p[a:b] = \
-            alpha * Pvu.transpose().dot(E_FR.transpose()).dot(E_FR.dot(Pvs).dot(f_k_qR) - dC_kp1_q_ref)
+        numpy.dot(Pvs, f_k_qR, out=res)
+        numpy.subtract(res, dC_kp1_q_ref, out=res)
+        numpy.multiply(res, self.E_FR_mask, out=res)
+        numpy.dot(Pvu.transpose(), res, out=self._ori_p[a:b])
+        numpy.multiply(self._ori_p[a:b], alpha, out=self._ori_p[a:b])
 
         # p = ( * ) =
         #     ([*])
         a = N; b = 2*N
-        self._ori_p[a:b] = \
-            alpha * Pvu.transpose().dot(E_FL.transpose()).dot(E_FL.dot(Pvs).dot(f_k_qL) - dC_kp1_q_ref)
+        numpy.dot(Pvs, f_k_qL, out=res)
+        numpy.subtract(res, dC_kp1_q_ref, out=res)
+        numpy.multiply(res, self.E_FL_mask, out=res)
+        numpy.dot(Pvu.transpose(), res, out=self._ori_p[a:b])
+        numpy.multiply(self._ori_p[a:b], alpha, out=self._ori_p[a:b])
 
     def _update_pos_Q(self):
         '''
@@ -360,38 +449,47 @@ class ClassicGenerator(BaseGenerator):
         gamma = self.c
         delta = self.d
 
-        # cast matrices for convenience
-        Ppu   = numpy.asmatrix(self.Ppu)
-        Pvu   = numpy.asmatrix(self.Pvu)
-        Pzu   = numpy.asmatrix(self.Pzu)
-        V_kp1 = numpy.asmatrix(self.V_kp1)
+        # matrices
+        Pvu   = self.Pvu
+        Pzu   = self.Pzu
+        V_kp1 = self.V_kp1
+
+        ws = self.workspace
+        Q  = self._pos_Q
 
         # Q = ([*], * ) = a*Pvu*Pvu + b*Ppu*E*E*Ppu + c*Pzu*Pzu + d*I
         #     ( * , * )
         a = 0; b = N
         c = 0; d = N
-        self._pos_Q[a:b,c:d] = alpha * Pvu.transpose() * Pvu \
-                         + gamma * Pzu.transpose() * Pzu \
-                         + delta * numpy.eye(N)
+        QXX = Q[a:b,c:d]
+        tmp = numpy.dot(Pvu.transpose(), Pvu, out=ws.pos_NN)
+        numpy.multiply(tmp, alpha, out=QXX)
+        numpy.dot(Pzu.transpose(), Pzu, out=tmp)
+        numpy.multiply(tmp, gamma, out=tmp)
+        numpy.add(QXX, tmp, out=QXX)
+        # NOTE diagonal of QXX in the contiguous flat view of Q
+        Q.ravel()[:N*(N+nf+1):N+nf+1] += delta
 
         # Q = ( * ,[*])
         #     ( * , * )
         a = 0; b = N
         c = N; d = N+nf
-        self._pos_Q[a:b,c:d] = -gamma * Pzu.transpose() * V_kp1
+        tmp = numpy.dot(Pzu.transpose(), V_kp1, out=ws.pos_NF)
+        numpy.multiply(tmp, -gamma, out=Q[a:b,c:d])
 
         # Q = (  * , * ) = ( * , [*] )^T
         #     ( [*], * )   ( * ,  *  )
-        dummy = self._pos_Q[a:b,c:d]
+        dummy = Q[a:b,c:d]
         a = N; b = N+nf
         c = 0; d = N
-        self._pos_Q[a:b,c:d] = dummy.transpose()
+        Q[a:b,c:d] = dummy.transpose()
 
         # Q = ( * , * )
         #     ( * ,[*])
         a = N; b = N+nf
         c = N; d = N+nf
-        self._pos_Q[a:b,c:d] = gamma * V_kp1.transpose() * V_kp1
+        tmp = numpy.dot(V_kp1.transpose(), V_kp1, out=ws.pos_FF)
+        numpy.multiply(tmp, gamma, out=Q[a:b,c:d])
 
     def _update_pos_p(self, case=None):
         """
@@ -401,16 +499,14 @@ class ClassicGenerator(BaseGenerator):
             (                                                       -c*Vk+1*(Pzs*ck - vk+1*fk )
         """
         if case == 'x':
-            f_k = self.f_k_x
-
-            c_k        = utility.cast_array_as_matrix(self.c_k_x)
-            dC_kp1_ref = utility.cast_array_as_matrix(self.dC_kp1_x_ref)
+            f_k        = self.f_k_x
+            c_k        = self.c_k_x
+            dC_kp1_ref = self.dC_kp1_x_ref
 
         elif case == 'y':
-            f_k = self.f_k_y
-
-            c_k        = utility.cast_array_as_matrix(self.c_k_y)
-            dC_kp1_ref = utility.cast_array_as_matrix(self.dC_kp1_y_ref)
+            f_k        = self.f_k_y
+            c_k        = self.c_k_y
+            dC_kp1_ref = self.dC_kp1_y_ref
         else:
             err_str = 'Please use either case "x" or "y" for this routine'
             raise AttributeError(err_str)
@@ -425,84 +521,189 @@ class ClassicGenerator(BaseGenerator):
         gamma = self.c
 
         # matrices
-        v_kp1 = utility.cast_array_as_matrix(self.v_kp1)
+        v_kp1 = self.v_kp1
 
-        Pvs   = numpy.asmatrix(self.Pvs)
-        Pvu   = numpy.asmatrix(self.Pvu)
-        Pps   = numpy.asmatrix(self.Pps)
-        Ppu   = numpy.asmatrix(self.Ppu)
-        Pzs   = numpy.asmatrix(self.Pzs)
-        Pzu   = numpy.asmatrix(self.Pzu)
-        V_kp1 = numpy.asmatrix(self.V_kp1)
+        Pvs   = self.Pvs
+        Pvu   = self.Pvu
+        Pzs   = self.Pzs
+        Pzu   = self.Pzu
+        V_kp1 = self.V_kp1
+
+        ws  = self.workspace
+        res = ws.pos_res
+        z   = ws.pos_z
+        tmp = ws.pos_tmp
+
+        # z = Pzs*c_k - v_kp1*f_k
+        numpy.dot(Pzs, c_k, out=z)
+        numpy.multiply(v_kp1, f_k, out=tmp)
+        numpy.subtract(z, tmp, out=z)
 
         # p = ([*]) =
         #     ( * )
         a = 0; b = N
-        self._pos_p[a:b] = (
-              alpha * Pvu.transpose() *(Pvs*c_k - dC_kp1_ref)
-            + gamma * Pzu.transpose() *(Pzs*c_k - v_kp1*f_k)
-            #+ b*Ppu.transpose() * E.transpose() * E * Ppu \
-        ).ravel()
+        pX = self._pos_p[a:b]
+        numpy.dot(Pvs, c_k, out=res)
+        numpy.subtract(res, dC_kp1_ref, out=res)
+        numpy.dot(Pvu.transpose(), res, out=pX)
+        numpy.multiply(pX, alpha, out=pX)
+        numpy.dot(Pzu.transpose(), z, out=tmp)
+        numpy.multiply(tmp, gamma, out=tmp)
+        numpy.add(pX, tmp, out=pX)
+        #+ b*Ppu.transpose() * E.transpose() * E * Ppu \
 
         # p = ( * ) =
         #     ([*])
         a = N; b = N+nf
-        self._pos_p[a:b] = (
-            -gamma * V_kp1.transpose() * (Pzs*c_k - v_kp1*f_k)
-        ).ravel()
+        pF = self._pos_p[a:b]
+        numpy.dot(V_kp1.transpose(), z, out=pF)
+        numpy.multiply(pF, -gamma, out=pF)
 
     def _solve_qp(self):
         """
         Solve QP first run with init functionality and other runs with warmstart
         """
         #sys.stdout.write('Solve for orientations:\n')
-        if not self._ori_qp_is_initialized:
-            ret, nwsr, cputime = self.ori_qp.init(
-                self.ori_H, self.ori_g, self.ori_A,
-                self.ori_lb, self.ori_ub,
-                self.ori_lbA, self.ori_ubA,
-                self.nwsr, self.cpu_time
-            )
-            self._ori_qp_is_initialized = True
-        else:
-            ret, nwsr, cputime = self.ori_qp.hotstart(
-                self.ori_H, self.ori_g, self.ori_A,
-                self.ori_lb, self.ori_ub,
-                self.ori_lbA, self.ori_ubA,
-                self.nwsr, self.cpu_time
-            )
+        # NOTE backends warm start from last solution after first call
+        ret, nwsr, cputime = self.ori_qp.solve(
+            self.ori_H, self.ori_g, self.ori_A,
+            self.ori_lb, self.ori_ub,
+            self.ori_lbA, self.ori_ubA,
+            self.nwsr, self.cpu_time
+        )
+        self._ori_qp_is_initialized = True
+        self.ori_qp_ret = ret
 
         # orientation primal solution
-        self.ori_qp.getPrimalSolution(self.ori_dofs)
+        self.ori_qp.get_primal_solution(self.ori_dofs)
 
         # save qp solver data
         self.ori_qp_nwsr    = nwsr          # working set recalculations
         self.ori_qp_cputime = cputime*1000. # in milliseconds
 
         #sys.stdout.write('Solve for positions:\n')
-        if not self._pos_qp_is_initialized:
-            ret, nwsr, cputime = self.pos_qp.init(
-                self.pos_H, self.pos_g, self.pos_A,
-                self.pos_lb, self.pos_ub,
-                self.pos_lbA, self.pos_ubA,
-                self.nwsr, self.cpu_time
-            )
-            self._pos_qp_is_initialized = True
+        if self.decouple_xy and self._solve_pos_qp_decoupled():
+            self.pos_qp_decoupled = 1.0
+            self.pos_qp_path_counts['decoupled'] += 1
         else:
-            ret, nwsr, cputime = self.pos_qp.hotstart(
-                self.pos_H, self.pos_g, self.pos_A,
-                self.pos_lb, self.pos_ub,
-                self.pos_lbA, self.pos_ubA,
-                self.nwsr, self.cpu_time
-            )
+            self._solve_pos_qp_coupled()
+            self.pos_qp_decoupled = 0.0
+            self.pos_qp_path_counts['coupled'] += 1
+        self._pos_qp_is_initialized = True
+
+    def _solve_pos_qp_coupled(self):
+        """ Solve position QP for x and y at once """
+        ret, nwsr, cputime = self.pos_qp.solve(
+            self.pos_H, self.pos_g, self.pos_A,
+            self.pos_lb, self.pos_ub,
+            self.pos_lbA, self.pos_ubA,
+            self.nwsr, self.cpu_time
+        )
 
         # position primal solution
-        self.pos_qp.getPrimalSolution(self.pos_dofs)
+        self.pos_qp.get_primal_solution(self.pos_dofs)
 
         # save qp solver data
+        self.pos_qp_ret     = ret           # solver status
         self.pos_qp_nwsr    = nwsr          # working set recalculations
         self.pos_qp_cputime = cputime*1000. # in milliseconds
 
+    def _solve_pos_qp_decoupled(self):
+        """
+        Solve position QP as two independent QPs for x and y.
+
+        The Hessian of the position QP is block diagonal, only the
+        constraints couple x and y through the rotated hull normals. When
+        the support foot yaw is axis-aligned over the horizon, the CoP
+        constraints separate, but the edges of the foot position hulls are
+        not axis-aligned. Rows depending on x and y are therefore dropped,
+        which yields a relaxation of the position QP. Its solution is
+        optimal for the position QP, if it fulfills the dropped rows.
+
+        Returns
+        -------
+
+        success: bool
+            False if the support feet are rotated, one of the QPs fails or
+            the relaxation violates coupled constraints, then the coupled
+            QP has to be solved. The latter two are counted as 'fallback'
+            in pos_qp_path_counts.
+        """
+        # rename for convenience
+        nh = self.N + self.nf
+        ws = self.workspace
+        A  = self.pos_A
+
+        # rotated hull normals of axis-aligned feet have coefficients of
+        # round-off size, e.g. cos(pi/2)
+        eps = 1e-12*numpy.abs(A).max(axis=1)
+        in_x = numpy.abs(A[:,:nh]).max(axis=1) > eps
+        in_y = numpy.abs(A[:,nh:]).max(axis=1) > eps
+        coupled = in_x & in_y
+
+        # CoP constraints separate only for axis-aligned support feet
+        if coupled[:self.nc_cop].any():
+            return False
+
+        # rows of other coordinate and coupled rows stay free
+        problems = []
+        for c, sel, cols in (('x', in_x & ~in_y, slice(0, nh)), ('y', in_y & ~in_x, slice(nh, 2*nh))):
+            A_c   = getattr(ws, 'pos_A_'   + c)
+            lbA_c = getattr(ws, 'pos_lbA_' + c)
+            ubA_c = getattr(ws, 'pos_ubA_' + c)
+            A_c[...] = A[:,cols]
+            A_c[~sel] = 0.0
+            lbA_c[...] = numpy.where(sel, self.pos_lbA, -1e+08)
+            ubA_c[...] = numpy.where(sel, self.pos_ubA,  1e+08)
+            lb_c = getattr(ws, 'pos_lb_' + c)
+            ub_c = getattr(ws, 'pos_ub_' + c)
+            lb_c[...] = self.pos_lb[cols]
+            ub_c[...] = self.pos_ub[cols]
+            problems.append((
+                self.pos_H[cols,cols], self.pos_g[cols], A_c,
+                lb_c, ub_c, lbA_c, ubA_c, getattr(ws, 'pos_dofs_' + c)
+            ))
+
+        def solve(args):
+            qp, (H, g, A, lb, ub, lbA, ubA, dofs) = args
+            ret, nwsr, cputime = qp.solve(
+                H, g, A, lb, ub, lbA, ubA, self.nwsr, self.cpu_time
+            )
+            qp.get_primal_solution(dofs)
+            return ret, nwsr
+
+        t0 = time.time()
+        jobs = zip(self.pos_qp_xy, problems)
+        if self._xy_pool is not None:
+            results = self._xy_pool.map(solve, jobs)
+        else:
+            results = map(solve, jobs)
+        cputime = time.time() - t0
+        ret, nwsr = zip(*results)
+
+        if any(r != SUCCESSFUL_RETURN for r in ret):
+            self.pos_qp_path_counts['fallback'] += 1
+            return False
+
+        dofs = numpy.hstack((ws.pos_dofs_x, ws.pos_dofs_y))
+
+        # relaxation has to fulfill the coupled constraints
+        if coupled.any():
+            tol = 1e-08
+            Ax = A[coupled].dot(dofs)
+            if (Ax < self.pos_lbA[coupled] - tol).any() \
+            or (Ax > self.pos_ubA[coupled] + tol).any():
+                self.pos_qp_path_counts['fallback'] += 1
+                return False
+
+        self.pos_dofs[...] = dofs
+
+        # save qp solver data
+        self.pos_qp_ret     = SUCCESSFUL_RETURN
+        self.pos_qp_nwsr    = sum(nwsr)     # working set recalculations
+        self.pos_qp_cputime = cputime*1000. # in milliseconds
+        return True
+
     def _postprocess_solution(self):
         """ Get solution and put it back into generator data structures """
         # rename for convenience
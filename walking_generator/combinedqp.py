@@ -1,22 +1,16 @@
 import sys
+import time
 import numpy
 import utility
 import matplotlib.pyplot as plt
 
 from base import BaseGenerator
-from visualization import PlotData
+from constraints import CoPConstraint
+from datalog import PlotData
+from solvers import make_solver, default_solver
+from solvers import SUCCESSFUL_RETURN, RET_DEADLINE_MISSED
 from walking_generator.utility import color_matrix
 
-# Try to get qpOASES SQP Problem class
-try:
-    from qpoases import PyOptions as Options
-    from qpoases import PyPrintLevel as PrintLevel
-    from qpoases import PySQProblem as SQProblem
-    from qpoases import PySolutionAnalysis as SolutionAnalysis
-except ImportError:
-    err_str = 'Please install qpOASES python interface, else you will not be able to use this pattern generator.'
-    raise ImportError(err_str)
-
 class NMPCGenerator(BaseGenerator):
     """
     Implementation of the combined problems using NMPC techniques.
@@ -26,13 +20,31 @@ class NMPCGenerator(BaseGenerator):
     """
     def __init__(
         self, N=16, T=0.1, T_step=0.8,
-        fsm_state='D', fsm_sl=1
+        fsm_state='D', fsm_sl=1, solver=None, eliminate_equalities=False,
+        sqp_iterations=1
     ):
         """
         Initialize pattern generator matrices through base class
         and allocate two QPs one for optimzation of orientation and
         one for position of CoM and feet.
 
+        Parameters
+        ----------
+
+        solver: str
+            QP solver backend, cf. solvers.SOLVERS. Defaults to qpOASES when
+            available, else the native active set backend is used.
+
+        eliminate_equalities: bool
+            eliminate equality constraints, i.e. foot position and support
+            foot orientation freezing, by null space projection before the
+            solve, cf. solvers.NullSpaceSolver
+
+        sqp_iterations: int
+            maximum number of SQP iterations per control tick. 1 is the real
+            time iteration scheme applying the full Gauss-Newton step,
+            more iterations globalize the steps by a line search on an L1
+            merit function, cf. _sqp_iterations()
         """
         super(NMPCGenerator, self).__init__(
             N, T, T_step, fsm_state, fsm_sl
@@ -51,12 +63,18 @@ class NMPCGenerator(BaseGenerator):
         N  = self.N
         nf = self.nf
 
-        # define some qpOASES specific things
-        self.cpu_time = 0.1 # upper bound on CPU time, 0 is no upper limit
-        self.nwsr     = 100 # # of working set recalculations
-        self.options = Options()
-        self.options.setToMPC()
-        #self.options.printLevel = PrintLevel.LOW
+        # define some solver specific things
+        self.solver   = solver or default_solver()
+        self.eliminate_equalities = eliminate_equalities
+        self.cpu_time = 2.9  # upper bound on CPU time in s, 0 is no upper limit
+        self.nwsr     = 1000 # # of working set recalculations
+
+        # SQP settings, cf. _sqp_iterations
+        self.sqp_iterations = sqp_iterations
+        self.sqp_tol_step   = 1e-06  # tolerance of step infinity norm
+        self.sqp_tol_kkt    = 1e-06  # tolerance of KKT residual
+        self.sqp_alpha_min  = 0.0625 # smallest step length of line search
+        self.sqp_armijo     = 1e-04  # sufficient decrease of merit function
 
         # define variable dimensions
         # variables of:     position + orientation
@@ -82,10 +100,10 @@ class NMPCGenerator(BaseGenerator):
 
         # setup problem
         self.dofs = numpy.zeros(self.nv)
-        self.qp   = SQProblem(self.nv, self.nc)
-
-        # load NMPC options
-        self.qp.setOptions(self.options)
+        self.qp   = make_solver(
+            self.solver, self.nv, self.nc,
+            eliminate_equalities=eliminate_equalities
+        )
 
         self.qp_H   =  numpy.eye(self.nv,self.nv)
         self.qp_A   =  numpy.zeros((self.nc,self.nv))
@@ -101,8 +119,28 @@ class NMPCGenerator(BaseGenerator):
         self.qp_nwsr    = 0.0
         self.qp_cputime = 0.0
 
-        # setup analyzer for solution analysis
-        analyser = SolutionAnalysis()
+        # save solver status, CPU time budget of the QP in milliseconds and
+        # whether the shifted previous solution was used instead, cf. solve()
+        self.qp_ret      = 0.0
+        self.qp_budget   = 0.0
+        self.qp_fallback = 0.0
+
+        # multipliers of last QP solution
+        self.qp_y = numpy.zeros((self.nv + self.nc,), dtype=float)
+
+        # save SQP iterations, last step length, infinity norm of last step,
+        # KKT residual, merit function value and L1 constraint violation,
+        # NOTE the latter three are only evaluated for sqp_iterations > 1
+        self.sqp_iter  = 0.0
+        self.sqp_alpha = 0.0
+        self.sqp_step  = 0.0
+        self.sqp_kkt   = 0.0
+        self.sqp_merit = 0.0
+        self.sqp_viol  = 0.0
+
+        # controls at the begin of the line search and trial controls
+        self._sqp_U0 = numpy.zeros((self.nv,), dtype=float)
+        self._sqp_U  = numpy.zeros((self.nv,), dtype=float)
 
         # helper matrices for common expressions
         self.Hx     = numpy.zeros((1, 2*(N+nf)), dtype=float)
@@ -126,87 +164,259 @@ class NMPCGenerator(BaseGenerator):
         self.lbA_ori = numpy.zeros((self.nc_ori,),     dtype=float)
 
         self.derv_Acop_map = numpy.zeros((self.nc_cop, self.N), dtype=float)
+        self.derv_cop_constraint = CoPConstraint(self.N, self.nf, self.nFootEdge)
         self.derv_Afoot_map = numpy.zeros((self.nc_foot_position, self.N), dtype=float)
 
+        # maps of the QP rows for the receding horizon shift of the working
+        # set without and with change of support foot, cf. update
+        self._shift_row_maps = {
+            changed : self._shift_row_map(changed) for changed in (False, True)
+        }
+
         self._update_foot_selection_matrix()
 
+        # work buffers, cf. Workspace
+        ws = self.workspace
+        ws.allocate('p_res',         (N,))
+        ws.allocate('p_z',           (N,))
+        ws.allocate('p_tmp',         (N,))
+        ws.allocate('lbA_pos_tmp',   (self.nc_pos,))
+        ws.allocate('lbA_ori_tmp',   (self.nc_ori,))
+        ws.allocate('derv_cop',      (self.nc_cop,))
+        ws.allocate('derv_row',      (N,))
+        ws.allocate('derv_sel',      (N,))
+        ws.allocate('derv_q',        (N,))
+        ws.allocate('derv_foot',     (self.nc_foot_position,))
+        ws.allocate('derv_foot_tmp', (self.nc_foot_position,))
+
         # add additional keys that should be saved
         self._data_keys.append('qp_nwsr')
         self._data_keys.append('qp_cputime')
+        self._data_keys.append('qp_ret')
+        self._data_keys.append('qp_budget')
+        self._data_keys.append('qp_fallback')
+        self._data_keys.append('sqp_iter')
+        self._data_keys.append('sqp_alpha')
+        self._data_keys.append('sqp_step')
+        self._data_keys.append('sqp_kkt')
 
         # reinitialize plot data structure
         self.data = PlotData(self)
 
-    def solve(self):
-        """ Process and solve problem, s.t. pattern generator data is consistent """
-        self._preprocess_solution()
-        self._solve_qp()
-        self._postprocess_solution()
+    def solve(self, deadline=None):
+        """
+        Process and solve problem, s.t. pattern generator data is consistent
+
+        Parameters
+        ----------
+
+        deadline: float
+            absolute time in seconds, cf. time.time(), when the solution is
+            needed. The time left after preprocessing is the CPU time budget
+            of the QP solver. None solves with self.cpu_time.
+
+        .. NOTE:: When a deadline is given and the QP solver does not
+                  converge within the budget or the deadline already passed
+                  during preprocessing, the previous solution shifted by one
+                  sampling period in update() is kept.
+                  Further SQP iterations are only started before the
+                  deadline, an unsuccessful one keeps the last iterate.
+        """
+        caches = (self.gait_phase_cache, self.Pvu_gram.cache)
+        with self.workspace.check_allocations('_preprocess_solution', caches):
+            self._preprocess_solution()
+
+        if not self._solve_qp_until(deadline):
+            self.qp_fallback = 1.0
+            self.sqp_iter    = 0
+            return
+
+        self.qp_fallback = 0.0
+        if self.sqp_iterations > 1:
+            self._sqp_iterations(deadline)
+        else:
+            self.sqp_iter  = 1
+            self.sqp_alpha = 1.0
+            self.sqp_step  = numpy.abs(self.dofs).max()
+            self._postprocess_solution()
 
-    def _preprocess_solution(self):
-        """ Update matrices and get them into the QP data structures """
-        # rename for convenience
-        N  = self.N
-        nf = self.nf
+    def _solve_qp_until(self, deadline):
+        """
+        solve QP within the time left until deadline, returns whether the
+        step can be used, i.e. always without deadline
+        """
+        if deadline is None:
+            self._solve_qp(self.cpu_time)
+            return True
 
-        # dofs
-        dofs = self.dofs
+        budget = deadline - time.time()
+        if budget > 0.0:
+            self._solve_qp(budget)
+        else:
+            self.qp_ret     = RET_DEADLINE_MISSED
+            self.qp_nwsr    = 0
+            self.qp_cputime = 0.0
+            self.qp_budget  = 0.0
+        return self.qp_ret == SUCCESSFUL_RETURN
 
-        dddC_k_x  = self.dddC_k_x
-        F_k_x     = self.F_k_x
-        dddC_k_y  = self.dddC_k_y
-        F_k_y     = self.F_k_y
-        dddF_k_qR = self.dddF_k_qR
-        dddF_k_qL = self.dddF_k_qL
+    def _sqp_iterations(self, deadline):
+        """
+        SQP iterations on the nonlinear problem starting with the already
+        solved QP of the first linearization. Each step is globalized by a
+        backtracking line search on the L1 merit function
 
-        # inject dofs for convenience
-        # dofs = ( dddC_k_x ) N
-        #        (    F_k_x ) nf
-        #        ( dddC_k_y ) N
-        #        (    F_k_y ) nf
-        #        ( dddF_k_q ) N
-        #        ( dddF_k_q ) N
-        dofs[0  :0+N   ] = dddC_k_x
-        dofs[0+N:0+N+nf] = F_k_x
+        phi(U) = f(U) + mu * |c(U)|_1
 
-        a = N+nf
-        dofs[a  :a+N   ] = dddC_k_y
-        dofs[a+N:a+N+nf] = F_k_y
+        where c(U) is the violation of the CoP, foot position and
+        orientation constraints and mu exceeds the QP multipliers. The
+        iteration stops on small steps, small KKT residual of the new
+        linearization or after sqp_iterations QPs.
 
-        a = 2*(N+nf)
-        dofs[  a:a+N]    = dddF_k_qR
-        dofs[ -N:]       = dddF_k_qL
+        Parameters
+        ----------
 
-        # define position and orientation dofs
-        # U_k = ( U_k_xy, U_k_q).T
-        # U_k_xy = ( dddC_k_x ) N
-        #          (    F_k_x ) nf
-        #          ( dddC_k_y ) N
-        #          (    F_k_y ) nf
-        # U_k_q  = ( dddF_k_q ) N
-        #          ( dddF_k_q ) N
+        deadline: float
+            absolute time in seconds, cf. solve(), or None
+        """
+        # statistics summed up over all QPs of this tick
+        nwsr    = self.qp_nwsr
+        cputime = self.qp_cputime
+
+        mu = 0.0
+        self.sqp_iter = 0
+        while True:
+            self.sqp_iter += 1
+
+            # penalty parameter has to exceed the multipliers of the QP
+            self.qp.get_dual_solution(self.qp_y)
+            mu = max(mu, 2.0*numpy.abs(self.qp_y).max())
+
+            alpha = self._line_search(mu)
+            self.sqp_alpha = alpha
+            self.sqp_step  = alpha * numpy.abs(self.dofs).max()
+
+            # linearize at new iterate
+            caches = (self.gait_phase_cache, self.Pvu_gram.cache)
+            with self.workspace.check_allocations('_preprocess_solution', caches):
+                self._preprocess_solution()
+            self.sqp_kkt = self._kkt_residual()
+
+            if self.sqp_step <= self.sqp_tol_step \
+            or self.sqp_kkt  <= self.sqp_tol_kkt \
+            or self.sqp_iter >= self.sqp_iterations:
+                break
+
+            if deadline is not None and deadline - time.time() <= 0.0:
+                break
+
+            ok = self._solve_qp_until(deadline)
+            nwsr    += self.qp_nwsr
+            cputime += self.qp_cputime
+            if not ok:
+                break
+
+        self.qp_nwsr    = nwsr
+        self.qp_cputime = cputime
+
+    def _line_search(self, mu):
+        """
+        backtracking line search along QP step dofs from the current
+        controls, returns accepted step length. The controls are set to the
+        accepted iterate.
 
-        # position dofs
-        U_k    = self.dofs
-        U_k_xy = U_k[    :2*(N+nf)]
-        U_k_x  = U_k_xy[:(N+nf)]
-        U_k_y  = U_k_xy[(N+nf):]
+        Parameters
+        ----------
 
-        # orientation dofs
-        U_k_q   = U_k  [-2*N: ]
-        U_k_qR  = U_k_q[    :N]
-        U_k_qL  = U_k_q[   N: ]
+        mu: float
+            penalty parameter of the L1 merit function
+        """
+        U0 = self._sqp_U0
+        self._get_controls(U0)
+        phi0, viol0 = self._merit(mu)
 
-        # position dimensions
-        nU_k    = U_k.shape[0]
-        nU_k_xy = U_k_xy.shape[0]
-        nU_k_x  = U_k_x.shape[0]
-        nU_k_y  = U_k_y.shape[0]
+        # directional derivative of merit function along QP step,
+        # NOTE qp_g is the gradient of the objective at U0
+        D = self.qp_g.dot(self.dofs) - mu * viol0
 
-        # orientation dimensions
-        nU_k_q  = U_k_q.shape[0]
-        nU_k_qR = U_k_qR.shape[0]
-        nU_k_qL = U_k_qL.shape[0]
+        alpha = 1.0
+        while True:
+            self._set_controls(U0)
+            self._postprocess_solution(alpha)
+            phi, viol = self._merit(mu)
+
+            if D >= 0.0 \
+            or phi <= phi0 + self.sqp_armijo * alpha * D \
+            or alpha <= self.sqp_alpha_min:
+                break
+            alpha *= 0.5
+
+        self.sqp_merit = phi
+        self.sqp_viol  = viol
+        return alpha
+
+    def _merit(self, mu):
+        """
+        evaluate L1 merit function at the current controls, returns merit
+        function value and L1 constraint violation
+
+        .. NOTE:: rebuilds constraints at the current controls
+        """
+        # rename for convenience
+        N  = self.N
+        nf = self.nf
+
+        U = self._sqp_U
+        self._get_controls(U)
+
+        self.simulate()
+        self.buildConstraints()
+        self._calculate_common_expressions()
+
+        # objective is exactly quadratic, i.e. Gauss-Newton Hessian is exact
+        # f(U) = 1/2 * U^T * H * U + p^T * U
+        f = 0.5 * U.dot(self.qp_H.dot(U))
+        a = N + nf
+        f += U[:a].dot(self.p_k_x) + U[a:2*a].dot(self.p_k_y)
+        a = 2*(N + nf)
+        f += U[a:a+N].dot(self.p_k_qR) + U[-N:].dot(self.p_k_qL)
+
+        # L1 norm of constraint violation
+        viol = 0.0
+        for A, lbA, ubA, V in (
+            (self.A_pos_x, self.lbA_pos, self.ubA_pos, U[:2*(N+nf)]),
+            (self.A_ori,   self.lbA_ori, self.ubA_ori, U[-2*N:]),
+        ):
+            c = A.dot(V)
+            viol += numpy.maximum(c - ubA, 0.0).sum()
+            viol += numpy.maximum(lbA - c, 0.0).sum()
+
+        return f + mu * viol, viol
+
+    def _kkt_residual(self):
+        """
+        KKT residual at the current linearization, i.e. infinity norm of
+        stationarity with the multipliers of the last QP and of the
+        constraint violation
+        """
+        nv = self.nv
+        y  = self.qp_y
+
+        # H * 0 + g = C^T * y with C = (I, A^T)^T
+        res = self.qp_g - y[:nv] - self.qp_A.transpose().dot(y[nv:])
+        stat = numpy.abs(res).max()
+
+        # linearized constraints are violated at zero step
+        viol = max(
+            0.0,
+            self.qp_lbA.max(), -self.qp_ubA.min(),
+            self.qp_lb.max(),  -self.qp_ub.min(),
+        )
+        return max(stat, viol)
+
+    def _preprocess_solution(self):
+        """ Update matrices and get them into the QP data structures """
+        # inject dofs for convenience
+        self._get_controls(self.dofs)
 
         # initialize with actual values, else take last known solution
         # NOTE for warmstart last solution is taken from qpOASES internal memory
@@ -217,23 +427,49 @@ class NMPCGenerator(BaseGenerator):
 
         # calculate some common sub expressions
         self._calculate_common_expressions()
+        self._calculate_gradients()
 
         # calculate Jacobian parts that are non-trivial, i.e. wrt. to orientation
         self._calculate_derivatives()
 
+        # get them into the QP data structures
+        self._update_qp_matrices()
+        self._update_qp_vectors()
+
+    def _update_qp_matrices(self):
+        """ copy Hessian and constraint Jacobian into QP data structures """
+        # rename for convenience
+        N  = self.N
+        nf = self.nf
+
+        # define position and orientation dofs
+        # U_k = ( U_k_xy, U_k_q).T
+        # U_k_xy = ( dddC_k_x ) N
+        #          (    F_k_x ) nf
+        #          ( dddC_k_y ) N
+        #          (    F_k_y ) nf
+        # U_k_q  = ( dddF_k_q ) N
+        #          ( dddF_k_q ) N
+
+        # position dimensions
+        nU_k_xy = 2*(N+nf)
+        nU_k_x  = N+nf
+        nU_k_y  = N+nf
+
+        # orientation dimensions
+        nU_k_q  = 2*N
+        nU_k_qR = N
+        nU_k_qL = N
+
         # POSITION QP
         # rename matrices
         Q_k_x = self.Q_k_x
         Q_k_y = self.Q_k_x # NOTE it's exactly the same!
-        p_k_x = self.p_k_x
-        p_k_y = self.p_k_y
 
         # ORIENTATION QP
         # rename matrices
         Q_k_qR = self.Q_k_qR
         Q_k_qL = self.Q_k_qL
-        p_k_qR = self.p_k_qR
-        p_k_qL = self.p_k_qL
 
         # define QP matrices
         # Gauss-Newton Hessian approximation
@@ -253,6 +489,54 @@ class NMPCGenerator(BaseGenerator):
         Hqq[-nU_k_qL:,-nU_k_qL:] = Q_k_qL
         #self.qp_H[...] = numpy.eye(self.nv)
 
+        # CONSTRAINTS
+        # A = ( A_xy, A_xyq )
+        #     (    0, A_q   )
+        A_xy   = self.qp_A  [:self.nc_pos,:nU_k_xy]
+        A_xyq  = self.qp_A  [:self.nc_pos,-nU_k_q:]
+        A_q    = self.qp_A  [-self.nc_ori:,-nU_k_q:]
+
+        A_xy[...]   = self.A_pos_x
+        A_xyq[...]  = self.A_pos_q
+        A_q[...]    = self.A_ori
+
+    def _update_qp_vectors(self):
+        """ update QP gradient and constraint bounds at current dofs """
+        # rename for convenience
+        N  = self.N
+        nf = self.nf
+
+        # position dofs
+        U_k    = self.dofs
+        U_k_xy = U_k[    :2*(N+nf)]
+        U_k_x  = U_k_xy[:(N+nf)]
+        U_k_y  = U_k_xy[(N+nf):]
+
+        # orientation dofs
+        U_k_q   = U_k  [-2*N: ]
+        U_k_qR  = U_k_q[    :N]
+        U_k_qL  = U_k_q[   N: ]
+
+        # position dimensions
+        nU_k_xy = U_k_xy.shape[0]
+        nU_k_x  = U_k_x.shape[0]
+        nU_k_y  = U_k_y.shape[0]
+
+        # orientation dimensions
+        nU_k_q  = U_k_q.shape[0]
+        nU_k_qR = U_k_qR.shape[0]
+        nU_k_qL = U_k_qL.shape[0]
+
+        # rename matrices
+        Q_k_x  = self.Q_k_x
+        Q_k_y  = self.Q_k_x # NOTE it's exactly the same!
+        p_k_x  = self.p_k_x
+        p_k_y  = self.p_k_y
+        Q_k_qR = self.Q_k_qR
+        Q_k_qL = self.Q_k_qL
+        p_k_qR = self.p_k_qR
+        p_k_qL = self.p_k_qL
+
         # Gradient of Objective
         # define sub blocks
         # g = (gx)
@@ -261,40 +545,134 @@ class NMPCGenerator(BaseGenerator):
         gq = self.qp_g[-nU_k_q:]
 
         # gx = ( U_k_x.T Q_k_x + p_k_x )
-        gx[ :nU_k_x] = U_k_x.dot(Q_k_x) + p_k_x
-        gx[-nU_k_y:] = U_k_y.dot(Q_k_y) + p_k_y
-
+        for g, U, Q, p in (
+            (gx[ :nU_k_x],  U_k_x,  Q_k_x,  p_k_x),
+            (gx[-nU_k_y:],  U_k_y,  Q_k_y,  p_k_y),
         # gq = ( U_k_q.T Q_k_q + p_k_q )
-        gq[ :nU_k_qR] = U_k_qR.dot(Q_k_qR) + p_k_qR
-        gq[-nU_k_qL:] = U_k_qL.dot(Q_k_qL) + p_k_qL
+            (gq[ :nU_k_qR], U_k_qR, Q_k_qR, p_k_qR),
+            (gq[-nU_k_qL:], U_k_qL, Q_k_qL, p_k_qL),
+        ):
+            numpy.dot(U, Q, out=g)
+            numpy.add(g, p, out=g)
 
         # CONSTRAINTS
-        # A = ( A_xy, A_xyq )
-        #     (    0, A_q   )
-        A_xy   = self.qp_A  [:self.nc_pos,:nU_k_xy]
-        A_xyq  = self.qp_A  [:self.nc_pos,-nU_k_q:]
         lbA_xy = self.qp_lbA[:self.nc_pos]
         ubA_xy = self.qp_ubA[:self.nc_pos]
-
-        A_q   = self.qp_A  [-self.nc_ori:,-nU_k_q:]
-        lbA_q = self.qp_lbA[-self.nc_ori:]
-        ubA_q = self.qp_ubA[-self.nc_ori:]
+        lbA_q  = self.qp_lbA[-self.nc_ori:]
+        ubA_q  = self.qp_ubA[-self.nc_ori:]
 
         # linearized constraints are given by
         # lbA - A * U_k <= nablaA * Delta_U_k <= ubA - A * U_k
-        A_xy[...]   = self.A_pos_x
-        A_xyq[...]  = self.A_pos_q
-        lbA_xy[...] = self.lbA_pos - self.A_pos_x.dot(U_k_xy)
-        ubA_xy[...] = self.ubA_pos - self.A_pos_x.dot(U_k_xy)
+        ws = self.workspace
+        tmp = numpy.dot(self.A_pos_x, U_k_xy, out=ws.lbA_pos_tmp)
+        numpy.subtract(self.lbA_pos, tmp, out=lbA_xy)
+        numpy.subtract(self.ubA_pos, tmp, out=ubA_xy)
+
+        tmp = numpy.dot(self.A_ori, U_k_q, out=ws.lbA_ori_tmp)
+        numpy.subtract(self.lbA_ori, tmp, out=lbA_q)
+        numpy.subtract(self.ubA_ori, tmp, out=ubA_q)
+
+    def _get_controls(self, dofs):
+        """ copy controls into dofs vector """
+        # rename for convenience
+        N  = self.N
+        nf = self.nf
+
+        # dofs = ( dddC_k_x ) N
+        #        (    F_k_x ) nf
+        #        ( dddC_k_y ) N
+        #        (    F_k_y ) nf
+        #        ( dddF_k_q ) N
+        #        ( dddF_k_q ) N
+        dofs[0  :0+N   ] = self.dddC_k_x
+        dofs[0+N:0+N+nf] = self.F_k_x
+
+        a = N+nf
+        dofs[a  :a+N   ] = self.dddC_k_y
+        dofs[a+N:a+N+nf] = self.F_k_y
 
-        A_q[...]   = self.A_ori
-        lbA_q[...] = self.lbA_ori - self.A_ori.dot(U_k_q)
-        ubA_q[...] = self.ubA_ori - self.A_ori.dot(U_k_q)
+        a = 2*(N+nf)
+        dofs[  a:a+N]    = self.dddF_k_qR
+        dofs[ -N:]       = self.dddF_k_qL
+
+    def _set_controls(self, dofs):
+        """ copy dofs vector into controls, cf. _get_controls """
+        # rename for convenience
+        N  = self.N
+        nf = self.nf
+
+        self.dddC_k_x[:]  = dofs[0  :0+N   ]
+        self.F_k_x[:]     = dofs[0+N:0+N+nf]
+
+        a = N+nf
+        self.dddC_k_y[:]  = dofs[a  :a+N   ]
+        self.F_k_y[:]     = dofs[a+N:a+N+nf]
+
+        a = 2*(N+nf)
+        self.dddF_k_qR[:] = dofs[  a:a+N]
+        self.dddF_k_qL[:] = dofs[ -N:]
 
     def _calculate_common_expressions(self):
         """
         encapsulation of complicated matrix assembly of former orientation and
-        position QP sub matrices
+        position QP sub matrices, the linear parts of the objective are
+        calculated by _calculate_gradients
+        """
+        # HESSIAN BLOCKS
+        # NOTE Q_k_x, Q_k_qR, Q_k_qL only depend on the gait phase and are
+        #      cached, cf. _update_hessian_blocks
+        phase = self._gait_phase_matrices()
+        self.Q_k_x [...] = phase['Q_k_x']
+        self.Q_k_qR[...] = phase['Q_k_qR']
+        self.Q_k_qL[...] = phase['Q_k_qL']
+
+        # LINEAR CONSTRAINTS
+        # CoP constraints
+        a = 0
+        b = self.nc_cop
+        self.cop_constraint.dense(out=self.A_pos_x[a:b])
+        self.lbA_pos[a:b] = self.lbBcop
+        self.ubA_pos[a:b] = self.ubBcop
+
+        #foot inequality constraints
+        a = self.nc_cop
+        b = self.nc_cop + self.nc_foot_position
+        self.A_pos_x[a:b] = self.Afoot
+        self.lbA_pos[a:b] = self.lbBfoot
+        self.ubA_pos[a:b] = self.ubBfoot
+
+        #foot equality constraints
+        a = self.nc_cop + self.nc_foot_position
+        b = self.nc_cop + self.nc_foot_position + self.nc_fchange_eq
+        self.A_pos_x[a:b] = self.eqAfoot
+        self.lbA_pos[a:b] = self.eqBfoot
+        self.ubA_pos[a:b] = self.eqBfoot
+
+        # velocity constraints on support foot to freeze movement
+        a = 0
+        b = self.nc_fvel_eq
+        self.A_ori  [a:b] = self.A_fvel_eq
+        self.lbA_ori[a:b] = self.B_fvel_eq
+        self.ubA_ori[a:b] = self.B_fvel_eq
+
+        # box constraints for maximum orientation change
+        a = self.nc_fvel_eq
+        b = self.nc_fvel_eq + self.nc_fpos_ineq
+        self.A_ori  [a:b] = self.A_fpos_ineq
+        self.lbA_ori[a:b] = self.lbB_fpos_ineq
+        self.ubA_ori[a:b] = self.ubB_fpos_ineq
+
+        # box constraints for maximum angular velocity
+        a = self.nc_fvel_eq + self.nc_fpos_ineq
+        b = self.nc_fvel_eq + self.nc_fpos_ineq + self.nc_fvel_ineq
+        self.A_ori  [a:b] = self.A_fvel_ineq
+        self.lbA_ori[a:b] = self.lbB_fvel_ineq
+        self.ubA_ori[a:b] = self.ubB_fvel_ineq
+
+    def _calculate_gradients(self):
+        """
+        calculate linear parts p_k_x, p_k_y, p_k_qR, p_k_qL of the objective,
+        which only depend on the initial states and references
         """
         #rename for convenience
         N  = self.N
@@ -302,14 +680,9 @@ class NMPCGenerator(BaseGenerator):
 
         # weights
         alpha = self.a
-        beta  = self.b
         gamma = self.c
-        delta = self.d
 
         # matrices
-        E_FR = self.E_FR
-        E_FL = self.E_FL
-
         Pvs = self.Pvs
         Pvu = self.Pvu
         Pzs = self.Pzs
@@ -329,6 +702,87 @@ class NMPCGenerator(BaseGenerator):
         dC_kp1_y_ref = self.dC_kp1_y_ref
         dC_kp1_q_ref = self.dC_kp1_q_ref
 
+        # POSITION QP MATRICES
+        ws  = self.workspace
+        res = ws.p_res
+        z   = ws.p_z
+        tmp = ws.p_tmp
+
+        # p_k_x = ( p_k_xX ), p_k_y analog
+        #         ( p_k_xF )
+        # p_k_xX = (  0.5 * a * Pvu^T * Pvu + c * Pzu^T * Pzu + d * I )
+        # p_k_xF = ( -0.5 * c * Pzu^T * V_kp1 )
+        # i.e. p_k_xX = a * Pvu^T * (Pvs * c_k_x - dC_kp1_x_ref)
+        #             + c * Pzu^T * (Pzs * c_k_x - v_kp1 * f_k_x)
+        #      p_k_xF = -c * V_kp1^T * (Pzs * c_k_x - v_kp1 * f_k_x)
+        for p_k, c_k, f_k, dC_kp1_ref in (
+            (self.p_k_x, c_k_x, f_k_x, dC_kp1_x_ref),
+            (self.p_k_y, c_k_y, f_k_y, dC_kp1_y_ref),
+        ):
+            p_k_X = p_k[   :N]
+            p_k_F = p_k[-nf: ]
+
+            numpy.dot(Pvs, c_k, out=res)
+            numpy.subtract(res, dC_kp1_ref, out=res)
+            numpy.dot(Pvu.transpose(), res, out=p_k_X)
+            numpy.multiply(p_k_X, alpha, out=p_k_X)
+
+            numpy.dot(Pzs, c_k, out=z)
+            numpy.multiply(v_kp1, f_k, out=tmp)
+            numpy.subtract(z, tmp, out=z)
+            numpy.dot(Pzu.transpose(), z, out=tmp)
+            numpy.multiply(tmp, gamma, out=tmp)
+            numpy.add(p_k_X, tmp, out=p_k_X)
+
+            numpy.dot(V_kp1.transpose(), z, out=p_k_F)
+            numpy.multiply(p_k_F, -gamma, out=p_k_F)
+
+        # ORIENTATION QP MATRICES
+        # p_k_qR = (       a * Pvu^T * E_FR^T * (E_FR * Pvs * f_k_qR + dC_kp1_q_ref) )
+        # p_k_qL = (       a * Pvu^T * E_FL^T * (E_FL * Pvs * f_k_qL + dC_kp1_q_ref) )
+        # NOTE E_FR, E_FL are diagonal 0/1 selectors, hence
+        #      E_FR^T * (E_FR * v - w) = E_FR_mask * (v - w)
+        for p_k_q, f_k_q, mask in (
+            (self.p_k_qR, f_k_qR, self.E_FR_mask),
+            (self.p_k_qL, f_k_qL, self.E_FL_mask),
+        ):
+            numpy.dot(Pvs, f_k_q, out=res)
+            numpy.subtract(res, dC_kp1_q_ref, out=res)
+            numpy.multiply(res, mask, out=res)
+            numpy.dot(Pvu.transpose(), res, out=p_k_q)
+            numpy.multiply(p_k_q, alpha, out=p_k_q)
+
+    def _build_gait_phase_matrices(self):
+        """ extend gait phase matrices by Hessian blocks """
+        matrices = super(NMPCGenerator, self)._build_gait_phase_matrices()
+
+        self._update_hessian_blocks()
+        matrices['Q_k_x']  = self.Q_k_x.copy()
+        matrices['Q_k_qR'] = self.Q_k_qR.copy()
+        matrices['Q_k_qL'] = self.Q_k_qL.copy()
+
+        return matrices
+
+    def _update_hessian_blocks(self):
+        """
+        update Hessian blocks Q_k_x, Q_k_qR, Q_k_qL of former orientation and
+        position QP
+        """
+        #rename for convenience
+        N  = self.N
+        nf = self.nf
+
+        # weights
+        alpha = self.a
+        gamma = self.c
+        delta = self.d
+
+        # matrices
+        Pvu = self.Pvu
+        Pzu = self.Pzu
+
+        V_kp1 = self.V_kp1
+
         # POSITION QP MATRICES
         # Q_k_x = ( Q_k_xXX Q_k_xXF ) = Q_k_y
         #         ( Q_k_xFX Q_k_xFF )
@@ -354,6 +808,9 @@ class NMPCGenerator(BaseGenerator):
         # Q_k_xXF = ( -0.5 * c * Pzu^T * V_kp1 )
         # Q_k_xFX = ( -0.5 * c * Pzu^T * V_kp1 )^T
         # Q_k_xFF = (  0.5 * c * V_kp1^T * V_kp1 )
+        # NOTE all blocks depend on the weights, on h_com through Pzu and
+        #      on V_kp1, which are part of the gait phase key, i.e. they are
+        #      recomputed from scratch on each miss of the gait phase cache.
         Q_k_xXX[...] = (
               alpha * Pvu.transpose().dot(Pvu)
             + gamma * Pzu.transpose().dot(Pzu)
@@ -363,88 +820,17 @@ class NMPCGenerator(BaseGenerator):
         Q_k_xFX[...] = Q_k_xXF.transpose()
         Q_k_xFF[...] =   gamma * V_kp1.transpose().dot(V_kp1)
 
-        # p_k_x = ( p_k_xX )
-        #         ( p_k_xF )
-        p_k_x = self.p_k_x
-        p_k_xX = p_k_x[   :N]
-        p_k_xF = p_k_x[-nf: ]
-
-        # p_k_xX = (  0.5 * a * Pvu^T * Pvu + c * Pzu^T * Pzu + d * I )
-        # p_k_xF = ( -0.5 * c * Pzu^T * V_kp1 )
-        p_k_xX[...] = alpha * Pvu.transpose().dot(  Pvs.dot(c_k_x) - dC_kp1_x_ref) \
-                    + gamma * Pzu.transpose().dot(  Pzs.dot(c_k_x) - v_kp1.dot(f_k_x))
-        p_k_xF[...] =-gamma * V_kp1.transpose().dot(Pzs.dot(c_k_x) - v_kp1.dot(f_k_x))
-
-        # p_k_y = ( p_k_yX )
-        #         ( p_k_yF )
-        p_k_y = self.p_k_y
-        p_k_yX = p_k_y[   :N]
-        p_k_yF = p_k_y[-nf: ]
-
-        # p_k_yX = (  0.5 * a * Pvu^T * Pvu + c * Pzu^T * Pzu + d * I )
-        # p_k_yF = ( -0.5 * c * Pzu^T * V_kp1 )
-        p_k_yX[...] = alpha * Pvu.transpose().dot(  Pvs.dot(c_k_y) - dC_kp1_y_ref) \
-                    + gamma * Pzu.transpose().dot(  Pzs.dot(c_k_y) - v_kp1.dot(f_k_y))
-        p_k_yF[...] =-gamma * V_kp1.transpose().dot(Pzs.dot(c_k_y) - v_kp1.dot(f_k_y))
-
         # ORIENTATION QP MATRICES
+        # NOTE E_FR, E_FL are diagonal 0/1 selectors, hence
+        #      Pvu^T * E_FR^T * E_FR * Pvu = Pvu[E_FR_mask]^T * Pvu[E_FR_mask]
+        #      which is cached per support pattern
         # Q_k_qR = ( 0.5 * a * Pvu^T * E_FR^T *  E_FR * Pvu )
         Q_k_qR = self.Q_k_qR
-        Q_k_qR[...] = alpha * Pvu.transpose().dot(E_FR.transpose()).dot(E_FR).dot(Pvu)
-
-        # p_k_qR = (       a * Pvu^T * E_FR^T * (E_FR * Pvs * f_k_qR + dC_kp1_q_ref) )
-        p_k_qR = self.p_k_qR
-        p_k_qR[...] = alpha * Pvu.transpose().dot(E_FR.transpose()).dot(E_FR.dot(Pvs).dot(f_k_qR) - dC_kp1_q_ref)
+        Q_k_qR[...] = alpha * self.Pvu_gram(self.E_FR_mask)
 
         # Q_k_qL = ( 0.5 * a * Pvu^T * E_FL^T *  E_FL * Pvu )
         Q_k_qL = self.Q_k_qL
-        Q_k_qL[...] = alpha * Pvu.transpose().dot(E_FL.transpose()).dot(E_FL).dot(Pvu)
-        # p_k_qL = (       a * Pvu^T * E_FL^T * (E_FL * Pvs * f_k_qL + dC_kp1_q_ref) )
-        p_k_qL = self.p_k_qL
-        p_k_qL[...] = alpha * Pvu.transpose().dot(E_FL.transpose()).dot(E_FL.dot(Pvs).dot(f_k_qL) - dC_kp1_q_ref)
-
-        # LINEAR CONSTRAINTS
-        # CoP constraints
-        a = 0
-        b = self.nc_cop
-        self.A_pos_x[a:b] = self.Acop
-        self.lbA_pos[a:b] = self.lbBcop
-        self.ubA_pos[a:b] = self.ubBcop
-
-        #foot inequality constraints
-        a = self.nc_cop
-        b = self.nc_cop + self.nc_foot_position
-        self.A_pos_x[a:b] = self.Afoot
-        self.lbA_pos[a:b] = self.lbBfoot
-        self.ubA_pos[a:b] = self.ubBfoot
-
-        #foot equality constraints
-        a = self.nc_cop + self.nc_foot_position
-        b = self.nc_cop + self.nc_foot_position + self.nc_fchange_eq
-        self.A_pos_x[a:b] = self.eqAfoot
-        self.lbA_pos[a:b] = self.eqBfoot
-        self.ubA_pos[a:b] = self.eqBfoot
-
-        # velocity constraints on support foot to freeze movement
-        a = 0
-        b = self.nc_fvel_eq
-        self.A_ori  [a:b] = self.A_fvel_eq
-        self.lbA_ori[a:b] = self.B_fvel_eq
-        self.ubA_ori[a:b] = self.B_fvel_eq
-
-        # box constraints for maximum orientation change
-        a = self.nc_fvel_eq
-        b = self.nc_fvel_eq + self.nc_fpos_ineq
-        self.A_ori  [a:b] = self.A_fpos_ineq
-        self.lbA_ori[a:b] = self.lbB_fpos_ineq
-        self.ubA_ori[a:b] = self.ubB_fpos_ineq
-
-        # box constraints for maximum angular velocity
-        a = self.nc_fvel_eq + self.nc_fpos_ineq
-        b = self.nc_fvel_eq + self.nc_fpos_ineq + self.nc_fvel_ineq
-        self.A_ori  [a:b] = self.A_fvel_ineq
-        self.lbA_ori[a:b] = self.lbB_fvel_ineq
-        self.ubA_ori[a:b] = self.ubB_fvel_ineq
+        Q_k_qL[...] = alpha * self.Pvu_gram(self.E_FL_mask)
 
     def _calculate_derivatives(self):
         """ calculate the Jacobian of the constraints function """
@@ -453,200 +839,108 @@ class NMPCGenerator(BaseGenerator):
         # build the constraint enforcing the center of pressure to stay inside
         # the support polygon given through the convex hull of the foot.
 
-        # define dummy values
-        # D_kp1 = (D_kp1x, Dkp1_y)
-        D_kp1  = numpy.zeros( (self.nFootEdge*self.N, 2*self.N), dtype=float )
-        D_kp1x = D_kp1[:, :self.N] # view on big matrix
-        D_kp1y = D_kp1[:,-self.N:] # view on big matrix
-        b_kp1 = numpy.zeros( (self.nFootEdge*self.N,), dtype=float )
-
         # change entries according to support order changes in D_kp1
-        theta_vec = [self.f_k_q,self.F_k_q[0],self.F_k_q[1]]
-        for i in range(self.N):
-            theta = theta_vec[self.supportDeque[i].stepNumber]
-
-            # NOTE THIS CHANGES DUE TO APPLYING THE DERIVATIVE!
-            rotMat = numpy.array([
-                # old
-                # [ cos(theta), sin(theta)],
-                # [-sin(theta), cos(theta)]
-                # new: derivative wrt to theta
-                [-numpy.sin(theta), numpy.cos(theta)],
-                [-numpy.cos(theta),-numpy.sin(theta)]
-            ])
-
-            if self.supportDeque[i].foot == "left" :
-                A0 = self.A0lf.dot(rotMat)
-                B0 = self.ubB0lf
-                D0 = self.A0dlf.dot(rotMat)
-                d0 = self.ubB0dlf
-            else :
-                A0 = self.A0rf.dot(rotMat)
-                B0 = self.ubB0rf
-                D0 = self.A0drf.dot(rotMat)
-                d0 = self.ubB0drf
-
-            # get support foot and check if it is double support
-            for j in range(self.nf):
-                if self.V_kp1[i,j] == 1:
-                    if self.fsm_states[j] == 'D':
-                        A0 = D0
-                        B0 = d0
-                else:
-                    pass
-
-            for k in range(self.nFootEdge):
-                # get d_i+1^x(f^theta)
-                D_kp1x[i*self.nFootEdge+k, i] = A0[k][0]
-                # get d_i+1^y(f^theta)
-                D_kp1y[i*self.nFootEdge+k, i] = A0[k][1]
-                # get right hand side of equation
-                b_kp1 [i*self.nFootEdge+k]    = B0[k]
+        # NOTE THIS CHANGES DUE TO APPLYING THE DERIVATIVE!
+        A0, B0 = self._calculate_cop_hull_systems(derivative=True)
 
         #rename for convenience
         N  = self.N
         nf = self.nf
-        PzuV  = self.PzuV
-        PzuVx = self.PzuVx
-        PzuVy = self.PzuVy
-        PzsC  = self.PzsC
-        PzsCx = self.PzsCx
-        PzsCy = self.PzsCy
-        v_kp1fc   = self.v_kp1fc
-        v_kp1fc_x = self.v_kp1fc_x
-        v_kp1fc_y = self.v_kp1fc_y
-
-        # build constraint transformation matrices
-        # PzuV = ( PzuVx )
-        #        ( PzuVy )
-
-        # PzuVx = ( Pzu | -V_kp1 |   0 |      0 )
-        PzuVx[:,      :self.N        ] =  self.Pzu # TODO this is constant in matrix and should go into the build up matrice part
-        PzuVx[:,self.N:self.N+self.nf] = -self.V_kp1
-
-        # PzuVy = (   0 |      0 | Pzu | -V_kp1 )
-        PzuVy[:,-self.N-self.nf:-self.nf] =  self.Pzu # TODO this is constant in matrix and should go into the build up matrice part
-        PzuVy[:,       -self.nf:       ] = -self.V_kp1
-
-        # PzuV = ( PzsCx ) = ( Pzs * c_k_x)
-        #        ( PzsCy )   ( Pzs * c_k_y)
-        PzsCx[...] = self.Pzs.dot(self.c_k_x) #+ self.v_kp1.dot(self.f_k_x)
-        PzsCy[...] = self.Pzs.dot(self.c_k_y) #+ self.v_kp1.dot(self.f_k_y)
-
-        # v_kp1fc = ( v_kp1fc_x ) = ( v_kp1 * f_k_x)
-        #           ( v_kp1fc_y )   ( v_kp1 * f_k_y)
-        v_kp1fc_x[...] = self.v_kp1.dot(self.f_k_x)
-        v_kp1fc_y[...] = self.v_kp1.dot(self.f_k_y)
+        derv_cop = self.derv_cop_constraint
+
+        # get d_i+1^x(f^theta), d_i+1^y(f^theta)
+        derv_cop.dx[...] = A0[:,:,0]
+        derv_cop.dy[...] = A0[:,:,1]
+
+        # build constraint transformation, i.e. D_kp1 * PzuV
+        # PzuV = ( PzuVx ) = ( Pzu | -V_kp1 |   0 |      0 )
+        #        ( PzuVy )   (   0 |      0 | Pzu | -V_kp1 )
+        derv_cop.update(self.Pzu, self.V_kp1)
 
         # build CoP linear constraints
-        # NOTE D_kp1 is member and D_kp1 = ( D_kp1x | D_kp1y )
+        # NOTE D_kp1 = ( D_kp1x | D_kp1y ) is block diagonal and
         #      D_kp1x,y contains entries from support polygon
-        dummy = D_kp1.dot(PzuV)
-        dummy = dummy.dot(self.dofs[:2*(N+nf)])
+        dummy = derv_cop.dot(self.dofs[:2*(N+nf)], out=self.workspace.derv_cop)
 
         # CoP constraints
+        # NOTE E_FR_bar = diag(E_FL_mask) and E_FL_bar = diag(E_FR_mask),
+        #      the resulting row is the same for all constraints
         a = 0
         b = self.nc_cop
-        self.A_pos_q[a:b, :N] = \
-           dummy.dot(self.derv_Acop_map).dot(self.E_FR_bar).dot(self.Ppu)
-
-        self.A_pos_q[a:b,-N:] = \
-            dummy.dot(self.derv_Acop_map).dot(self.E_FL_bar).dot(self.Ppu)
+        self._derivative_rows(dummy, self.derv_Acop_map, self.A_pos_q[a:b])
 
         # FOOT POSITION CONSTRAINTS
         # defined on the horizon
         # inequality constraint on both feet A u + B <= 0
         # A0 R(theta) [Fx_k+1 - Fx_k] <= ubB0
         #             [Fy_k+1 - Fy_k]
-
-        matSelec = numpy.array([ [1, 0],[-1, 1] ])
-        footSelec = numpy.array([ [self.f_k_x, 0],[self.f_k_y, 0] ])
-        theta_vec = [self.f_k_q, self.F_k_q[0]]
-
-        # rotation matrice from F_k+1 to F_k
         # NOTE THIS CHANGES DUE TO APPLYING THE DERIVATIVE!
-        rotMat1 = numpy.array([
-            # old
-            # [cos(theta_vec[0]), sin(theta_vec[0])],
-            # [-sin(theta_vec[0]), cos(theta_vec[0])]
-            # new: derivative wrt to theta
-            [-numpy.sin(theta_vec[0]), numpy.cos(theta_vec[0])],
-            [-numpy.cos(theta_vec[0]),-numpy.sin(theta_vec[0])]
-        ])
-        rotMat2 = numpy.array([
-            # old
-            # [cos(theta_vec[1]), sin(theta_vec[1])],
-            # [-sin(theta_vec[1]), cos(theta_vec[1])]
-            # new
-            [-numpy.sin(theta_vec[1]), numpy.cos(theta_vec[1])],
-            [-numpy.cos(theta_vec[1]),-numpy.sin(theta_vec[1])]
-        ])
-        nf = self.nf
-        nEdges = self.A0l.shape[0]
-        N = self.N
-        ncfoot = nf * nEdges
-
-        if self.currentSupport.foot == "left":
-            A_f1 = self.A0r.dot(rotMat1)
-            A_f2 = self.A0l.dot(rotMat2)
-        else :
-            A_f1 = self.A0l.dot(rotMat1)
-            A_f2 = self.A0r.dot(rotMat2)
-
-        tmp1 = numpy.array( [A_f1[:,0],numpy.zeros((nEdges,),dtype=float)] )
-        tmp2 = numpy.array( [numpy.zeros((nEdges,),dtype=float),A_f2[:,0]] )
-        tmp3 = numpy.array( [A_f1[:,1],numpy.zeros((nEdges,),dtype=float)] )
-        tmp4 = numpy.array( [numpy.zeros(nEdges,),A_f2[:,1]] )
-
-        X_mat = numpy.concatenate( (tmp1.T,tmp2.T) , 0)
-        A0x = X_mat.dot(matSelec)
-        Y_mat = numpy.concatenate( (tmp3.T,tmp4.T) , 0)
-        A0y = Y_mat.dot(matSelec)
-
-        dummy = numpy.concatenate ((
-            numpy.zeros((ncfoot,N),dtype=float), A0x,
-            numpy.zeros((ncfoot,N),dtype=float), A0y
-            ), 1
-        )
-        dummy = dummy.dot(self.dofs[:2*(N+nf)])
+        A0x, A0y, B0 = self._calculate_foot_hull_systems(derivative=True)
+
+        # dummy = ( 0 | A0x | 0 | A0y ) * U_k_xy
+        ws = self.workspace
+        dummy = numpy.dot(A0x, self.dofs[N:N+nf], out=ws.derv_foot)
+        tmp = numpy.dot(A0y, self.dofs[2*N+nf:2*(N+nf)], out=ws.derv_foot_tmp)
+        numpy.add(dummy, tmp, out=dummy)
 
         #foot inequality constraints
         a = self.nc_cop
         b = self.nc_cop + self.nc_foot_position
-        self.A_pos_q[a:b, :N] = dummy.dot(self.derv_Afoot_map).dot(self.E_FR_bar).dot(self.Ppu)
-        self.A_pos_q[a:b,-N:] = dummy.dot(self.derv_Afoot_map).dot(self.E_FL_bar).dot(self.Ppu)
+        self._derivative_rows(dummy, self.derv_Afoot_map, self.A_pos_q[a:b])
+
+    def _derivative_rows(self, dummy, derv_map, A_q):
+        """
+        write the orientation derivatives of a constraint into A_q, i.e.
+
+        A_q[:, :N] = dummy * derv_map * E_FR_bar * Ppu
+        A_q[:,-N:] = dummy * derv_map * E_FL_bar * Ppu
+        """
+        N  = self.N
+        ws = self.workspace
+
+        row = numpy.dot(dummy, derv_map, out=ws.derv_row)
+        for mask, A in ((self.E_FL_mask, A_q[:,:N]), (self.E_FR_mask, A_q[:,-N:])):
+            sel = numpy.multiply(row, mask, out=ws.derv_sel)
+            A[...] = numpy.dot(sel, self.Ppu, out=ws.derv_q)
 
-    def _solve_qp(self):
+    def _solve_qp(self, cpu_time):
         """
         Solve QP first run with init functionality and other runs with warmstart
+
+        Parameters
+        ----------
+
+        cpu_time: float
+            upper bound on CPU time of the solver in seconds
         """
-        self.cpu_time = 2.9 # ms
-        self.nwsr = 1000 # unlimited bounded
-        if not self._qp_is_initialized:
-            ret, nwsr, cputime = self.qp.init(
-                self.qp_H, self.qp_g, self.qp_A,
-                self.qp_lb, self.qp_ub,
-                self.qp_lbA, self.qp_ubA,
-                self.nwsr, self.cpu_time
-            )
-            self._qp_is_initialized = True
-        else:
-            ret, nwsr, cputime = self.qp.hotstart(
-                self.qp_H, self.qp_g, self.qp_A,
-                self.qp_lb, self.qp_ub,
-                self.qp_lbA, self.qp_ubA,
-                self.nwsr, self.cpu_time
-            )
+        # NOTE backends warm start from last solution after first call
+        ret, nwsr, cputime = self.qp.solve(
+            self.qp_H, self.qp_g, self.qp_A,
+            self.qp_lb, self.qp_ub,
+            self.qp_lbA, self.qp_ubA,
+            self.nwsr, cpu_time
+        )
+        self._qp_is_initialized = True
 
         # orientation primal solution
-        self.qp.getPrimalSolution(self.dofs)
+        self.qp.get_primal_solution(self.dofs)
 
         # save qp solver data
+        self.qp_ret     = ret           # solver status
         self.qp_nwsr    = nwsr          # working set recalculations
-        self.qp_cputime = cputime*1000. # in milliseconds (set to 2.9ms)
+        self.qp_cputime = cputime*1000. # in milliseconds
+        self.qp_budget  = cpu_time*1000.
+
+    def _postprocess_solution(self, alpha=1.0):
+        """
+        Get solution and put it back into generator data structures
 
-    def _postprocess_solution(self):
-        """ Get solution and put it back into generator data structures """
+        Parameters
+        ----------
+
+        alpha: float
+            step length of the increment, cf. _line_search()
+        """
         # rename for convenience
         N  = self.N
         nf = self.nf
@@ -662,9 +956,6 @@ class NMPCGenerator(BaseGenerator):
         # NOTE this time we add an increment to the existing values
         # data(k+1) = data(k) + alpha * dofs
 
-        # TODO add line search when problematic
-        alpha = 1.0
-
         # x values
         self.dddC_k_x[:]  += alpha * self.dofs[0  :0+N   ]
         self.F_k_x[:]     += alpha * self.dofs[0+N:0+N+nf]
@@ -686,11 +977,44 @@ class NMPCGenerator(BaseGenerator):
         """
         ret = super(NMPCGenerator, self).update()
 
+        # receding horizon shift of controls and working set, s.t. the next
+        # QP is linearized around and warm started from the shifted solution
+        self._shift_controls()
+        self.qp.shift_working_set(self._shift_row_maps[self._support_changed])
+
         # update selection matrix when something has changed
         self._update_foot_selection_matrix()
 
         return ret
 
+    def _shift_row_map(self, support_changed):
+        """
+        map of the bounds and constraints of the QP to the ones one sample
+        later, cf. QPSolver.shift_working_set. Rows per sample move to the
+        preceding sample, foot position rows move to the preceding step
+        when the support foot changes and rows of the first sample resp.
+        step drop out. Bounds are infinite and never active.
+        """
+        row_map = -numpy.ones((self.nv + self.nc,), dtype=int)
+
+        # constraint blocks with rows per sample resp. step
+        nstep = self.nFootPosHullEdges if support_changed else 0
+        blocks = (
+            (self.nc_cop,           self.nFootEdge),
+            (self.nc_foot_position, nstep),
+            (self.nc_fchange_eq,    0),
+            (self.nc_fvel_eq,       1),
+            (self.nc_fpos_ineq,     1),
+            (self.nc_fvel_ineq,     1),
+        )
+
+        a = self.nv
+        for n, shift in blocks:
+            rows = numpy.arange(a, a + n)
+            row_map[rows[shift:]] = rows[:n-shift]
+            a += n
+        return row_map
+
     def _update_foot_selection_matrix(self):
         """ get right foot selection matrix """
         i = 0
@@ -0,0 +1,165 @@
+import numpy
+
+class CoPConstraint(object):
+    """
+    Block structured representation of the center of pressure constraints of
+    the pattern generator, cf. BaseGenerator.buildCoPconstraint
+
+    lbBcop <= D_kp1 * PzuV * U_k <= ubBcop
+
+    with D_kp1 = ( D_kp1x | D_kp1y ) and
+
+    PzuV = ( Pzu | -V_kp1 |   0 |      0 )
+           (   0 |      0 | Pzu | -V_kp1 )
+
+    D_kp1x, D_kp1y are block diagonal with one (nEdges x 1) block of edge
+    normals per sample of the horizon. Therefore only the normals
+    dx[i,k] = D_kp1x[i*nEdges+k, i] and dy[i,k] = D_kp1y[i*nEdges+k, i] are
+    stored and Pzu, V_kp1 are applied row-wise, i.e. the rows of sample i read
+
+    Acop[i*nEdges+k] = ( dx[i,k]*Pzu[i] | -dx[i,k]*V_kp1[i] | dy[i,k]*Pzu[i] | -dy[i,k]*V_kp1[i] )
+
+    The dense matrix Acop is only materialized on demand, e.g. for the dense
+    qpOASES interface.
+    """
+
+    def __init__(self, N, nf, nEdges, dx=None, dy=None):
+        """
+        Parameters
+        ----------
+
+        N: int
+            number of samples on the prediction horizon
+
+        nf: int
+            number of foot steps on the prediction horizon
+
+        nEdges: int
+            number of edges of the CoP hulls
+
+        dx, dy: numpy.ndarray((N, nEdges))
+            arrays holding the edge normals, e.g. views on the diagonal
+            blocks of D_kp1x, D_kp1y. Allocated when not given.
+        """
+        self.N = N
+        self.nf = nf
+        self.nEdges = nEdges
+        self.shape = (N*nEdges, 2*(N + nf))
+
+        if dx is None:
+            dx = numpy.zeros((N, nEdges), dtype=float)
+        if dy is None:
+            dy = numpy.zeros((N, nEdges), dtype=float)
+        self.dx = dx
+        self.dy = dy
+
+        # transformation matrices, cf. update()
+        # NOTE V_kp1 is kept as float copy of the integer selection matrix,
+        #      s.t. products with the float normals and controls neither
+        #      cast nor allocate temporaries
+        self.Pzu   = None
+        self.V_kp1 = numpy.zeros((N, nf), dtype=float)
+
+        # lazily materialized dense matrix
+        self._dense = numpy.zeros(self.shape, dtype=float)
+        self._dense_is_valid = False
+
+        # work buffers of project() and dot()
+        self._zx  = numpy.zeros((N,), dtype=float)
+        self._zy  = numpy.zeros((N,), dtype=float)
+        self._Vf  = numpy.zeros((N,), dtype=float)
+        self._tmp = numpy.zeros((N, nEdges), dtype=float)
+
+    def update(self, Pzu, V_kp1):
+        """
+        Update transformation matrices, has to be called after the edge
+        normals or the transformation matrices changed.
+
+        .. NOTE: Invalidates the materialized dense matrix.
+        """
+        self.Pzu = Pzu
+        self.V_kp1[...] = V_kp1
+        self._dense_is_valid = False
+
+    def project(self, zx, zy, out=None):
+        """
+        project per sample quantities on the edge normals, i.e. calculate
+
+        D_kp1 * ( zx ) where zx, zy are of shape (N,)
+                ( zy )
+        """
+        if out is None:
+            out = numpy.zeros((self.N*self.nEdges,), dtype=float)
+        blocks = out.reshape((self.N, self.nEdges))
+        numpy.multiply(self.dx, zx[:,numpy.newaxis], out=blocks)
+        numpy.multiply(self.dy, zy[:,numpy.newaxis], out=self._tmp)
+        numpy.add(blocks, self._tmp, out=blocks)
+        return out
+
+    def dot(self, U_k, out=None):
+        """
+        evaluate constraint function Acop * U_k without forming Acop, where
+
+        U_k = ( dddC_k_x, F_k_x, dddC_k_y, F_k_y )
+        """
+        N  = self.N
+        nf = self.nf
+
+        # per sample CoP positions depending on U_k
+        zx  = numpy.dot(self.Pzu, U_k[      :N     ], out=self._zx)
+        zy  = numpy.dot(self.Pzu, U_k[N+nf:2*N+nf], out=self._zy)
+        tmp = self._Vf
+        numpy.dot(self.V_kp1, U_k[N     :N+nf], out=tmp)
+        numpy.subtract(zx, tmp, out=zx)
+        numpy.dot(self.V_kp1, U_k[2*N+nf:     ], out=tmp)
+        numpy.subtract(zy, tmp, out=zy)
+
+        return self.project(zx, zy, out)
+
+    def dense(self, out=None):
+        """
+        materialize dense constraint matrix Acop
+
+        Parameters
+        ----------
+
+        out: numpy.ndarray(shape)
+            matrix the constraints are written into, e.g. the rows of a QP
+            constraint matrix. When omitted an internal buffer is returned,
+            which is reused until next call of update().
+        """
+        if out is None:
+            if not self._dense_is_valid:
+                self._materialize(self._dense)
+                self._dense_is_valid = True
+            return self._dense
+
+        self._materialize(out)
+        return out
+
+    def _materialize(self, out):
+        """ write Acop row-wise into out """
+        N  = self.N
+        nf = self.nf
+
+        # NOTE raises when out can not be reshaped without copying
+        A = out.view()
+        A.shape = (N, self.nEdges, 2*(N + nf))
+
+        Pzu = self.Pzu
+        V   = self.V_kp1
+
+        # Acop = ( dx*Pzu | -dx*V_kp1 | dy*Pzu | -dy*V_kp1 )
+        # NOTE filled edge by edge with two dimensional products, because
+        #      broadcasting over all three axes makes NumPy buffer the
+        #      strided output, i.e. allocate in every call
+        for k in range(self.nEdges):
+            A_k = A[:,k,:]
+            dx  = self.dx[:,k:k+1]
+            dy  = self.dy[:,k:k+1]
+            numpy.multiply(dx, Pzu, out=A_k[:,      :N     ])
+            numpy.multiply(dx,   V, out=A_k[:,N     :N+nf  ])
+            numpy.multiply(dy, Pzu, out=A_k[:,N+nf:2*N+nf])
+            numpy.multiply(dy,   V, out=A_k[:,2*N+nf:      ])
+            numpy.negative(A_k[:,N     :N+nf], out=A_k[:,N     :N+nf])
+            numpy.negative(A_k[:,2*N+nf:   ], out=A_k[:,2*N+nf:   ])
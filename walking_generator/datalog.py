@@ -0,0 +1,206 @@
+"""
+Columnar logs of generator data, which are independent of matplotlib, s.t.
+generators and interpolation do not depend on the plotting backend, cf.
+visualization.py for plotting the logged data.
+"""
+import os
+import numpy
+import json
+import zipfile
+from time import strftime
+from numpy.lib import format as npy_format
+
+class DataLog(object):
+    """
+    Columnar log of per tick values. The values of each key are stored in a
+    preallocated numpy array, whose dtype and row shape are inferred from
+    the first logged value. When full, the capacity is doubled. Items are
+    views on the logged rows, i.e. log[key] is of shape (ticks,) + shape.
+
+    .. NOTE:: Views returned before a resize keep pointing to the old
+              buffer, so index the log again after appending.
+    """
+
+    def __init__(self, keys=(), capacity=256):
+        """
+        Parameters
+        ----------
+
+        keys: iterable
+            names of logged values
+
+        capacity: int
+            initial number of rows of each buffer
+        """
+        self.capacity = capacity
+        self._buffers = dict.fromkeys(keys)
+        self._sizes = dict.fromkeys(keys, 0)
+
+    def __contains__(self, key):
+        return key in self._buffers
+
+    def __iter__(self):
+        return iter(self._buffers)
+
+    def __len__(self):
+        return len(self._buffers)
+
+    def __getitem__(self, key):
+        buf = self._buffers[key]
+        if buf is None:
+            return numpy.zeros((0,), dtype=float)
+        return buf[:self._sizes[key]]
+
+    def keys(self):
+        return self._buffers.keys()
+
+    def items(self):
+        return [(key, self[key]) for key in self._buffers]
+
+    def append(self, key, val):
+        """ copy val into next row of buffer of key """
+        val = numpy.asarray(val)
+        buf = self._buffers.get(key)
+        n = self._sizes.get(key, 0)
+
+        if buf is None:
+            buf = numpy.zeros((self.capacity,) + val.shape, dtype=val.dtype)
+        elif val.shape != buf.shape[1:]:
+            err_str = 'shape of {} changed from {} to {}'.format(
+                key, buf.shape[1:], val.shape
+            )
+            raise ValueError(err_str)
+        elif buf.dtype.kind in 'SU' and val.dtype.itemsize > buf.dtype.itemsize:
+            # grow strings, e.g. states of the finite state machine
+            buf = buf.astype(val.dtype)
+
+        if n == buf.shape[0]:
+            grown = numpy.zeros((2*n,) + buf.shape[1:], dtype=buf.dtype)
+            grown[:n] = buf
+            buf = grown
+
+        buf[n] = val
+        self._buffers[key] = buf
+        self._sizes[key] = n + 1
+
+    def clear(self):
+        """ drop logged values, but keep buffers """
+        for key in self._sizes:
+            self._sizes[key] = 0
+
+    def save(self, f):
+        """
+        save logged values as uncompressed .npz with one array per key,
+        which can be memory mapped by load_npz()
+
+        Parameters
+        ----------
+
+        f: str or file
+            path or file object of the output file
+        """
+        numpy.savez(f, **dict(self.items()))
+
+
+def load_npz(filename, mmap_mode='r'):
+    """
+    load arrays of uncompressed .npz file as memory maps, i.e. without
+    reading or copying the data. Compressed members and object arrays are
+    read as usual.
+
+    Parameters
+    ----------
+
+    filename: str
+        path to file written by numpy.savez
+
+    mmap_mode: str
+        mode of numpy.memmap, i.e. 'r', 'r+' or 'c'
+    """
+    data = {}
+    with open(filename, 'rb') as f, zipfile.ZipFile(filename) as zf:
+        for info in zf.infolist():
+            key = info.filename[:-len('.npy')]
+            if info.compress_type != zipfile.ZIP_STORED:
+                data[key] = npy_format.read_array(zf.open(info))
+                continue
+
+            # member data starts after local file header and its fields
+            f.seek(info.header_offset + 26)
+            n_name, n_extra = numpy.fromstring(f.read(4), dtype='<u2')
+            f.seek(info.header_offset + 30 + n_name + n_extra)
+
+            version = npy_format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = npy_format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = npy_format.read_array_header_2_0(f)
+
+            if dtype.hasobject:
+                f.seek(info.header_offset + 30 + n_name + n_extra)
+                data[key] = npy_format.read_array(f)
+            elif numpy.prod(shape) == 0:
+                data[key] = numpy.zeros(shape, dtype=dtype)
+            else:
+                data[key] = numpy.memmap(
+                    filename, dtype=dtype, mode=mmap_mode, offset=f.tell(),
+                    shape=shape, order='F' if fortran_order else 'C'
+                )
+    return data
+
+
+class PlotData(object):
+    """
+    Smart data container for saving plotting relevant data.
+    """
+
+    def __init__(self, generator):
+        """ build data structures """
+        self.generator = generator
+
+        # get list keys
+        self.hull_keys = generator._hull_keys
+        self.plot_keys = generator._plot_keys
+        self.data_keys = generator._data_keys
+
+        # columnar log with one buffer per key
+        self.data = DataLog(self.hull_keys + self.data_keys + self.plot_keys)
+
+    def update(self):
+        """ update internal data from generator """
+        for key in self.data:
+            val = self.generator.__dict__.get(key, [])
+            self.data.append(key, val)
+
+    def reset(self):
+        """ reset all internal data """
+        self.data.clear()
+
+    def save_to_file(self, filename=''):
+        """
+        save data to file, either as uncompressed .npz, which can be memory
+        mapped when loading, cf. Plotter.load_from_file, or exported in json
+        format when filename ends with '.json'
+
+        Parameters
+        ----------
+
+        filename: str
+            path to output file,
+        """
+        # generate general filename
+        if not filename:
+            stamp = strftime("%Y-%m-%d-%H-%M-%S")
+            name = '{stamp}_generator_data.npz'.format(stamp=stamp)
+            filename = os.path.join('/tmp', name)
+
+        if filename.endswith('.json'):
+            # convert numpy arrays into lists
+            data = dict((key, val.tolist()) for key, val in self.data.items())
+
+            # save data to file in json format
+            with open(filename, 'w') as f:
+                json.dump(data, f, sort_keys=True, indent=2)
+        else:
+            with open(filename, 'wb') as f:
+                self.data.save(f)
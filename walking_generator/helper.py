@@ -262,3 +262,32 @@ class ZMPState(object):
     def __ne__(self, other):
         return not self.__eq__(other)
 
+
+
+# record types of interpolated states, i.e. the struct-of-arrays counterparts
+# of BaseTypeFoot, CoMState and ZMPState for buffers of many samples
+
+# foot position, velocity and acceleration in x, y, z and orientation q
+FootStateType = numpy.dtype([
+    (  'x', float), (  'y', float), (  'z', float), (  'q', float),
+    ( 'dx', float), ( 'dy', float), ( 'dz', float), ( 'dq', float),
+    ('ddx', float), ('ddy', float), ('ddz', float), ('ddq', float),
+    ('supportFoot', int),
+])
+
+# CoM states [c, dc, ddc] in x, y and orientation q and CoM height z
+CoMStateType = numpy.dtype([
+    ('x', float, (3,)), ('y', float, (3,)), ('z', float), ('q', float, (3,)),
+])
+
+# ZMP position
+ZMPStateType = numpy.dtype([
+    ('x', float), ('y', float), ('z', float),
+])
+
+# all interpolated states of one sample, e.g. for the queue of a low level
+# controller, cf. ringbuffer.py
+InterpolationSampleType = numpy.dtype([
+    ('com', CoMStateType), ('zmp', ZMPStateType),
+    ('lf', FootStateType), ('rf', FootStateType),
+])
@@ -1,7 +1,9 @@
 import numpy
 from copy import deepcopy
-from helper import CoMState, ZMPState, BaseTypeFoot
+from helper import FootStateType, CoMStateType, ZMPStateType, InterpolationSampleType
 from base import BaseGenerator
+from cache import interpolation_matrices, preview_matrices
+from datalog import DataLog
 import math
 
 class Interpolation(object):
@@ -12,12 +14,25 @@ class Interpolation(object):
     Interpolation Class provides all methods to interpolated from the solution of the
     pattern generator. It interpolate the CoM, the ZMP and the Feet state along the
     whole trajectory with a given interpolation period (input)
+
+    .. NOTE:: States are stored in structured arrays of the record types
+              CoMStateType, ZMPStateType and FootStateType, e.g. the x
+              positions of the left foot trajectory are leftFootTraj['x'].
     """
-    def __init__(self, Tc=0.005, BG=BaseGenerator() ):
+    def __init__(self, Tc=0.005, BG=BaseGenerator(), recorder=None, queue=None):
 
         # the generator is supposed to have been initialized before
         self.gen = BG
 
+        # streaming recorder of the interpolated trajectories, cf. recorder.py,
+        # which replaces the full trajectories in memory when given
+        self.recorder = recorder
+
+        # bounded queue of InterpolationSampleType records for a low level
+        # controller, cf. ringbuffer.py, which also replaces the full
+        # trajectories in memory when given
+        self.queue = queue
+
         self.T = self.gen.T # QP sampling period
         self.Tc = Tc # sampling period of the robot low level controller
         self.interval = int(self.T/self.Tc) # number of iteration in 100ms
@@ -26,58 +41,79 @@ class Interpolation(object):
         # initiale states used to interpolate (they should be intialized once at
         # the beginning of the qp
         # and updated inside the class
-        self.curCoM = CoMState()
-        self.curCoM.x = deepcopy(self.gen.c_k_x)
-        self.curCoM.y = deepcopy(self.gen.c_k_y)
-        self.curCoM.theta = deepcopy(self.gen.c_k_q)
-        self.curCoM.h_com = deepcopy(self.gen.h_com)
-        zmp = ZMPState()
-        zmp.x = self.curCoM.x[0] - self.curCoM.h_com / self.gen.g * self.curCoM.x[2]
-        zmp.y = self.curCoM.y[0] - self.curCoM.h_com / self.gen.g * self.curCoM.y[2]
+        self.curCoM = numpy.zeros((), dtype=CoMStateType)
+        self.curCoM['x'] = self.gen.c_k_x
+        self.curCoM['y'] = self.gen.c_k_y
+        self.curCoM['q'] = self.gen.c_k_q
+        self.curCoM['z'] = self.gen.h_com
+        zmp = numpy.zeros((), dtype=ZMPStateType)
+        zmp['x'] = self.gen.c_k_x[0] - self.gen.h_com / self.gen.g * self.gen.c_k_x[2]
+        zmp['y'] = self.gen.c_k_y[0] - self.gen.h_com / self.gen.g * self.gen.c_k_y[2]
 
         self.fi = FootInterpolation()
-        self.curleft = BaseTypeFoot()
-        self.curRight = BaseTypeFoot()
+        self.curleft = numpy.zeros((), dtype=FootStateType)
+        self.curRight = numpy.zeros((), dtype=FootStateType)
+        self.curleft['x'] = self.gen.f_k_x
+        self.curleft['y'] = self.gen.f_k_y
+        self.curleft['q'] = self.gen.f_k_q
+        self.curRight['q'] = self.gen.f_k_q
         if self.gen.currentSupport.foot == "left" :
-            self.curleft.x = deepcopy(self.gen.f_k_x)
-            self.curleft.y = deepcopy(self.gen.f_k_y)
-            self.curleft.q = deepcopy(self.gen.f_k_q)
-            self.curRight.x = deepcopy(self.gen.f_k_x + self.fi.feetDist * math.sin(self.gen.f_k_q) )
-            self.curRight.y = deepcopy(self.gen.f_k_y - self.fi.feetDist * math.cos(self.gen.f_k_q) )
-            self.curRight.q = deepcopy(self.gen.f_k_q)
+            self.curRight['x'] = self.gen.f_k_x + self.fi.feetDist * math.sin(self.gen.f_k_q)
+            self.curRight['y'] = self.gen.f_k_y - self.fi.feetDist * math.cos(self.gen.f_k_q)
         else :
-            self.curleft.x = deepcopy(self.gen.f_k_x)
-            self.curleft.y = deepcopy(self.gen.f_k_y)
-            self.curleft.q = deepcopy(self.gen.f_k_q)
-            self.curRight.x = deepcopy(self.gen.f_k_x - self.fi.feetDist * math.sin(self.gen.f_k_q) )
-            self.curRight.y = deepcopy(self.gen.f_k_y + self.fi.feetDist * math.cos(self.gen.f_k_q) )
-            self.curRight.q = deepcopy(self.gen.f_k_q)
-
-        self.CoMbuffer = numpy.empty( (self.interval,) , dtype=CoMState ) #buffer containing the CoM trajectory over 100ms
-        self.ZMPbuffer = numpy.empty( (self.interval,) , dtype=ZMPState ) #buffer containing the ZMP trajectory over 100ms
-        self.RFbuffer = numpy.empty( (self.interval,) , dtype=BaseTypeFoot ) #buffer containing the rigth foot trajectory over 100ms
-        self.LFbuffer = numpy.empty( (self.interval,) , dtype=BaseTypeFoot ) #buffer containing the left foot trajectory over 100ms
-
-        for i in range(self.interval):
-            self.CoMbuffer[i] = deepcopy(self.curCoM)
-            self.ZMPbuffer[i] = deepcopy(zmp)
-            self.RFbuffer[i] = deepcopy(self.curRight)
-            self.LFbuffer[i] = deepcopy(self.curleft)
-
-        self.comTraj = [] #buffer containing the full CoM trajectory
-        self.zmpTraj = [] #buffer containing the full ZMP trajectory
-        self.leftFootTraj = [] #buffer containing the full left foot trajectory
-        self.rightFootTraj = [] #buffer containing the full right foot trajectory
+            self.curRight['x'] = self.gen.f_k_x - self.fi.feetDist * math.sin(self.gen.f_k_q)
+            self.curRight['y'] = self.gen.f_k_y + self.fi.feetDist * math.cos(self.gen.f_k_q)
+
+        self.CoMbuffer = numpy.zeros( (self.interval,) , dtype=CoMStateType ) #buffer containing the CoM trajectory over 100ms
+        self.ZMPbuffer = numpy.zeros( (self.interval,) , dtype=ZMPStateType ) #buffer containing the ZMP trajectory over 100ms
+        self.RFbuffer = numpy.zeros( (self.interval,) , dtype=FootStateType ) #buffer containing the rigth foot trajectory over 100ms
+        self.LFbuffer = numpy.zeros( (self.interval,) , dtype=FootStateType ) #buffer containing the left foot trajectory over 100ms
+
+        self.CoMbuffer[...] = self.curCoM
+        self.ZMPbuffer[...] = zmp
+        self.RFbuffer[...] = self.curRight
+        self.LFbuffer[...] = self.curleft
+
+        # samples of one QP sampling period for the queue
+        self.samples = numpy.zeros( (self.interval,) , dtype=InterpolationSampleType )
+
+        # full trajectories, one row of buffers per QP sampling period
+        self._trajectories = DataLog(('com', 'zmp', 'lf', 'rf'))
 
         for i in range(30):
-            self.comTraj.extend(deepcopy(self.CoMbuffer))
-            self.zmpTraj.extend(deepcopy(self.ZMPbuffer))
-            self.leftFootTraj .extend(deepcopy(self.LFbuffer))
-            self.rightFootTraj.extend(deepcopy(self.RFbuffer))
+            self._store_trajectories()
 
-        self.lipm = LIPM(self.T,self.Tc,self.curCoM.h_com)
+        self.lipm = LIPM(self.T,self.Tc,self.gen.h_com)
         self.fi = FootInterpolation(genrator=self.gen)
 
+        # whole preview horizon at the controller rate, cf. interpolate_horizon
+        nh = self.gen.N * self.interval
+        self.horizonCoM = numpy.zeros( (nh,) , dtype=CoMStateType )
+        self.horizonZMP = numpy.zeros( (nh,) , dtype=ZMPStateType )
+        self.horizonRF = numpy.zeros( (nh,) , dtype=FootStateType )
+        self.horizonLF = numpy.zeros( (nh,) , dtype=FootStateType )
+        self.horizonCoM['z'] = self.gen.h_com
+
+    @property
+    def comTraj(self):
+        """ full CoM trajectory """
+        return self._trajectories['com'].reshape(-1)
+
+    @property
+    def zmpTraj(self):
+        """ full ZMP trajectory """
+        return self._trajectories['zmp'].reshape(-1)
+
+    @property
+    def leftFootTraj(self):
+        """ full left foot trajectory """
+        return self._trajectories['lf'].reshape(-1)
+
+    @property
+    def rightFootTraj(self):
+        """ full right foot trajectory """
+        return self._trajectories['rf'].reshape(-1)
+
     def interpolate(self, time):
 
         self.curCoM, self.CoMbuffer, self.ZMPbuffer = self.lipm.interpolate(
@@ -89,89 +125,120 @@ class Interpolation(object):
                                     self.gen.F_k_x[0], self.gen.F_k_y[0], self.gen.F_k_q[0],
                                     self.LFbuffer, self.RFbuffer)
 
-        for i in range ( self.LFbuffer.shape[0] ) :
-            self.CoMbuffer[i].q[0] = 0.5*(self.LFbuffer[i].q + self.RFbuffer[i].q)
-            self.CoMbuffer[i].q[1] = 0.5*(self.LFbuffer[i].dq + self.RFbuffer[i].dq)
-            self.CoMbuffer[i].q[2] = 0.5*(self.LFbuffer[i].ddq + self.RFbuffer[i].ddq)
-
-
-        self.comTraj.extend(deepcopy(self.CoMbuffer))
-        self.zmpTraj.extend(deepcopy(self.ZMPbuffer))
-        self.leftFootTraj .extend(deepcopy(self.LFbuffer))
-        self.rightFootTraj.extend(deepcopy(self.RFbuffer))
+        # CoM orientation is the mean of the feet orientations
+        LF = self.LFbuffer
+        RF = self.RFbuffer
+        q = self.CoMbuffer['q']
+        q[:,0] = 0.5*(LF[  'q'] + RF[  'q'])
+        q[:,1] = 0.5*(LF[ 'dq'] + RF[ 'dq'])
+        q[:,2] = 0.5*(LF['ddq'] + RF['ddq'])
+
+        if self.queue is not None:
+            self.samples['com'] = self.CoMbuffer
+            self.samples['zmp'] = self.ZMPbuffer
+            self.samples['lf']  = self.LFbuffer
+            self.samples['rf']  = self.RFbuffer
+            self.queue.push(self.samples)
+
+        self._store_trajectories()
+
+    def interpolate_horizon(self, time):
+        """
+        interpolate the whole predicted trajectory of the generator, i.e. all
+        N QP sampling periods of the preview horizon, at the sampling period
+        of the low level controller, e.g. for look-ahead of a whole body
+        controller or collision checking.
+
+        .. NOTE: the horizon starts at the current interpolation state, i.e.
+                 call it before interpolate(time) of the same QP iteration.
+                 Then its first interval samples equal the buffers of
+                 interpolate(time).
+
+        .. NOTE: returned arrays are preallocated and overwritten by the next
+                 call.
+
+        Parameters
+        ----------
+
+        time: float
+            time of the current QP iteration, cf. interpolate
+
+        Returns
+        -------
+
+        (com, zmp, lf, rf): structured arrays of shape (N*interval,) of
+        CoMStateType, ZMPStateType and FootStateType
+        """
+        self.lipm.interpolate_horizon(
+            self.gen.dddC_k_x, self.gen.dddC_k_y,
+            self.curCoM, self.horizonZMP, self.horizonCoM
+        )
+        self.fi.interpolate_horizon(time, self.gen.currentSupport,
+            self.curleft, self.curRight,
+            self.gen.F_k_x, self.gen.F_k_y, self.gen.F_k_q,
+            self.gen.v_kp1, self.gen.V_kp1,
+            self.horizonLF, self.horizonRF
+        )
+
+        # CoM orientation is the mean of the feet orientations
+        LF = self.horizonLF
+        RF = self.horizonRF
+        q = self.horizonCoM['q']
+        q[:,0] = 0.5*(LF[  'q'] + RF[  'q'])
+        q[:,1] = 0.5*(LF[ 'dq'] + RF[ 'dq'])
+        q[:,2] = 0.5*(LF['ddq'] + RF['ddq'])
+
+        return self.horizonCoM, self.horizonZMP, self.horizonLF, self.horizonRF
+
+    def _store_trajectories(self):
+        """ append buffers to full trajectories or record them """
+        if self.recorder is not None:
+            self.recorder.record(self._trajectory_record())
+            return
+        if self.queue is not None:
+            return
+
+        self._trajectories.append('com', self.CoMbuffer)
+        self._trajectories.append('zmp', self.ZMPbuffer)
+        self._trajectories.append('lf',  self.LFbuffer)
+        self._trajectories.append('rf',  self.RFbuffer)
+
+    def _trajectory_record(self):
+        """
+        return buffers of one QP sampling period as record with the columns
+        of save_to_file, i.e. com_x, com_y, com_q of shape (interval,3) and
+        zmp_x, ..., lf_q of shape (interval,)
+        """
+        record = {
+            'com_x' : self.CoMbuffer['x'],
+            'com_y' : self.CoMbuffer['y'],
+            'com_q' : self.CoMbuffer['q'],
+        }
+        for name, buf, attrs in (
+            ('zmp', self.ZMPbuffer, 'xyz'),
+            ('rf',  self.RFbuffer,  'xyzq'),
+            ('lf',  self.LFbuffer,  'xyzq'),
+        ):
+            for attr in attrs:
+                record['{}_{}'.format(name, attr)] = buf[attr]
+        return record
 
     def save_to_file(self,filename):
-        comX   = numpy.asarray([item.x for item in self.comTraj])
-        comY   = numpy.asarray([item.y for item in self.comTraj])
-        comQ   = numpy.asarray([item.q for item in self.comTraj])
-        zmpX   = numpy.asarray([item.x for item in self.zmpTraj])
-        zmpY   = numpy.asarray([item.y for item in self.zmpTraj])
-        zmpZ   = numpy.asarray([item.z for item in self.zmpTraj])
-        rfX    = numpy.asarray([item.  x for item in self.rightFootTraj])
-        rfY    = numpy.asarray([item.  y for item in self.rightFootTraj])
-        rfZ    = numpy.asarray([item.  z for item in self.rightFootTraj])
-        rfQ    = numpy.asarray([item.  q for item in self.rightFootTraj])
-        lfX    = numpy.asarray([item.  x for item in self.leftFootTraj])
-        lfY    = numpy.asarray([item.  y for item in self.leftFootTraj])
-        lfZ    = numpy.asarray([item.  z for item in self.leftFootTraj])
-        lfQ    = numpy.asarray([item.  q for item in self.leftFootTraj])
-
-        rfdX    = numpy.asarray([item. dx for item in self.rightFootTraj])
-        rfdY    = numpy.asarray([item. dy for item in self.rightFootTraj])
-        rfdZ    = numpy.asarray([item. dz for item in self.rightFootTraj])
-        rfdQ    = numpy.asarray([item. dq for item in self.rightFootTraj])
-        lfdX    = numpy.asarray([item. dx for item in self.leftFootTraj])
-        lfdY    = numpy.asarray([item. dy for item in self.leftFootTraj])
-        lfdZ    = numpy.asarray([item. dz for item in self.leftFootTraj])
-        lfdQ    = numpy.asarray([item. dq for item in self.leftFootTraj])
-        rfddX    = numpy.asarray([item.ddx for item in self.rightFootTraj])
-        rfddY    = numpy.asarray([item.ddy for item in self.rightFootTraj])
-        rfddZ    = numpy.asarray([item.ddz for item in self.rightFootTraj])
-        rfddQ    = numpy.asarray([item.ddq for item in self.rightFootTraj])
-        lfddX    = numpy.asarray([item.ddx for item in self.leftFootTraj])
-        lfddY    = numpy.asarray([item.ddy for item in self.leftFootTraj])
-        lfddZ    = numpy.asarray([item.ddz for item in self.leftFootTraj])
-        lfddQ    = numpy.asarray([item.ddq for item in self.leftFootTraj])
-
-        lst = [
-        comX[:,0], # 1
-        comX[:,1], # 2
-        comX[:,2], # 3
-        comY[:,0], # 4
-        comY[:,1], # 5
-        comY[:,2], # 6
-        comQ[:,0], # 7
-        comQ[:,1], # 8
-        comQ[:,2], # 9
-        zmpX,      # 10
-        zmpY,      # 11
-        zmpZ,      # 12
-        rfX,       # 13
-        rfY,       # 14
-        rfZ,       # 15
-        rfQ,       # 16
-        lfX,       # 17
-        lfY,       # 18
-        lfZ,       # 19
-        lfQ]       # 20
-#        rfdX,      # 21
-#        rfdY ,     # 22
-#        rfdZ  ,    # 23
-#        rfdQ  ,    # 24
-#        lfdX  ,    # 25
-#        lfdY  ,    # 26
-#        lfdZ  ,    # 27
-#        lfdQ  ,    # 28
-#        rfddX ,    # 29
-#        rfddY ,    # 30
-#        rfddZ ,    # 31
-#        rfddQ ,    # 32
-#        lfddX ,    # 33
-#        lfddY ,    # 34
-#        lfddZ ,    # 35
-#        lfddQ ]    # 36
-
-        data = numpy.asarray(lst).transpose()
+        com = self.comTraj
+        zmp = self.zmpTraj
+        rf  = self.rightFootTraj
+        lf  = self.leftFootTraj
+
+        # NOTE derivatives of the feet trajectories, e.g. rf['dx'],
+        #      lf['ddq'], are not saved
+        data = numpy.column_stack((
+            com['x'],                       # 1 - 3
+            com['y'],                       # 4 - 6
+            com['q'],                       # 7 - 9
+            zmp['x'], zmp['y'], zmp['z'],   # 10 - 12
+            rf['x'], rf['y'], rf['z'], rf['q'], # 13 - 16
+            lf['x'], lf['y'], lf['z'], lf['q'], # 17 - 20
+        ))
         numpy.savetxt(filename, data, delimiter="   ")
 
 class LIPM(object):
@@ -191,78 +258,87 @@ class LIPM(object):
         self.Tc=controlPeriod
         self.T=commandPeriod
         self.h_com=h_com
-        # for T sampling interpolation
-        self.A = numpy.zeros( (3,3) , dtype=float )
-        self.B = numpy.zeros( (3,) , dtype=float )
-        self.C = numpy.zeros( (3,) , dtype=float )
-
-        # for Tc sampling interpolation
-        self.Ac = numpy.zeros( (3,3) , dtype=float )
-        self.Bc = numpy.zeros( (3,) , dtype=float )
 
         self.intervaleSize = int(self.Tc/self.T)
 
         self.initializeSystem()
 
     def initializeSystem(self):
-        T = self.T
-        A = self.A
-        A[0][0] = 1 ; A[0][1] = T ; A[0][2] = T*T*0.5 ;
-        A[1][1] = 1 ; A[1][2] = T ;
-        A[2][2] = 1 ;
-
-        B = self.B
-        B[0]= T*T*T/6
-        B[1]= T*T/2
-        B[2]= T
-
-        C = self.C
-        C[0]= 1
-        C[1]= 0
-        C[2]= -self.h_com/self.g
-
-        Tc = self.Tc
-        Ac = self.Ac
-        Ac[0][0] = 1 ; Ac[0][1] = Tc ; Ac[0][2] = Tc*Tc*0.5 ;
-        Ac[1][1] = 1 ; Ac[1][2] = Tc ;
-        Ac[2][2] = 1 ;
-
-        Bc = self.Bc
-        Bc[0]= Tc*Tc*Tc/6
-        Bc[1]= Tc*Tc/2
-        Bc[2]= Tc
+        # transitions from the initial state to all samples of the interval
+        self.matrices = interpolation_matrices(
+            self.intervaleSize, self.T, self.Tc, self.h_com, self.g
+        )
 
     def interpolate(self, jerkX, jerkY, curCoM, ZMPbuffer, CoMbuffer):
-        A = self.A
-        B = self.B
-        C = self.C
-        Ac = self.Ac
-        Bc = self.Bc
-
-
-        CoMbuffer = numpy.resize(CoMbuffer,(self.intervaleSize,))
-        ZMPbuffer = numpy.resize(ZMPbuffer,(self.intervaleSize,))
-
-        for i in range(self.intervaleSize):
-            CoMbuffer[i] = CoMState()
-            ZMPbuffer[i] = ZMPState()
-
-        CoMbuffer[0].x[...] = curCoM.x
-        CoMbuffer[0].y[...] = curCoM.y
-        ZMPbuffer[0].x = C.dot(curCoM.x)
-        ZMPbuffer[0].y = C.dot(curCoM.y)
-
-        for i in range(1,self.intervaleSize):
-            CoMbuffer[i].x = A.dot(CoMbuffer[i-1].x) + B.dot(jerkX)
-            CoMbuffer[i].y = A.dot(CoMbuffer[i-1].y) + B.dot(jerkY)
-            ZMPbuffer[i].x = C.dot(CoMbuffer[i].x)
-            ZMPbuffer[i].y = C.dot(CoMbuffer[i].y)
-
-        curCoM.x = Ac.dot(curCoM.x) + Bc.dot(jerkX)
-        curCoM.y = Ac.dot(curCoM.y) + Bc.dot(jerkY)
+        """
+        fill buffers with CoM and ZMP states of the samples of one control
+        period starting from curCoM and advance curCoM by one control period
+        """
+        # rename for convenience
+        S  = self.matrices.S
+        U  = self.matrices.U
+        Zs = self.matrices.Zs
+        Zu = self.matrices.Zu
+        Ac = self.matrices.Ac
+        Bc = self.matrices.Bc
+
+        # states of x and y as columns, i.e. all samples of both axes at once
+        c_0 = numpy.column_stack((curCoM['x'], curCoM['y']))
+        jerk = numpy.array((jerkX, jerkY))
+
+        c_i = S.dot(c_0) + U[:,:,numpy.newaxis] * jerk
+        z_i = Zs.dot(c_0) + Zu[:,numpy.newaxis] * jerk
+        c_1 = Ac.dot(c_0) + Bc[:,numpy.newaxis] * jerk
+
+        CoMbuffer['x'] = c_i[:,:,0]
+        CoMbuffer['y'] = c_i[:,:,1]
+        ZMPbuffer['x'] = z_i[:,0]
+        ZMPbuffer['y'] = z_i[:,1]
+        curCoM['x'] = c_1[:,0]
+        curCoM['y'] = c_1[:,1]
 
         return curCoM, CoMbuffer, ZMPbuffer
 
+    def interpolate_horizon(self, jerkX, jerkY, curCoM, ZMPbuffer, CoMbuffer):
+        """
+        fill buffers with CoM and ZMP states of the samples of len(jerkX)
+        control periods with piecewise constant jerks jerkX and jerkY
+        starting from curCoM, which is not modified
+        """
+        N = len(jerkX)
+        n = self.intervaleSize
+
+        # rename for convenience
+        P  = preview_matrices(N, self.Tc, self.h_com, self.g)
+        S  = self.matrices.S
+        U  = self.matrices.U
+        Zs = self.matrices.Zs
+        Zu = self.matrices.Zu
+
+        # states of x and y as columns, cf. interpolate
+        c_0 = numpy.column_stack((curCoM['x'], curCoM['y']))
+        jerk = numpy.column_stack((jerkX, jerkY))
+
+        # states at the beginning of each control period
+        c_j = numpy.empty( (N,3,2) , dtype=float )
+        c_j[0] = c_0
+        c_j[1:,0] = P.Pps[:-1].dot(c_0) + P.Ppu[:-1].dot(jerk)
+        c_j[1:,1] = P.Pvs[:-1].dot(c_0) + P.Pvu[:-1].dot(jerk)
+        c_j[1:,2] = P.Pas[:-1].dot(c_0) + P.Pau[:-1].dot(jerk)
+
+        # all samples of all control periods
+        c_ji = numpy.einsum('ikl,jla->jika', S, c_j) \
+             + U[:,:,numpy.newaxis] * jerk[:,numpy.newaxis,numpy.newaxis,:]
+        z_ji = numpy.einsum('il,jla->jia', Zs, c_j) \
+             + Zu[:,numpy.newaxis] * jerk[:,numpy.newaxis,:]
+
+        CoMbuffer['x'] = c_ji[...,0].reshape(N*n,3)
+        CoMbuffer['y'] = c_ji[...,1].reshape(N*n,3)
+        ZMPbuffer['x'] = z_ji[...,0].reshape(N*n)
+        ZMPbuffer['y'] = z_ji[...,1].reshape(N*n)
+
+        return CoMbuffer, ZMPbuffer
+
 class FootInterpolation(object):
     """
     footInterpolation class of walking pattern generator for humanoids, cf.
@@ -287,6 +363,7 @@ class FootInterpolation(object):
         self.TDS = doubleSupportTime # Time of double support
         self.stepTime = stepTime
         self.intervaleSize = int(self.T/self.Tc) # nuber of interpolated sample
+        self.sampleTimes = self.Tc * numpy.arange(self.intervaleSize) # interpolation times
         self.gen = genrator
         self.polynomeZ.setParameters(self.TSS,self.stepHeigth,0.0,0.0)
     '''
@@ -307,9 +384,6 @@ class FootInterpolation(object):
         * DSP : Double Support Phase
         '''
         timelimit = time + numpy.sum(self.gen.v_kp1) * self.T
-        for i in range(self.intervaleSize):
-            LeftFootBuffer[i] = BaseTypeFoot()
-            RightFootBuffer[i] = BaseTypeFoot()
 
         print timelimit
         print self.gen.v_kp1
@@ -320,13 +394,12 @@ class FootInterpolation(object):
         # in case of double support the policy is to stay still
         if time + epsilon < timelimit - self.stepTime + self.T :
             print "double support"
-            for i in range(self.intervaleSize):
-                LeftFootBuffer[i] = deepcopy(curLeft)
-                RightFootBuffer[i] = deepcopy(curRight)
+            LeftFootBuffer[...] = curLeft
+            RightFootBuffer[...] = curRight
             # we define the z trajectory in the double support phase
             # to allow the robot to take off and land
             # during the whole single support duration
-            self.polynomeZ.setParameters(self.TSS,self.stepHeigth,curRight.z,curRight.dz)
+            self.polynomeZ.setParameters(self.TSS,self.stepHeigth,curRight['z'],curRight['dz'])
 
             return curLeft,curRight,LeftFootBuffer, RightFootBuffer
 
@@ -359,61 +432,141 @@ class FootInterpolation(object):
             if (currentSupport.foot=="left") :
                 supportFoot = curLeft
                 flyingFoot  = curRight
+                supportFootBuffer = LeftFootBuffer
+                flyingFootBuffer  = RightFootBuffer
             else :
                 supportFoot = curRight
                 flyingFoot  = curLeft
+                supportFootBuffer = RightFootBuffer
+                flyingFootBuffer  = LeftFootBuffer
 
-            self.polynomeX.setParameters(timeInterval,F_k_x,flyingFoot.x,flyingFoot.dx,flyingFoot.ddx)
-            self.polynomeY.setParameters(timeInterval,F_k_y,flyingFoot.y,flyingFoot.dy,flyingFoot.ddy)
-            self.polynomeQ.setParameters(timeInterval,PreviewAngle,flyingFoot.q,flyingFoot.dq,flyingFoot.ddq)
-            for i in range(self.intervaleSize):
-                if currentSupport.foot == "left" :
-                    flyingFootBuffer = RightFootBuffer
-                    supportFootBuffer = LeftFootBuffer
-                else :
-                    flyingFootBuffer = LeftFootBuffer
-                    supportFootBuffer = RightFootBuffer
+            self.polynomeX.setParameters(timeInterval,F_k_x,flyingFoot['x'],flyingFoot['dx'],flyingFoot['ddx'])
+            self.polynomeY.setParameters(timeInterval,F_k_y,flyingFoot['y'],flyingFoot['dy'],flyingFoot['ddy'])
+            self.polynomeQ.setParameters(timeInterval,PreviewAngle,flyingFoot['q'],flyingFoot['dq'],flyingFoot['ddq'])
 
-                # the non swing foot stay still
-                supportFootBuffer[i] = deepcopy(supportFoot)
-                supportFootBuffer[i].supportFoot = 1
+            # the non swing foot stay still
+            supportFootBuffer[...] = supportFoot
+            supportFootBuffer['supportFoot'] = 1
 
-                Ti = self.Tc * i # interpolation time
-                Tlocal = localInterpolationStartTime + Ti
+            # all samples at once
+            Ti = self.sampleTimes # interpolation time
+            Tlocal = localInterpolationStartTime + Ti
 
-                # if we are landing or lifting the foot, do not modify the x,y and theta
-                if localInterpolationStartTime < endOfLiftoff:
-                    Tr = Ti - endOfLiftoff # Tr = remaining time
-                    flyingFootBuffer[i] = self.computeXYQ(flyingFootBuffer[i],Tr)
-                else:
-                    flyingFootBuffer[i] = self.computeXYQ(flyingFootBuffer[i],Ti)
+            flyingFootBuffer[...] = 0
+            # if we are landing or lifting the foot, do not modify the x,y and theta
+            if localInterpolationStartTime < endOfLiftoff:
+                Tr = Ti - endOfLiftoff # Tr = remaining time
+                self.computeXYQ(flyingFootBuffer,Tr)
+            else:
+                self.computeXYQ(flyingFootBuffer,Ti)
 
-                flyingFootBuffer[i].z = self.polynomeZ.compute(Tlocal)
-                flyingFootBuffer[i].dz = self.polynomeZ.computeDerivative(Tlocal)
-                flyingFootBuffer[i].ddz = self.polynomeZ.computeSecDerivative(Tlocal)
+            flyingFootBuffer['z'], flyingFootBuffer['dz'], flyingFootBuffer['ddz'] \
+                = self.polynomeZ.evaluate(Tlocal)
 
             if localInterpolationStartTime < endOfLiftoff:
                 # Compute the next iteration state
-                flyingFoot = self.computeXYQ(flyingFoot,self.Tc*self.intervaleSize - endOfLiftoff)
+                self.computeXYQ(flyingFoot,self.Tc*self.intervaleSize - endOfLiftoff)
             else:
-                flyingFoot = self.computeXYQ(flyingFoot,self.Tc*self.intervaleSize)
+                self.computeXYQ(flyingFoot,self.Tc*self.intervaleSize)
 
             return curLeft,curRight,LeftFootBuffer, RightFootBuffer
 
 
-    def computeXYQ(self,foot,t):
-        # compute the foot states at time t
-        foot.  x = self.polynomeX.compute(t)
-        foot. dx = self.polynomeX.computeDerivative(t)
-        foot.ddx = self.polynomeX.computeSecDerivative(t)
+    def interpolate_horizon(self, time, currentSupport,
+        curLeft, curRight,
+        F_k_x, F_k_y, F_k_q,
+        v_kp1, V_kp1,
+        LeftFootBuffer, RightFootBuffer):
+        """
+        fill buffers with the feet states of all samples of the preview horizon
+        given by the selection vector v_kp1 and matrix V_kp1 of the generator
+        and the previewed steps F_k_x, F_k_y and F_k_q. Each step is
+        interpolated like in interpolate, but all its samples are evaluated at
+        once. curLeft and curRight are not modified.
+
+        .. NOTE: the landing position of the swing foot of the last previewed
+                 step is unknown, it therefore stays on the ground.
+        """
+        N = v_kp1.shape[0]
+        n = self.intervaleSize
+        epsilon = 0.02
 
-        foot.  y = self.polynomeY.compute(t)
-        foot. dy = self.polynomeY.computeDerivative(t)
-        foot.ddy = self.polynomeY.computeSecDerivative(t)
+        # cf. interpolate
+        moduleSupportCoefficient = 0.9
+        UnlockedSwingPeriod = self.TSS * moduleSupportCoefficient
+        endOfLiftoff = 0.5 * (self.TSS-UnlockedSwingPeriod)
+
+        # step of each QP sampling period, 0 is the current step
+        step = numpy.where(v_kp1 == 1, 0, V_kp1.argmax(axis=1) + 1)
+
+        # start times of the QP sampling periods and times of all samples
+        ticks = time + self.T * numpy.arange(N)
+        times = ticks[:,numpy.newaxis] + self.sampleTimes
+
+        # feet at rest on the previewed steps
+        landed = numpy.zeros( (V_kp1.shape[1],) , dtype=FootStateType )
+        landed['x'] = F_k_x[:landed.shape[0]]
+        landed['y'] = F_k_y[:landed.shape[0]]
+        landed['q'] = F_k_q[:landed.shape[0]]
+
+        # footholds in order of the steps, i.e. in step m the swing foot flies
+        # from footholds[m] to footholds[m+2] while footholds[m+1] supports
+        if (currentSupport.foot=="left") :
+            footholds = [curRight, curLeft] + list(landed)
+            buffers = (LeftFootBuffer.reshape(N,n), RightFootBuffer.reshape(N,n))
+        else :
+            footholds = [curLeft, curRight] + list(landed)
+            buffers = (RightFootBuffer.reshape(N,n), LeftFootBuffer.reshape(N,n))
+
+        timelimit = time + numpy.sum(v_kp1) * self.T
+        for m in range(step.max() + 1):
+            periods = step == m
+            supportFoot = footholds[m+1]
+            flyingFoot  = footholds[m]
+            supportFootBuffer = buffers[m % 2]
+            flyingFootBuffer  = buffers[(m+1) % 2]
+
+            # in case of double support the policy is to stay still
+            double = periods & (ticks + epsilon < timelimit - self.stepTime + self.T)
+            single = periods & ~double
+            supportFootBuffer[double] = supportFoot
+            flyingFootBuffer[double] = flyingFoot
+
+            if single.any():
+                # the non swing foot stay still
+                supportFootBuffer[single] = supportFoot
+                supportFootBuffer['supportFoot'][single] = 1
+
+                # time since the last double support of all samples and of the
+                # first QP sampling period of the step, cf. interpolate
+                Tlocal = times[single] - (timelimit - self.TSS)
+                localInterpolationStartTime = ticks[periods][0] - (timelimit - self.TSS)
+                SwingTimePassed = max(localInterpolationStartTime - endOfLiftoff, 0.0)
+                timeInterval = UnlockedSwingPeriod - SwingTimePassed
+
+                swing = numpy.zeros( Tlocal.shape , dtype=FootStateType )
+                if m + 2 < len(footholds):
+                    target = footholds[m+2]
+                    self.polynomeX.setParameters(timeInterval,target['x'],flyingFoot['x'],flyingFoot['dx'],flyingFoot['ddx'])
+                    self.polynomeY.setParameters(timeInterval,target['y'],flyingFoot['y'],flyingFoot['dy'],flyingFoot['ddy'])
+                    self.polynomeQ.setParameters(timeInterval,target['q'],flyingFoot['q'],flyingFoot['dq'],flyingFoot['ddq'])
+                    self.computeXYQ(swing, Tlocal - endOfLiftoff - SwingTimePassed)
+                    swing['z'], swing['dz'], swing['ddz'] = self.polynomeZ.evaluate(Tlocal)
+                else:
+                    swing[...] = flyingFoot
+                    swing['supportFoot'] = 0
+                flyingFootBuffer[single] = swing
 
-        foot.  q = self.polynomeQ.compute(t)
-        foot. dq = self.polynomeQ.computeDerivative(t)
-        foot.ddq = self.polynomeQ.computeSecDerivative(t)
+            timelimit += self.stepTime
+
+        return LeftFootBuffer, RightFootBuffer
+
+    def computeXYQ(self,foot,t):
+        # compute the foot states at time(s) t, foot is a FootStateType
+        # record or an array of records of the same shape as t
+        foot['x'], foot['dx'], foot['ddx'] = self.polynomeX.evaluate(t)
+        foot['y'], foot['dy'], foot['ddy'] = self.polynomeY.evaluate(t)
+        foot['q'], foot['dq'], foot['ddq'] = self.polynomeQ.evaluate(t)
 
         return foot
 
@@ -427,6 +580,7 @@ class Polynome(object):
     def __init__(self,degree):
         self.degree = degree
         self.coef = numpy.zeros( (degree+1,) , dtype=float )
+        self.exponents = numpy.arange(degree+1, dtype=float)
 
     def compute(self,time):
         if time > self.FT :
@@ -461,6 +615,33 @@ class Polynome(object):
             t = t * time ;
         return r
 
+    def evaluate(self,times):
+        """
+        evaluate polynome and its first and second derivative at once for
+        all given times as products of the Vandermonde matrix of the times
+        with the coefficients of the polynome and of its derivatives
+
+        Parameters
+        ----------
+
+        times: float or numpy.ndarray
+            evaluation times, clamped to [0, FT] like in compute
+
+        Returns
+        -------
+
+        (r, dr, ddr): tuple of numpy.ndarray of the same shape as times
+        """
+        c = self.coef
+        i = self.exponents
+        t = numpy.maximum(numpy.minimum(times, self.FT), 0.0)
+        V = t[...,None] ** i # Vandermonde matrix, i.e. V[k,i] = t_k^i
+
+        r = V.dot(c)
+        dr = V[...,:-1].dot(c[1:] * i[1:])
+        ddr = V[...,:-2].dot(c[2:] * i[2:] * i[1:-1])
+        return r, dr, ddr
+
 class Polynome5(Polynome):
     """
     Polynome5 class of walking pattern generator for humanoids, cf.
@@ -0,0 +1,331 @@
+"""
+Streaming recorder of per tick data for long-running walking pattern
+generation, i.e. instead of keeping the whole history in memory, e.g. in
+PlotData or the trajectories of Interpolation, records are appended to a
+file on disk while the generator is running.
+
+The file is a regular .npy file of a structured array, i.e. one record per
+tick with one field per key. Its header is written with spare room for the
+number of records, which is updated after each written chunk. Records are
+only appended, so a file of an interrupted run consists of a valid header
+and all written records, which load_recording() reads even while the run
+is still in progress.
+
+Example
+-------
+
+    gen.data = GeneratorRecorder('walk.npy', gen)
+    ... generator loop ...
+    gen.data.close()
+
+    data = load_recording('walk.npy')
+    data['c_k_x']   # shape (ticks, 3)
+"""
+import os
+import sys
+import threading
+import Queue
+import numpy
+from numpy.lib import format as npy_format
+
+# spare characters in the header for the growing number of records
+_HEADER_SPARE = 24
+
+# minimum length of string fields, e.g. states of the finite state machine
+_MIN_STRING_LENGTH = 16
+
+
+class Recorder(object):
+    """
+    Append-only recorder of fixed size records with bounded memory. Records
+    are collected in a pool of preallocated chunks and full chunks are
+    written by a background thread, s.t. the calling thread never waits
+    for disk I/O. When the writer falls behind and no chunk is free, the
+    records of the current chunk are dropped and counted in dropped, unless
+    the recorder is blocking.
+
+    An error of the writer stops it and is re-raised by the next call of
+    record() or close().
+    """
+
+    def __init__(self, filename, chunk_size=64, nchunks=8, fsync=False,
+        blocking=False):
+        """
+        Parameters
+        ----------
+
+        filename: str
+            path to output file, conventionally with suffix .npy
+
+        chunk_size: int
+            number of records written at once
+
+        nchunks: int
+            number of preallocated chunks, i.e. memory is bounded by
+            nchunks*chunk_size records
+
+        fsync: bool
+            force written chunks to disk, e.g. to survive power losses
+
+        blocking: bool
+            wait for a free chunk instead of dropping records, e.g. when
+            no record may be lost
+        """
+        self.filename = filename
+        self.chunk_size = chunk_size
+        self.nchunks = nchunks
+        self.fsync = fsync
+        self.blocking = blocking
+
+        # number of written and dropped records
+        self.written = 0
+        self.dropped = 0
+
+        # record layout, defined by the first record
+        self.dtype = None
+        self._chunks = []
+        self._fields = []
+
+        # current chunk and number of records in it
+        self._current = None
+        self._n = 0
+
+        self._free = Queue.Queue()
+        self._full = Queue.Queue()
+        self._file = None
+        self._header_len = 0
+        self._writer = None
+        self._closed = False
+
+        # exception info of the writer thread
+        self.error = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def record(self, values):
+        """
+        append one record
+
+        Parameters
+        ----------
+
+        values: dict
+            values of all keys, keys and their shapes have to be the same
+            in each call
+        """
+        if self._closed:
+            raise ValueError('recorder {} is closed'.format(self.filename))
+        if self.error is not None:
+            self._raise_error()
+
+        if self.dtype is None:
+            self._start(values)
+
+        fields = self._fields[self._current]
+        n = self._n
+        for key, buf in fields.iteritems():
+            buf[n] = values[key]
+        self._n = n + 1
+
+        if self._n == self.chunk_size:
+            self._submit()
+
+    def flush(self):
+        """ hand current partial chunk to the writer """
+        if self._n > 0:
+            self._submit()
+
+    def close(self):
+        """ write remaining records, wait for writer and close file """
+        if self._closed:
+            return
+        self._closed = True
+        if self._writer is None:
+            return
+
+        if self._n > 0:
+            self._full.put((self._current, self._n))
+        self._full.put(None)
+        self._writer.join()
+        self._file.close()
+        if self.error is not None:
+            self._raise_error()
+
+    def _raise_error(self):
+        """ re-raise error of the writer thread """
+        exc_type, exc_value, exc_tb = self.error
+        raise exc_type, exc_value, exc_tb
+
+    def _start(self, values):
+        """ derive record layout, allocate chunks and start writer """
+        fields = []
+        for key in sorted(values):
+            val = numpy.asarray(values[key])
+            dtype = val.dtype
+            if dtype.kind == 'O':
+                err_str = 'can not record objects of key {}'.format(key)
+                raise TypeError(err_str)
+            if dtype.kind in 'SU':
+                dtype = numpy.dtype((dtype.type, max(dtype.itemsize, _MIN_STRING_LENGTH)))
+            fields.append((str(key), dtype, val.shape))
+        self.dtype = numpy.dtype(fields)
+
+        for i in range(self.nchunks):
+            chunk = numpy.zeros((self.chunk_size,), dtype=self.dtype)
+            self._chunks.append(chunk)
+            self._fields.append(dict((key, chunk[key]) for key in self.dtype.names))
+        for i in range(1, self.nchunks):
+            self._free.put(i)
+        self._current = 0
+        self._n = 0
+
+        self._file = open(self.filename, 'wb')
+        self._write_header(0, spare=_HEADER_SPARE)
+        self._file.flush()
+
+        self._writer = threading.Thread(target=self._write_chunks)
+        self._writer.daemon = True
+        self._writer.start()
+
+    def _submit(self):
+        """ hand current chunk to the writer and continue on a free one """
+        if self.blocking:
+            self._full.put((self._current, self._n))
+            self._n = 0
+            while True:
+                try:
+                    self._current = self._free.get(True, 0.1)
+                    return
+                except Queue.Empty:
+                    # writer stopped, i.e. chunks are not freed anymore
+                    if self.error is not None:
+                        self._raise_error()
+
+        try:
+            free = self._free.get_nowait()
+        except Queue.Empty:
+            # writer is behind, overwrite current chunk
+            self.dropped += self._n
+            self._n = 0
+            return
+
+        self._full.put((self._current, self._n))
+        self._current = free
+        self._n = 0
+
+    def _write_chunks(self):
+        """ writer thread appending chunks to file """
+        f = self._file
+        try:
+            while True:
+                item = self._full.get()
+                if item is None:
+                    break
+
+                i, n = item
+                f.write(self._chunks[i][:n].tobytes())
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+                self.written += n
+                self._free.put(i)
+
+                # header is updated after data, i.e. it never counts more
+                # records than the file contains
+                f.seek(0)
+                self._write_header(self.written)
+                f.seek(0, os.SEEK_END)
+                f.flush()
+        except Exception:
+            self.error = sys.exc_info()
+
+    def _write_header(self, n, spare=0):
+        """ write .npy header of n records, which keeps its length """
+        header = "{{'descr': {!r}, 'fortran_order': False, 'shape': ({},), }}".format(
+            npy_format.dtype_to_descr(self.dtype), n
+        )
+        if not self._header_len:
+            # magic string, header length and newline, padded for alignment
+            size = len(npy_format.magic(1, 0)) + 2 + len(header) + spare + 1
+            self._header_len = len(header) + spare + 1 + (-size % 16)
+        header = header.ljust(self._header_len - 1) + '\n'
+
+        self._file.write(npy_format.magic(1, 0))
+        self._file.write(numpy.array(len(header), dtype='<u2').tobytes())
+        self._file.write(header)
+
+
+class GeneratorRecorder(Recorder):
+    """
+    Recorder of the plotting data of a pattern generator, cf. PlotData.
+    It is a drop-in replacement of the data member of the generator, i.e.
+
+        gen.data = GeneratorRecorder('walk.npy', gen)
+
+    records each tick to file instead of keeping it in memory.
+    """
+
+    def __init__(self, filename, generator, keys=None, **kwargs):
+        """
+        Parameters
+        ----------
+
+        filename: str
+            path to output file
+
+        generator: BaseGenerator instance
+            generator whose members are recorded
+
+        keys: list
+            recorded members, defaults to the keys of PlotData
+
+        kwargs:
+            cf. Recorder
+        """
+        super(GeneratorRecorder, self).__init__(filename, **kwargs)
+        self.generator = generator
+        if keys is None:
+            keys = generator._hull_keys + generator._data_keys + generator._plot_keys
+        self.keys = sorted(set(keys))
+
+    def update(self):
+        """ record members of generator """
+        gen = self.generator.__dict__
+        self.record(dict((key, gen.get(key, [])) for key in self.keys))
+
+    def reset(self):
+        """ records on disk are not discarded """
+        pass
+
+
+def load_recording(filename, mmap_mode='r'):
+    """
+    memory map records of file written by Recorder. The number of records
+    is derived from the file size, s.t. files of running or interrupted
+    recordings are read up to their last complete record.
+
+    Parameters
+    ----------
+
+    filename: str
+        path to recording
+
+    mmap_mode: str
+        mode of numpy.memmap, i.e. 'r', 'r+' or 'c'
+    """
+    with open(filename, 'rb') as f:
+        version = npy_format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = npy_format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = npy_format.read_array_header_2_0(f)
+        offset = f.tell()
+
+    n = (os.path.getsize(filename) - offset) // dtype.itemsize
+    if n == 0:
+        return numpy.zeros((0,), dtype=dtype)
+    return numpy.memmap(filename, dtype=dtype, mode=mmap_mode, offset=offset, shape=(n,))
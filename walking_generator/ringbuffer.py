@@ -0,0 +1,136 @@
+"""
+Fixed capacity queue of interpolated samples between the pattern generator
+and a low level controller, i.e. the interpolation pushes the samples of
+each QP sampling period and the controller pops one sample per control
+period, e.g. every 5 ms, from its own thread.
+
+Example
+-------
+
+    queue = RingBuffer(100, InterpolationSampleType)
+    interp = Interpolation(0.005, gen, queue=queue)
+
+    # controller thread
+    sample = numpy.zeros((), dtype=InterpolationSampleType)
+    if queue.pop(sample) is not None:
+        ... sample['com']['x'], sample['lf']['z'], ...
+"""
+import numpy
+
+
+class RingBuffer(object):
+    """
+    Lock-free single producer, single consumer ring buffer of records.
+    The producer only advances the write counter and the consumer only
+    advances the read counter, each after copying the data, s.t. neither
+    side ever waits for the other. Counters grow monotonically and are
+    mapped to slots modulo capacity.
+
+    Samples pushed into a full queue are dropped and counted in overruns,
+    pops from an empty queue are counted in underruns.
+
+    .. NOTE: push is meant to be called from one thread only and pop, peek
+             and clear from another one.
+    """
+
+    def __init__(self, capacity, dtype):
+        """
+        Parameters
+        ----------
+
+        capacity: int
+            maximum number of queued samples
+
+        dtype: numpy.dtype
+            record type of the samples, e.g. InterpolationSampleType
+        """
+        self.capacity = int(capacity)
+        self.dtype = numpy.dtype(dtype)
+        self._data = numpy.zeros((self.capacity,), dtype=self.dtype)
+
+        # number of pushed and popped samples, i.e. written by producer
+        # resp. consumer only
+        self._head = 0
+        self._tail = 0
+
+        # number of dropped samples and of pops from empty queue
+        self.overruns = 0
+        self.underruns = 0
+
+    def __len__(self):
+        return self._head - self._tail
+
+    def push(self, samples):
+        """
+        append samples, those not fitting into the queue are dropped
+
+        Parameters
+        ----------
+
+        samples: numpy.ndarray((n,), dtype=dtype)
+            samples in order of consumption
+
+        Returns
+        -------
+
+        number of queued samples
+        """
+        capacity = self.capacity
+        head = self._head
+
+        n = len(samples)
+        free = capacity - (head - self._tail)
+        if n > free:
+            self.overruns += n - free
+            n = free
+
+        # copy in up to two slices due to wrap around
+        i = head % capacity
+        k = min(n, capacity - i)
+        self._data[i:i+k] = samples[:k]
+        self._data[:n-k] = samples[k:n]
+
+        # publish samples after they are written
+        self._head = head + n
+        return n
+
+    def pop(self, out=None):
+        """
+        remove oldest sample
+
+        Parameters
+        ----------
+
+        out: numpy.ndarray((), dtype=dtype)
+            preallocated record the sample is copied to, otherwise a copy
+            is returned
+
+        Returns
+        -------
+
+        sample or None if the queue is empty
+        """
+        tail = self._tail
+        if tail == self._head:
+            self.underruns += 1
+            return None
+
+        if out is None:
+            out = self._data[tail % self.capacity].copy()
+        else:
+            out[...] = self._data[tail % self.capacity]
+
+        # release slot after sample is copied
+        self._tail = tail + 1
+        return out
+
+    def peek(self, n):
+        """ return copy of up to n oldest samples without removing them """
+        tail = self._tail
+        n = min(n, self._head - tail)
+        i = numpy.arange(tail, tail + n) % self.capacity
+        return self._data[i]
+
+    def clear(self):
+        """ remove all queued samples, counters are kept """
+        self._tail = self._head
@@ -0,0 +1,470 @@
+"""
+Asynchronous runtime of a pattern generator and its interpolation, i.e.
+instead of the serial loop of nmpc_standalone.py
+
+    gen.set_velocity_reference(...)
+    gen.solve()
+    gen.simulate()
+    interpolation.interpolate(time)
+    gen.set_initial_values(*gen.update())
+
+the solver thread runs this loop and streams the interpolated samples of
+each tick into a RingBuffer, which a controller thread consumes once per
+control period. The queue holds two QP sampling periods, i.e. the solver
+solves tick k+1 while the samples of tick k stream out and waits when it is
+one tick ahead.
+
+Velocity references are sent through a command queue and applied at the
+beginning of the next tick. After each tick the state of the generator is
+handed off through a double buffer, s.t. other threads read a consistent
+snapshot while the solver already works on the next one.
+
+The duration of each stage is collected in latency histograms:
+
+    command      time from set_velocity_reference until applied
+    solve        generator solve
+    wait         solver waiting for free space in the queue
+    interpolate  simulation and interpolation of the tick
+    update       update of the generator state and state hand-off
+    tick         whole solver tick
+    control      controller callback
+    jitter       delay of the controller wake up after its deadline
+
+Example
+-------
+
+    runtime = Runtime(gen)
+    runtime.start(ticks=220, controller=send_to_robot)
+    runtime.set_velocity_reference([0.2, 0.0, 0.0])
+    ...
+    runtime.join()
+    print runtime.statistics()['solve']['p99']
+"""
+import sys
+import time
+import bisect
+import inspect
+import threading
+import Queue
+import numpy
+
+from interpolation import Interpolation
+from ringbuffer import RingBuffer
+
+# generator members handed off after each tick
+STATE_KEYS = (
+    'c_k_x', 'c_k_y', 'c_k_q',
+    'f_k_x', 'f_k_y', 'f_k_q',
+    'F_k_x', 'F_k_y', 'F_k_q',
+    'dddC_k_x', 'dddC_k_y', 'dddC_k_q',
+)
+
+STAGES = (
+    'command', 'solve', 'wait', 'interpolate', 'update', 'tick',
+    'control', 'jitter',
+)
+
+
+class LatencyHistogram(object):
+    """
+    Histogram of durations with logarithmically spaced bins, i.e. adding
+    a sample is a binary search over the bin edges and the memory does not
+    grow with the number of samples.
+    """
+
+    def __init__(self, edges=None):
+        """
+        Parameters
+        ----------
+
+        edges: sequence of float
+            increasing bin edges in seconds, defaults to 10 bins per decade
+            from 1 us to 10 s. Samples beyond the edges are counted in an
+            underflow and an overflow bin.
+        """
+        if edges is None:
+            edges = numpy.logspace(-6, 1, 71)
+        self.edges = [float(e) for e in edges]
+        self.counts = numpy.zeros((len(self.edges) + 1,), dtype=int)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, duration):
+        """ add duration in seconds """
+        self.counts[bisect.bisect_right(self.edges, duration)] += 1
+        self.count += 1
+        self.total += duration
+        if duration > self.max:
+            self.max = duration
+
+    def mean(self):
+        """ mean duration in seconds """
+        if self.count == 0:
+            return 0.0
+        return self.total / self.count
+
+    def percentile(self, q):
+        """
+        upper bound of the q-th percentile in seconds, i.e. the upper edge
+        of the bin containing it, but at most the maximum
+
+        Parameters
+        ----------
+
+        q: float
+            percentile in [0, 100]
+        """
+        if self.count == 0:
+            return 0.0
+        rank = q / 100.0 * self.count
+        i = int(numpy.searchsorted(numpy.cumsum(self.counts), rank))
+        if i >= len(self.edges):
+            return self.max
+        return min(self.edges[i], self.max)
+
+    def summary(self):
+        """ return count, mean, percentiles and maximum as dictionary """
+        return {
+            'count' : self.count,
+            'mean'  : self.mean(),
+            'p50'   : self.percentile(50),
+            'p90'   : self.percentile(90),
+            'p99'   : self.percentile(99),
+            'max'   : self.max,
+        }
+
+    def clear(self):
+        """ remove all samples """
+        self.counts[...] = 0
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+
+class DoubleBuffer(object):
+    """
+    Hand-off of records from one writer to many readers. The writer fills
+    the back buffer and publishes it by swapping front and back, so readers
+    never see a partially written record. A read is repeated when the
+    writer published during the copy.
+    """
+
+    def __init__(self, dtype):
+        """
+        Parameters
+        ----------
+
+        dtype: numpy.dtype
+            record type
+        """
+        self._buffers = numpy.zeros((2,), dtype=dtype)
+        self._front = 0
+
+        # number of published records
+        self.version = 0
+
+    def back(self):
+        """ return back buffer, which is written in place """
+        return self._buffers[1 - self._front]
+
+    def publish(self):
+        """ swap front and back buffer """
+        self._front = 1 - self._front
+        self.version += 1
+
+    def read(self):
+        """ return copy of front buffer or None before the first publish """
+        while True:
+            version = self.version
+            if version == 0:
+                return None
+            record = self._buffers[self._front].copy()
+            if self.version == version:
+                return record
+
+
+class Runtime(object):
+    """
+    Runtime of a pattern generator with separate solver and controller
+    threads, cf. module documentation.
+    """
+
+    def __init__(self, generator, interpolation=None, Tc=0.005, capacity=None,
+        keys=None, realtime=True, use_deadline=False):
+        """
+        Parameters
+        ----------
+
+        generator: NMPCGenerator or ClassicGenerator instance
+            pattern generator with set initial values
+
+        interpolation: Interpolation instance
+            interpolation of generator, constructed with Tc when omitted
+
+        Tc: float
+            sampling period of the controller
+
+        capacity: int
+            capacity of the queue of samples, defaults to two QP sampling
+            periods
+
+        keys: sequence of str
+            generator members handed off after each tick, cf. STATE_KEYS
+
+        realtime: bool
+            controller pops one sample per Tc, otherwise as fast as samples
+            are available, e.g. for simulations
+
+        use_deadline: bool
+            solve with the deadline of the controller running out of
+            samples, i.e. the time of the last push plus the queued samples
+            times Tc, cf. NMPCGenerator.solve. The first tick is solved
+            without deadline. Requires realtime and a generator solving
+            with deadline.
+        """
+        if use_deadline:
+            if not realtime:
+                raise ValueError('deadlines require a realtime controller')
+            if 'deadline' not in inspect.getargspec(generator.solve).args:
+                err_str = '{}.solve does not support deadlines'
+                raise ValueError(err_str.format(type(generator).__name__))
+
+        self.generator = generator
+        if interpolation is None:
+            interpolation = Interpolation(Tc, generator)
+        self.interpolation = interpolation
+        self.Tc = interpolation.Tc
+        self.realtime = realtime
+        self.use_deadline = use_deadline
+
+        n = interpolation.interval
+        if capacity is None:
+            capacity = 2*n
+        if capacity < n:
+            err_str = 'queue capacity {} is smaller than one QP sampling period ({})'
+            raise ValueError(err_str.format(capacity, n))
+        if interpolation.queue is None:
+            interpolation.queue = RingBuffer(capacity, interpolation.samples.dtype)
+        self.queue = interpolation.queue
+
+        # state hand-off
+        if keys is None:
+            keys = STATE_KEYS
+        self.keys = tuple(keys)
+        fields = [('tick', int), ('time', float)]
+        for key in self.keys:
+            val = numpy.asarray(getattr(generator, key))
+            fields.append((key, val.dtype, val.shape))
+        self._state = DoubleBuffer(numpy.dtype(fields))
+
+        self.commands = Queue.Queue()
+        self.histograms = dict((stage, LatencyHistogram()) for stage in STAGES)
+
+        # number of finished ticks
+        self.tick = 0
+        self.error = None
+
+        self._stop = threading.Event()
+        self._done = threading.Event()
+        self._space = threading.Event()
+        self._samples = threading.Event()
+        self._threads = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+        self.join()
+
+    def start(self, ticks=None, controller=None):
+        """
+        start solver thread and controller thread
+
+        Parameters
+        ----------
+
+        ticks: int
+            number of QP sampling periods, runs until stop() when None
+
+        controller: callable
+            called with each sample, i.e. an InterpolationSampleType record
+            which is reused for the next sample. Without controller samples
+            are popped from queue by the caller.
+        """
+        if self._threads:
+            raise RuntimeError('runtime is already started')
+
+        solver = threading.Thread(target=self._solve_loop, args=(ticks,))
+        solver.daemon = True
+        self._threads.append(solver)
+        if controller is not None:
+            control = threading.Thread(target=self._control_loop, args=(controller,))
+            control.daemon = True
+            self._threads.append(control)
+
+        for thread in self._threads:
+            thread.start()
+
+    def set_velocity_reference(self, local_vel_ref):
+        """
+        send velocity reference, which is applied at the beginning of the
+        next tick, cf. BaseGenerator.set_velocity_reference
+        """
+        self.commands.put((local_vel_ref, time.time()))
+
+    def state(self):
+        """
+        return copy of the generator state after the last tick, i.e. a
+        record with tick, time and the members of keys, or None before the
+        first tick
+        """
+        return self._state.read()
+
+    def statistics(self):
+        """ return summary of latency histogram of each stage """
+        return dict((stage, hist.summary()) for stage, hist in self.histograms.iteritems())
+
+    def stop(self):
+        """ stop threads after the current tick resp. sample """
+        self._stop.set()
+        self._space.set()
+        self._samples.set()
+
+    def join(self, timeout=None):
+        """ wait for threads and re-raise an error of the solver thread """
+        for thread in self._threads:
+            thread.join(timeout)
+        if self.error is not None:
+            exc_type, exc_value, exc_tb = self.error
+            raise exc_type, exc_value, exc_tb
+
+    def _solve_loop(self, ticks):
+        """ solver thread """
+        # rename for convenience
+        gen = self.generator
+        interp = self.interpolation
+        hist = self.histograms
+        clock = time.time
+
+        # time the controller runs out of samples, unknown before first push
+        deadline = None
+
+        try:
+            while not self._stop.is_set() and (ticks is None or self.tick < ticks):
+                t0 = clock()
+                self._apply_commands(t0)
+                if self.use_deadline and deadline is not None:
+                    gen.solve(deadline=deadline)
+                else:
+                    gen.solve()
+                t1 = clock()
+
+                # solver is at most one tick ahead of the controller
+                if not self._wait_for_space(interp.interval):
+                    break
+                t2 = clock()
+
+                gen.simulate()
+                interp.interpolate(self.tick*gen.T)
+                t3 = clock()
+                # controller pops one sample per Tc from the pushed ones on
+                deadline = t3 + len(self.queue)*self.Tc
+                self._samples.set()
+
+                gen.set_initial_values(*gen.update())
+                self._publish_state()
+                self.tick += 1
+                t4 = clock()
+
+                hist['solve'].add(t1 - t0)
+                hist['wait'].add(t2 - t1)
+                hist['interpolate'].add(t3 - t2)
+                hist['update'].add(t4 - t3)
+                hist['tick'].add(t4 - t0)
+        except Exception:
+            self.error = sys.exc_info()
+            self._stop.set()
+        finally:
+            self._done.set()
+            self._samples.set()
+
+    def _apply_commands(self, now):
+        """ apply velocity references from command queue, the last one wins """
+        while True:
+            try:
+                local_vel_ref, sent = self.commands.get_nowait()
+            except Queue.Empty:
+                break
+
+            self.generator.set_velocity_reference(local_vel_ref)
+            self.histograms['command'].add(now - sent)
+
+    def _wait_for_space(self, n):
+        """ wait until n samples fit into queue, False when stopped """
+        queue = self.queue
+        while queue.capacity - len(queue) < n:
+            if self._stop.is_set():
+                return False
+            self._space.clear()
+            if queue.capacity - len(queue) >= n:
+                break
+            self._space.wait(self.Tc)
+        return not self._stop.is_set()
+
+    def _publish_state(self):
+        """ copy generator state to back buffer and publish it """
+        gen = self.generator
+        state = self._state.back()
+        state['tick'] = self.tick + 1
+        state['time'] = (self.tick + 1)*gen.T
+        for key in self.keys:
+            state[key] = getattr(gen, key)
+        self._state.publish()
+
+    def _control_loop(self, controller):
+        """ controller thread """
+        # rename for convenience
+        queue = self.queue
+        hist = self.histograms
+        clock = time.time
+        sample = numpy.zeros((), dtype=queue.dtype)
+
+        try:
+            # controller starts with the samples of the first tick
+            while len(queue) == 0 and not self._done.is_set():
+                self._samples.wait(self.Tc)
+                self._samples.clear()
+
+            deadline = clock()
+            while not self._stop.is_set():
+                if self.realtime:
+                    delay = deadline - clock()
+                    if delay > 0.0:
+                        time.sleep(delay)
+                    hist['jitter'].add(max(clock() - deadline, 0.0))
+                    deadline += self.Tc
+                    if self._done.is_set() and len(queue) == 0:
+                        break
+                    # underruns are counted by the queue
+                    if queue.pop(sample) is None:
+                        continue
+                else:
+                    while len(queue) == 0 and not self._done.is_set():
+                        self._samples.clear()
+                        if len(queue) > 0:
+                            break
+                        self._samples.wait(self.Tc)
+                    if len(queue) == 0:
+                        break
+                    queue.pop(sample)
+                self._space.set()
+
+                t0 = clock()
+                controller(sample)
+                hist['control'].add(clock() - t0)
+        except Exception:
+            self.error = sys.exc_info()
+            self._stop.set()
+            self._space.set()
@@ -0,0 +1,793 @@
+import time
+import numpy
+import activeset
+
+# qpOASES is optional, generators fall back to the native backends when its
+# python interface is not available
+try:
+    import qpoases
+except ImportError:
+    qpoases = None
+
+# return values following qpOASES conventions
+SUCCESSFUL_RETURN    = 0
+RET_MAX_NWSR_REACHED = 64
+
+# returned by the native backends on infeasible QPs
+RET_QP_INFEASIBLE    = 37
+
+# recorded by the generators when the deadline passed before the QP solve
+RET_DEADLINE_MISSED  = -1
+
+class QPSolver(object):
+    """
+    Interface of the QP solver backends of the pattern generators. Solves
+    dense QPs of the form
+
+    min_x 1/2 * x^T * H * x + x^T g
+    s.t.   lbA <= A * x <= ubA
+            lb <=     x <= ub
+
+    where all matrices may change between calls. The first call of solve()
+    is a cold start, all subsequent calls are warm started from the internal
+    state of the last solution, like qpOASES' init() and hotstart().
+    """
+
+    def __init__(self, nv, nc, print_level=None):
+        """
+        Parameters
+        ----------
+
+        nv: int
+            number of variables
+
+        nc: int
+            number of linear constraints
+
+        print_level: str
+            verbosity of the backend, i.e. 'none', 'low', 'medium' or
+            'high', None keeps the default of the backend
+        """
+        self.nv = nv
+        self.nc = nc
+        self.print_level = print_level
+        self.is_initialized = False
+
+    def solve(self, H, g, A, lb, ub, lbA, ubA, nwsr, cpu_time):
+        """
+        solve QP warm started from last solution if available
+
+        Parameters
+        ----------
+
+        H: numpy.ndarray((nv, nv))
+        g: numpy.ndarray((nv,))
+        A: numpy.ndarray((nc, nv))
+        lb, ub: numpy.ndarray((nv,))
+        lbA, ubA: numpy.ndarray((nc,))
+            QP data, infinite bounds are given as +-1e+08
+
+        nwsr: int
+            maximum number of working set recalculations, only used by
+            active set backends
+
+        cpu_time: float
+            maximum CPU time in seconds, 0 is no upper limit
+
+        Returns
+        -------
+
+        ret: int
+            SUCCESSFUL_RETURN or error code
+        nwsr: int
+            number of working set recalculations resp. iterations
+        cputime: float
+            CPU time of the solution in seconds
+        """
+        raise NotImplementedError
+
+    def get_primal_solution(self, out):
+        """ write primal solution x of shape (nv,) into out """
+        raise NotImplementedError
+
+    def get_objective_value(self):
+        """ return objective value of the primal solution """
+        raise NotImplementedError
+
+    def get_dual_solution(self, out):
+        """
+        write dual solution of shape (nv+nc,) into out, i.e. multipliers of
+        the bounds followed by multipliers of the linear constraints. Like in
+        qpOASES multipliers are positive for active lower bounds and
+        negative for active upper bounds.
+        """
+        raise NotImplementedError
+
+    def reset(self):
+        """ drop warm start information, i.e. next call is a cold start """
+        self.is_initialized = False
+
+    def shift_working_set(self, row_map):
+        """
+        move the working set of the last solution to other constraints,
+        e.g. by one sample when the horizon is shifted. Backends without
+        access to their working set ignore it.
+
+        Parameters
+        ----------
+
+        row_map: numpy.ndarray((nv+nc,), dtype=int)
+            new index of each bound resp. linear constraint in the layout of
+            get_dual_solution(), -1 drops it from the working set
+        """
+        pass
+
+
+class QPOASESSolver(QPSolver):
+    """
+    Backend using qpOASES SQProblem with init() and hotstart()
+    """
+
+    def __init__(self, nv, nc, print_level=None):
+        super(QPOASESSolver, self).__init__(nv, nc, print_level)
+
+        if qpoases is None:
+            err_str = 'Please install qpOASES python interface, ' \
+                    + 'else use one of the NumPy backends.'
+            raise ImportError(err_str)
+
+        self.options = qpoases.PyOptions()
+        self.options.setToMPC()
+        if print_level is not None:
+            self.options.printLevel = getattr(
+                qpoases.PyPrintLevel, print_level.upper()
+            )
+
+        self.reset()
+
+    def reset(self):
+        """ drop warm start information, i.e. next call is a cold start """
+        super(QPOASESSolver, self).reset()
+        self.qp = qpoases.PySQProblem(self.nv, self.nc)
+        self.qp.setOptions(self.options)
+
+    def solve(self, H, g, A, lb, ub, lbA, ubA, nwsr, cpu_time):
+        if not self.is_initialized:
+            ret, nwsr, cputime = self.qp.init(
+                H, g, A, lb, ub, lbA, ubA, nwsr, cpu_time
+            )
+            self.is_initialized = True
+        else:
+            ret, nwsr, cputime = self.qp.hotstart(
+                H, g, A, lb, ub, lbA, ubA, nwsr, cpu_time
+            )
+        return ret, nwsr, cputime
+
+    def get_primal_solution(self, out):
+        self.qp.getPrimalSolution(out)
+
+    def get_objective_value(self):
+        return self.qp.getObjVal()
+
+    def get_dual_solution(self, out):
+        self.qp.getDualSolution(out)
+
+
+class ADMMSolver(QPSolver):
+    """
+    Pure NumPy operator splitting QP solver following OSQP, i.e. ADMM on
+
+    min_x 1/2 * x^T * H * x + x^T g
+    s.t.   l <= C * x <= u
+
+    with C = ( I ), l = (  lb ), u = (  ub )
+             ( A )      ( lbA )      ( ubA )
+
+    The problem is equilibrated by modified Ruiz scaling, because the
+    walking QPs are badly scaled, e.g. by the small jerk weights. Each
+    iteration costs one product with the inverse of the regularized KKT
+    matrix K = H + sigma*I + C^T * diag(rho) * C, which is factorized once
+    per solve and after each adaptation of rho. Afterwards the solution is
+    polished by solving the equality constrained QP on the detected active
+    set. Iterates x, z, y and rho are kept for warm starts.
+    """
+
+    # rows with bounds beyond are treated as unconstrained
+    INFTY = 1e+07
+
+    def __init__(
+        self, nv, nc, print_level=None,
+        rho=0.1, sigma=1e-06, alpha=1.6,
+        eps_abs=1e-06, eps_rel=1e-06, max_iter=4000,
+        check_interval=5, adaptive_rho_interval=25,
+        scaling=10, polish=True
+    ):
+        """
+        Parameters
+        ----------
+
+        nv, nc, print_level:
+            cf. QPSolver
+
+        rho: float
+            initial step size of inequality constraints, equality
+            constraints use 1e+03*rho
+
+        sigma: float
+            regularization of the primal variables
+
+        alpha: float
+            relaxation parameter in ]0, 2[
+
+        eps_abs, eps_rel: float
+            absolute and relative tolerances of scaled primal and dual
+            residuals
+
+        max_iter: int
+            maximum number of iterations
+
+        check_interval: int
+            number of iterations between termination checks
+
+        adaptive_rho_interval: int
+            number of iterations between adaptations of rho, 0 disables
+
+        scaling: int
+            number of Ruiz equilibration iterations, 0 disables
+
+        polish: bool
+            refine solution on detected active set
+        """
+        super(ADMMSolver, self).__init__(nv, nc, print_level)
+
+        self.rho     = rho
+        self.sigma   = sigma
+        self.alpha   = alpha
+        self.eps_abs = eps_abs
+        self.eps_rel = eps_rel
+        self.max_iter = max_iter
+        self.check_interval = check_interval
+        self.adaptive_rho_interval = adaptive_rho_interval
+        self.scaling = scaling
+        self.polish  = polish
+
+        # unscaled iterates for warm starts
+        m = nv + nc
+        self.x = numpy.zeros((nv,), dtype=float)
+        self.z = numpy.zeros((m,),  dtype=float)
+        self.y = numpy.zeros((m,),  dtype=float)
+        self._rho_scale = 1.0
+        self._obj_val = 0.0
+
+    def reset(self):
+        """ drop warm start information, i.e. next call is a cold start """
+        super(ADMMSolver, self).reset()
+        self.x[...] = 0.0
+        self.z[...] = 0.0
+        self.y[...] = 0.0
+        self._rho_scale = 1.0
+
+    def _equilibrate(self, H, C):
+        """
+        modified Ruiz equilibration of the KKT matrix, returns scaling D of
+        variables, E of constraints and c of the cost
+        """
+        nv, m = self.nv, C.shape[0]
+        D = numpy.ones((nv,), dtype=float)
+        E = numpy.ones((m,),  dtype=float)
+        Hs = H.copy()
+        Cs = C.copy()
+        for i in range(self.scaling):
+            col = numpy.maximum(numpy.abs(Hs).max(axis=0), numpy.abs(Cs).max(axis=0))
+            row = numpy.abs(Cs).max(axis=1)
+            dD = 1. / numpy.sqrt(numpy.clip(col, 1e-04, 1e+04))
+            dE = 1. / numpy.sqrt(numpy.clip(row, 1e-04, 1e+04))
+            dD[col == 0.0] = 1.0
+            dE[row == 0.0] = 1.0
+            Hs *= dD[:,numpy.newaxis] * dD[numpy.newaxis,:]
+            Cs *= dE[:,numpy.newaxis] * dD[numpy.newaxis,:]
+            D *= dD
+            E *= dE
+
+        # cost scaling
+        c = numpy.abs(Hs).max(axis=0).mean()
+        c = 1. / numpy.clip(c, 1e-04, 1e+04)
+        return D, E, c
+
+    def solve(self, H, g, A, lb, ub, lbA, ubA, nwsr, cpu_time):
+        t0 = time.time()
+
+        # rename for convenience
+        nv = self.nv
+        sigma = self.sigma
+        alpha = self.alpha
+
+        C = numpy.vstack((numpy.eye(nv), A))
+        l = numpy.hstack((lb, lbA))
+        u = numpy.hstack((ub, ubA))
+
+        # step sizes per row depending on type of bounds
+        free  = (l < -self.INFTY) & (u > self.INFTY)
+        equal = (u - l) < 1e-10
+
+        # scaled problem
+        # x = D xs, y = E ys / c, z = zs / E
+        if self.scaling:
+            D, E, c = self._equilibrate(H, C)
+        else:
+            D, E, c = numpy.ones(nv), numpy.ones(l.shape), 1.0
+        Hs = c * D[:,numpy.newaxis] * H * D[numpy.newaxis,:]
+        gs = c * D * g
+        Cs = E[:,numpy.newaxis] * C * D[numpy.newaxis,:]
+        ls = numpy.where(l < -self.INFTY, -numpy.inf, E*l)
+        us = numpy.where(u >  self.INFTY,  numpy.inf, E*u)
+
+        # warm start
+        if not self.is_initialized:
+            self.reset()
+            self.is_initialized = True
+        x = self.x / D
+        z = numpy.clip(E * self.z, ls, us)
+        y = c * self.y / E
+
+        def factorize(scale):
+            rho_vec = numpy.empty(l.shape, dtype=float)
+            rho_vec[...] = self.rho * scale
+            rho_vec[free]  = 1e-06
+            rho_vec[equal] = 1e+03 * self.rho * scale
+            K = Hs + sigma*numpy.eye(nv) \
+              + Cs.transpose().dot(rho_vec[:,numpy.newaxis] * Cs)
+            return rho_vec, numpy.linalg.inv(K)
+
+        rho_vec, Kinv = factorize(self._rho_scale)
+
+        ret = RET_MAX_NWSR_REACHED
+        it = 0
+        for it in range(1, self.max_iter+1):
+            # x_tilde from regularized KKT system
+            rhs = sigma*x - gs + Cs.transpose().dot(rho_vec*z - y)
+            x_tilde = Kinv.dot(rhs)
+            z_tilde = Cs.dot(x_tilde)
+
+            # relaxation and projection onto bounds
+            x = alpha*x_tilde + (1. - alpha)*x
+            z_relax = alpha*z_tilde + (1. - alpha)*z
+            z_new = numpy.clip(z_relax + y/rho_vec, ls, us)
+            y = y + rho_vec*(z_relax - z_new)
+            z = z_new
+
+            if it % self.check_interval:
+                continue
+
+            # primal and dual residuals
+            Cx  = Cs.dot(x)
+            Hx  = Hs.dot(x)
+            Cty = Cs.transpose().dot(y)
+            r_prim = numpy.abs(Cx - z).max()
+            r_dual = numpy.abs(Hx + gs + Cty).max()
+
+            n_prim = max(numpy.abs(Cx).max(), numpy.abs(z).max())
+            n_dual = max(
+                numpy.abs(Hx).max(), numpy.abs(Cty).max(), numpy.abs(gs).max()
+            )
+            if r_prim <= self.eps_abs + self.eps_rel*n_prim \
+            and r_dual <= self.eps_abs + self.eps_rel*n_dual:
+                ret = SUCCESSFUL_RETURN
+                break
+
+            if cpu_time and time.time() - t0 > cpu_time:
+                break
+
+            # balance primal and dual residuals
+            if self.adaptive_rho_interval \
+            and not it % self.adaptive_rho_interval:
+                ratio = numpy.sqrt(
+                    (r_prim / (n_prim + 1e-30)) / (r_dual / (n_dual + 1e-30) + 1e-30)
+                )
+                if ratio > 5. or ratio < 0.2:
+                    self._rho_scale = min(max(self._rho_scale*ratio, 1e-06), 1e+06)
+                    rho_vec, Kinv = factorize(self._rho_scale)
+
+        if self.polish:
+            x, z, y = self._polish(Hs, gs, Cs, ls, us, x, z, y)
+
+        # unbounded rows are never active
+        y[free] = 0.0
+
+        # unscale iterates
+        self.x[...] = D * x
+        self.z[...] = z / E
+        self.y[...] = E * y / c
+        self._obj_val = 0.5*self.x.dot(H).dot(self.x) + g.dot(self.x)
+
+        return ret, it, time.time() - t0
+
+    def _polish(self, H, g, C, l, u, x, z, y, delta=1e-09, refine=3):
+        """
+        solve equality constrained QP on the active set estimated from the
+        ADMM iterates, the result is only taken when it is feasible.
+        """
+        lower = z - l < -y
+        upper = u - z <  y
+        act = lower | upper
+        b = numpy.where(lower, l, u)[act]
+        Ca = C[act]
+
+        # regularized KKT system with iterative refinement
+        nv, na = self.nv, Ca.shape[0]
+        K = numpy.zeros((nv + na, nv + na), dtype=float)
+        K[:nv,:nv] = H
+        K[:nv,nv:] = Ca.transpose()
+        K[nv:,:nv] = Ca
+        Kreg = K.copy()
+        Kreg[:nv,:nv] += delta*numpy.eye(nv)
+        Kreg[nv:,nv:] -= delta*numpy.eye(na)
+        rhs = numpy.hstack((-g, b))
+        try:
+            sol = numpy.linalg.solve(Kreg, rhs)
+            for i in range(refine):
+                sol += numpy.linalg.solve(Kreg, rhs - K.dot(sol))
+        except numpy.linalg.LinAlgError:
+            return x, z, y
+
+        xp = sol[:nv]
+        Cx = C.dot(xp)
+        tol = self.eps_abs * max(1.0, numpy.abs(Cx).max())
+        if (Cx < l - tol).any() or (Cx > u + tol).any():
+            return x, z, y
+
+        yp = numpy.zeros(y.shape, dtype=float)
+        yp[act] = sol[nv:]
+        return xp, Cx, yp
+
+    def get_primal_solution(self, out):
+        out[...] = self.x
+
+    def get_objective_value(self):
+        return self._obj_val
+
+    def get_dual_solution(self, out):
+        numpy.negative(self.y, out=out)
+
+
+class ActiveSetSolver(QPSolver):
+    """
+    Native dense dual active set backend, cf. activeset.DualActiveSet. The
+    working set of the last solution is carried over to the next call like
+    in qpOASES hotstart(), the returned nwsr counts the working set changes.
+    """
+
+    def __init__(self, nv, nc, print_level=None, **kwargs):
+        """
+        Parameters
+        ----------
+
+        nv, nc, print_level:
+            cf. QPSolver
+
+        kwargs:
+            options of activeset.DualActiveSet, i.e. reg, eps_feas, eps_dep
+        """
+        super(ActiveSetSolver, self).__init__(nv, nc, print_level)
+        self.qp = activeset.DualActiveSet(nv, **kwargs)
+
+        # stacked constraints C = (I, A)^T and bounds l, u
+        m = nv + nc
+        self._C = numpy.zeros((m, nv), dtype=float)
+        self._C[:nv,:nv] = numpy.eye(nv)
+        self._l = numpy.zeros((m,), dtype=float)
+        self._u = numpy.zeros((m,), dtype=float)
+
+        self.x = numpy.zeros((nv,), dtype=float)
+        self.y = numpy.zeros((m,),  dtype=float)
+        self._obj_val = 0.0
+
+    def reset(self):
+        """ drop warm start information, i.e. next call is a cold start """
+        super(ActiveSetSolver, self).reset()
+        self.qp.reset()
+
+    def shift_working_set(self, row_map):
+        # NOTE rows of C = (I, A)^T follow the layout of the dual solution
+        self.qp.remap(row_map)
+
+    def solve(self, H, g, A, lb, ub, lbA, ubA, nwsr, cpu_time):
+        t0 = time.time()
+
+        # rename for convenience
+        nv = self.nv
+        C = self._C
+        l = self._l
+        u = self._u
+
+        C[nv:] = A
+        l[:nv] = lb; l[nv:] = lbA
+        u[:nv] = ub; u[nv:] = ubA
+
+        if not self.is_initialized:
+            self.qp.reset()
+            self.is_initialized = True
+
+        status, x, y = self.qp.solve(H, g, C, l, u, nwsr, cpu_time)
+        self.x[...] = x
+        self.y[...] = y
+        self._obj_val = 0.5*x.dot(H).dot(x) + g.dot(x)
+
+        ret = {
+            activeset.SUCCESS:    SUCCESSFUL_RETURN,
+            activeset.MAX_NWSR:   RET_MAX_NWSR_REACHED,
+            activeset.INFEASIBLE: RET_QP_INFEASIBLE,
+        }[status]
+        return ret, self.qp.nwsr, time.time() - t0
+
+    def get_primal_solution(self, out):
+        out[...] = self.x
+
+    def get_objective_value(self):
+        return self._obj_val
+
+    def get_dual_solution(self, out):
+        out[...] = self.y
+
+
+class NullSpaceSolver(QPSolver):
+    """
+    Wrapper eliminating the equality constraints lbA == ubA of the QP by null
+    space projection before calling a backend, i.e. with the particular
+    solution x_p of A_eq * x = b_eq and a basis Z of the null space of A_eq
+
+    x = x_p + Z * u
+
+    the backend solves the reduced QP
+
+    min_u 1/2 * u^T * (Z^T H Z) * u + u^T Z^T (g + H x_p)
+    s.t.   lbA - A_in x_p <= A_in Z * u <= ubA - A_in x_p
+            lb - x_p      <=      Z * u <=  ub - x_p
+
+    where only finite bounds of x are kept as general constraints. Variables
+    not appearing in the equalities are kept as they are, such that e.g. the
+    x/y block structure of the position QP survives, and only the remaining
+    variables are transformed by a singular value decomposition of A_eq,
+    which is reused as long as A_eq does not change. Backends are allocated
+    per size of the reduced QP and keep their warm start information.
+
+    Inequalities and bounds only depending on eliminated variables are
+    constant and checked at x_p, as are the equalities themselves, a
+    violation returns RET_QP_INFEASIBLE.
+    """
+
+    # bounds beyond are treated as infinite
+    INFTY = 1e+07
+
+    # tolerated violation of constraints fixed by the equalities
+    EPS_FEAS = 1e-08
+
+    def __init__(self, name, nv, nc, print_level=None, **kwargs):
+        """
+        Parameters
+        ----------
+
+        name: str
+            name of the backend solving the reduced QPs, cf. make_solver
+
+        nv, nc, print_level:
+            cf. QPSolver
+
+        kwargs:
+            additional options of the backend
+        """
+        super(NullSpaceSolver, self).__init__(nv, nc, print_level)
+        self.name = name
+        self.kwargs = kwargs
+
+        # backends per size of reduced QP
+        self._backends = {}
+        self.qp = None
+
+        # null space decomposition of last A_eq, cf. _decompose()
+        self._A_eq = None
+        self._Z = None
+        self._P = None
+
+        self.x = numpy.zeros((nv,), dtype=float)
+        self.y = numpy.zeros((nv+nc,), dtype=float)
+        self._obj_val = 0.0
+
+    def reset(self):
+        """ drop warm start information, i.e. next call is a cold start """
+        super(NullSpaceSolver, self).reset()
+        for qp in self._backends.values():
+            qp.reset()
+
+    def _decompose(self, A_eq, tol=1e-10):
+        """
+        return null space basis Z and pseudo inverse P of A_eq, variables not
+        appearing in A_eq are mapped one to one
+        """
+        if self._A_eq is not None and numpy.array_equal(A_eq, self._A_eq):
+            return self._Z, self._P
+        self._A_eq = A_eq.copy()
+
+        nv = self.nv
+        support = A_eq.any(axis=0)
+        free = numpy.flatnonzero(~support)
+        used = numpy.flatnonzero(support)
+
+        # A_eq[:,used] = U * diag(s) * V^T with rank r
+        if used.shape[0]:
+            U, s, Vt = numpy.linalg.svd(A_eq[:,used])
+            r = (s > tol*s[0]).sum()
+        else:
+            U, s, Vt = numpy.eye(A_eq.shape[0]), numpy.zeros((0,)), numpy.zeros((0,0))
+            r = 0
+
+        Z = numpy.zeros((nv, free.shape[0] + used.shape[0] - r), dtype=float)
+        Z[free, numpy.arange(free.shape[0])] = 1.0
+        Z[used, free.shape[0]:] = Vt[r:].transpose()
+
+        P = numpy.zeros((nv, A_eq.shape[0]), dtype=float)
+        P[used] = (Vt[:r].transpose() / s[:r]).dot(U[:,:r].transpose())
+
+        self._Z = Z
+        self._P = P
+        return Z, P
+
+    def solve(self, H, g, A, lb, ub, lbA, ubA, nwsr, cpu_time):
+        t0 = time.time()
+
+        # rename for convenience
+        nv = self.nv
+
+        # classify rows, rows without coefficients are dropped
+        nonzero = A.any(axis=1)
+        eq  = nonzero & (lbA == ubA)
+        ineq = nonzero & ~eq & ((lbA > -self.INFTY) | (ubA < self.INFTY))
+        bnd = (lb > -self.INFTY) | (ub < self.INFTY)
+
+        Z, P = self._decompose(A[eq])
+        x_p = P.dot(lbA[eq])
+
+        # inequalities and bounds only depending on eliminated variables are
+        # constant, i.e. checked at x_p together with the equalities
+        AZ = A.dot(Z)
+        depends = _abs_row_max(AZ) > 1e-12*_abs_row_max(A)
+        const = eq | (ineq & ~depends)
+        ineq &= depends
+        const_bnd = bnd & ~Z.any(axis=1)
+        bnd &= Z.any(axis=1)
+
+        x = self.x
+        y = self.y
+        if not self._is_feasible(A, lb, ub, lbA, ubA, x_p, const, const_bnd):
+            x[...] = x_p
+            y[...] = 0.0
+            self._obj_val = 0.5*x.dot(H).dot(x) + g.dot(x)
+            return RET_QP_INFEASIBLE, 0, time.time() - t0
+
+        # reduced QP
+        A_in = A[ineq]
+        H_r = Z.transpose().dot(H).dot(Z)
+        g_r = Z.transpose().dot(g + H.dot(x_p))
+        A_r = numpy.vstack((Z[bnd], AZ[ineq]))
+        s_r = numpy.hstack((x_p[bnd], A_in.dot(x_p)))
+        lbA_r = numpy.hstack((lb[bnd], lbA[ineq])) - s_r
+        ubA_r = numpy.hstack((ub[bnd], ubA[ineq])) - s_r
+
+        nc_r, nv_r = A_r.shape
+        u = numpy.zeros((nv_r,), dtype=float)
+        y_r = numpy.zeros((nv_r + nc_r,), dtype=float)
+        if nv_r > 0:
+            key = (nv_r, nc_r)
+            if key not in self._backends:
+                self._backends[key] = make_solver(
+                    self.name, nv_r, nc_r, print_level=self.print_level, **self.kwargs
+                )
+            qp = self.qp = self._backends[key]
+            if not self.is_initialized:
+                qp.reset()
+                self.is_initialized = True
+
+            lb_r = -numpy.ones((nv_r,))*1e+08
+            ub_r =  numpy.ones((nv_r,))*1e+08
+            ret, nwsr, cputime = qp.solve(
+                H_r, g_r, A_r, lb_r, ub_r, lbA_r, ubA_r, nwsr, cpu_time
+            )
+            qp.get_primal_solution(u)
+            qp.get_dual_solution(y_r)
+        else:
+            # equalities fix all variables, i.e. x_p is the solution
+            ret, nwsr = SUCCESSFUL_RETURN, 0
+
+        # recover primal solution
+        x[...] = x_p + Z.dot(u)
+        self._obj_val = 0.5*x.dot(H).dot(x) + g.dot(x)
+
+        # recover multipliers, the ones of the equalities from stationarity
+        # H*x + g = C^T * y in the least squares sense
+        y[...] = 0.0
+        n_bnd = bnd.sum()
+        y[:nv][bnd] = y_r[nv_r:nv_r+n_bnd]
+        y[nv:][ineq] = y_r[nv_r+n_bnd:]
+        res = H.dot(x) + g - y[:nv] - A.transpose().dot(y[nv:])
+        y[nv:][eq] = P.transpose().dot(res)
+
+        return ret, nwsr, time.time() - t0
+
+    def _is_feasible(self, A, lb, ub, lbA, ubA, x_p, rows, bnd):
+        """
+        check the constant constraints at x_p, i.e. the equalities and the
+        given rows and bounds only depending on eliminated variables
+        """
+        Ax = A[rows].dot(x_p)
+        viol = numpy.maximum(lbA[rows] - Ax, Ax - ubA[rows])
+        if (viol > self.EPS_FEAS*(1.0 + numpy.abs(Ax))).any():
+            return False
+
+        x = x_p[bnd]
+        viol = numpy.maximum(lb[bnd] - x, x - ub[bnd])
+        return not (viol > self.EPS_FEAS*(1.0 + numpy.abs(x))).any()
+
+    def get_primal_solution(self, out):
+        out[...] = self.x
+
+    def get_objective_value(self):
+        return self._obj_val
+
+    def get_dual_solution(self, out):
+        out[...] = self.y
+
+
+def _abs_row_max(M):
+    """ maximum absolute value of each row of M, zero without columns """
+    if M.shape[1] == 0:
+        return numpy.zeros((M.shape[0],), dtype=float)
+    return numpy.abs(M).max(axis=1)
+
+
+# registered solver backends
+SOLVERS = {
+    'qpoases':   QPOASESSolver,
+    'admm':      ADMMSolver,
+    'activeset': ActiveSetSolver,
+}
+
+def default_solver():
+    """ name of the default backend, i.e. qpOASES when available """
+    return 'qpoases' if qpoases is not None else 'activeset'
+
+def make_solver(name, nv, nc, eliminate_equalities=False, **kwargs):
+    """
+    instantiate QP solver backend
+
+    Parameters
+    ----------
+
+    name: str
+        name of the backend in SOLVERS, None takes qpOASES when available,
+        else the native active set backend
+
+    nv, nc: int
+        number of variables and linear constraints
+
+    eliminate_equalities: bool
+        wrap backend into NullSpaceSolver, which eliminates the equality
+        constraints before the solve
+
+    kwargs:
+        additional options of the backend
+    """
+    if name is None:
+        name = default_solver()
+
+    try:
+        cls = SOLVERS[name]
+    except KeyError:
+        err_str = 'Unknown QP solver "{}", please choose one of: {}'.format(
+            name, ', '.join(sorted(SOLVERS))
+        )
+        raise KeyError(err_str)
+
+    if eliminate_equalities:
+        return NullSpaceSolver(name, nv, nc, **kwargs)
+
+    return cls(nv, nc, **kwargs)
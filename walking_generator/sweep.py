@@ -0,0 +1,429 @@
+"""
+Parameter sweeps of closed-loop walking simulations, e.g. for tuning the
+weights of the objective, the security margins and the gait parameters.
+
+Each run of a sweep is the loop of nmpc_standalone.py, i.e.
+
+    gen.set_velocity_reference(...)
+    gen.solve()
+    gen.simulate()
+    gen.set_initial_values(*gen.update())
+
+for one point of a parameter grid and a schedule of reference velocities.
+Runs are independent and distributed over a pool of worker processes. Each
+worker keeps the generators it constructed and resets them between runs,
+s.t. the allocations and the caches of the gait phase matrices are reused.
+Only the per-run metrics are sent back to the parent process, which appends
+each finished run as record of a .npy file, cf. recorder.Recorder.
+
+Example
+-------
+
+    grid = parameter_grid(a=[1.0, 0.1], SecurityMarginX=[0.04, 0.09])
+    run_sweep(grid, STANDALONE_SCHEDULE, 220, 'sweep.npy', processes=4)
+    results = load_results('sweep.npy')
+    print results['a'], results['max_cop_violation']
+
+.. NOTE:: Workers are single threaded, so set OMP_NUM_THREADS=1 (or the
+          variable of the BLAS in use) before starting the sweep to prevent
+          oversubscription of the cores.
+"""
+import os, sys
+import time
+import itertools
+import numpy
+from copy import deepcopy
+from multiprocessing import Pool
+
+from classic import ClassicGenerator
+from combinedqp import NMPCGenerator
+from solvers import QPSolver, default_solver
+from cache import LRUCache
+from recorder import Recorder, load_recording
+
+GENERATORS = {
+    'classic' : ClassicGenerator,
+    'nmpc'    : NMPCGenerator,
+}
+
+# parameters of the generator constructors, i.e. changing them requires
+# another generator instance
+STRUCTURE_KEYS = ('generator', 'N', 'T', 'T_step', 'fsm_state', 'solver')
+
+# parameters applied to a generator before each run
+WEIGHT_KEYS = ('a', 'b', 'c', 'd')
+MARGIN_KEYS = ('SecurityMarginX', 'SecurityMarginY')
+
+DEFAULT_PARAMETERS = {
+    'generator' : 'nmpc',
+    'N'         : 16,
+    'T'         : 0.1,
+    'T_step'    : 0.8,
+    'fsm_state' : 'L/R',
+    'solver'    : None,
+    'schedule'  : 'default',
+}
+
+# initial values of nmpc_standalone.py, cf. BaseGenerator.set_initial_values
+DEFAULT_INITIAL_STATE = (
+    [0.00949035, 0.0, 0.0], [0.095, 0.0, 0.0], 0.814,
+    0.00949035, 0.095, 0.0, 'left'
+)
+
+# reference velocities of nmpc_standalone.py as list of (tick, [dx,dy,dq]),
+# i.e. the reference is changed at the given tick
+STANDALONE_SCHEDULE = [
+    (  0, [0.2, 0.0,  0.2]),
+    ( 25, [0.2, 0.0, -0.2]),
+    ( 50, [0.1, 0.2, -0.4]),
+    (150, [0.0, 0.2,  0.0]),
+    (200, [0.0, 0.0,  0.0]),
+]
+
+# per-run metrics in the order of the result columns
+METRIC_KEYS = (
+    'failed',             # 1 if the run raised an exception
+    'ticks',              # number of completed ticks
+    'max_cop_violation',  # max distance of executed CoP beyond security margin
+    'mean_qp_time',       # mean and max QP time per tick in ms
+    'max_qp_time',
+    'mean_nwsr',          # mean and max working set recalculations per tick
+    'max_nwsr',
+    'track_rms',          # RMS of CoM velocity tracking error in x,y
+    'track_q_rms',        # RMS of angular velocity tracking error
+    'tick_time',          # mean wall time of solve() per tick in ms
+)
+
+# generators of a worker process, which are reused between runs
+_GENERATORS = LRUCache(maxsize=8)
+
+# attributes not restored between runs, i.e. solvers, caches and buffers
+# that are independent of the state of the generator
+_SHARED_KEYS = (
+    'gait_phase_cache', 'Pvu_gram', 'workspace', 'data', '_xy_pool',
+)
+
+
+def parameter_grid(**axes):
+    """
+    return cartesian product of parameter values as list of dicts
+
+    Parameters
+    ----------
+
+    axes: lists
+        values of each swept parameter, e.g. a=[1.0, 0.1], N=[16, 20]
+    """
+    keys = sorted(axes)
+    return [
+        dict(zip(keys, values))
+        for values in itertools.product(*[axes[key] for key in keys])
+    ]
+
+
+def velocity_reference(schedule, tick):
+    """ return reference velocity of schedule at given tick """
+    ref = schedule[0][1]
+    for start, vel in schedule:
+        if start > tick:
+            break
+        ref = vel
+    return ref
+
+
+def run(params, schedules, ticks, initial_state=None):
+    """
+    run one closed-loop simulation and return its metrics as dict
+
+    Parameters
+    ----------
+
+    params: dict
+        structural parameters, cf. STRUCTURE_KEYS, weights a, b, c, d,
+        security margins SecurityMarginX/Y and name of the velocity schedule.
+        Missing entries are taken from DEFAULT_PARAMETERS resp. the
+        generator defaults.
+
+    schedules: dict
+        velocity schedules by name, cf. STANDALONE_SCHEDULE
+
+    ticks: int
+        number of ticks of the simulation
+
+    initial_state: tuple
+        arguments of BaseGenerator.set_initial_values,
+        defaults to DEFAULT_INITIAL_STATE
+    """
+    params = dict(DEFAULT_PARAMETERS, **params)
+    schedule = schedules[params['schedule']]
+    if initial_state is None:
+        initial_state = DEFAULT_INITIAL_STATE
+
+    key = tuple(params[k] for k in STRUCTURE_KEYS)
+    gen = _GENERATORS.get(key, _new_generator, params)
+    _reset_generator(gen)
+
+    # apply parameters of this run
+    for k in WEIGHT_KEYS:
+        if k in params:
+            setattr(gen, k, params[k])
+    gen.set_security_margin(*[params.get(k, getattr(gen, k)) for k in MARGIN_KEYS])
+
+    metrics = dict.fromkeys(METRIC_KEYS, 0.0)
+    qp_time   = numpy.zeros((ticks,), dtype=float)
+    nwsr      = numpy.zeros((ticks,), dtype=float)
+    track     = numpy.zeros((ticks,), dtype=float)
+    track_q   = numpy.zeros((ticks,), dtype=float)
+    tick_time = numpy.zeros((ticks,), dtype=float)
+    violation = -numpy.inf
+
+    i = 0
+    try:
+        gen.set_initial_values(*initial_state)
+        for i in range(ticks):
+            gen.set_velocity_reference(velocity_reference(schedule, i))
+
+            t0 = time.time()
+            gen.solve()
+            tick_time[i] = (time.time() - t0)*1000.
+            gen.simulate()
+
+            qp_time[i], nwsr[i] = _qp_statistics(gen)
+            violation = max(violation, _cop_violation(gen))
+            track[i] = numpy.hypot(
+                gen.dC_kp1_x[0] - gen.dC_kp1_x_ref[0],
+                gen.dC_kp1_y[0] - gen.dC_kp1_y_ref[0],
+            )
+            track_q[i] = gen.dC_kp1_q[0] - gen.dC_kp1_q_ref[0]
+
+            gen.set_initial_values(*gen.update())
+        else:
+            i = ticks
+    except Exception:
+        # drop generator in undefined state and keep sweeping
+        _GENERATORS.discard(key)
+        metrics['failed'] = 1
+
+    metrics['ticks'] = i
+    if i > 0:
+        metrics['max_cop_violation'] = violation
+        metrics['mean_qp_time'] = qp_time[:i].mean()
+        metrics['max_qp_time']  = qp_time[:i].max()
+        metrics['mean_nwsr']    = nwsr[:i].mean()
+        metrics['max_nwsr']     = nwsr[:i].max()
+        metrics['track_rms']    = numpy.sqrt(numpy.mean(track[:i]**2))
+        metrics['track_q_rms']  = numpy.sqrt(numpy.mean(track_q[:i]**2))
+        metrics['tick_time']    = tick_time[:i].mean()
+    return metrics
+
+
+def run_sweep(
+    grid, schedules, ticks, filename,
+    processes=None, chunksize=1, initial_state=None
+):
+    """
+    run closed-loop simulations for all points of grid and write the
+    parameters and metrics of all runs as columns to filename, returns
+    number of failed runs
+
+    Parameters
+    ----------
+
+    grid: list of dicts
+        parameters of each run, e.g. from parameter_grid(), all entries
+        have to provide the same keys
+
+    schedules: list or dict
+        velocity schedule of all runs or dict of schedules selected by the
+        parameter 'schedule', cf. STANDALONE_SCHEDULE
+
+    ticks: int
+        number of ticks of each simulation
+
+    filename: str
+        path to result file
+
+    processes: int
+        number of worker processes, defaults to number of cores,
+        0 runs the simulations in the calling process
+
+    chunksize: int
+        number of runs sent to a worker at once
+
+    initial_state: tuple
+        cf. run()
+
+    .. NOTE:: The result file is a .npy of records with one field per
+              parameter and metric and the field 'run', i.e. the index of
+              the run in grid. Runs are appended when they finish, s.t. an
+              aborted sweep leaves all finished runs on disk and memory
+              does not grow with the grid, cf. load_results().
+    """
+    if not isinstance(schedules, dict):
+        schedules = {DEFAULT_PARAMETERS['schedule']: schedules}
+
+    param_keys = sorted(grid[0]) if grid else []
+    for params in grid:
+        if sorted(params) != param_keys:
+            err_str = 'all points of grid have to provide the same parameters'
+            raise ValueError(err_str)
+
+    tasks = [
+        (n, params, schedules, ticks, initial_state)
+        for n, params in enumerate(grid)
+    ]
+
+    # parameters are stored with the type of all their values, e.g. as float
+    # for a=[1, 0.5]
+    dtypes = dict(
+        (k, numpy.asarray([_format_value(k, p[k]) for p in grid]).dtype)
+        for k in param_keys
+    )
+
+    if processes == 0:
+        pool = None
+        results = itertools.imap(_run_task, tasks)
+    else:
+        pool = Pool(processes, initializer=_init_worker)
+        results = pool.imap_unordered(_run_task, tasks, chunksize)
+
+    # each run is written as soon as it finished
+    recorder = Recorder(filename, chunk_size=1, nchunks=2, blocking=True)
+
+    failed = 0
+    try:
+        for n, metrics in results:
+            record = dict((k, metrics[k]) for k in METRIC_KEYS)
+            record['run'] = n
+            for k in param_keys:
+                record[k] = numpy.asarray(_format_value(k, grid[n][k]), dtype=dtypes[k])
+            recorder.record(record)
+            failed += int(metrics['failed'])
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        recorder.close()
+
+    return failed
+
+
+def load_results(filename):
+    """
+    load result file of run_sweep() as records ordered by run, e.g.
+    results['track_rms']. Files of running or aborted sweeps contain the
+    finished runs, cf. recorder.load_recording
+    """
+    results = load_recording(filename)
+    return results[numpy.argsort(results['run'], kind='mergesort')]
+
+
+def _format_value(key, value):
+    """ parameters are written as plain values, e.g. solver=None as name """
+    if key == 'solver' and value is None:
+        return default_solver()
+    return value
+
+
+def _init_worker():
+    """ silence debug output of the generators in worker processes """
+    sys.stdout = open(os.devnull, 'w')
+
+
+def _run_task(task):
+    """ unpack task of run_sweep() for the pool """
+    n, params, schedules, ticks, initial_state = task
+    return n, run(params, schedules, ticks, initial_state)
+
+
+def _new_generator(params):
+    """ construct generator and save its pristine state for resets """
+    cls = GENERATORS[params['generator']]
+    gen = cls(
+        N=params['N'], T=params['T'], T_step=params['T_step'],
+        fsm_state=params['fsm_state'], solver=params['solver'],
+    )
+    gen._sweep_snapshot = deepcopy(dict(
+        (key, val) for key, val in gen.__dict__.items()
+        if not _is_shared(key, val)
+    ))
+    return gen
+
+
+def _is_shared(key, val):
+    """ attributes which are not restored by _reset_generator() """
+    if key in _SHARED_KEYS:
+        return True
+    if isinstance(val, QPSolver):
+        return True
+    if isinstance(val, list) and val and isinstance(val[0], QPSolver):
+        return True
+    return False
+
+
+def _reset_generator(gen):
+    """ restore state of freshly constructed generator """
+    _restore(gen, gen._sweep_snapshot)
+
+    # read-only preview matrices are not restored, rebind the ones of the
+    # restored CoM height
+    gen._initialize_cop_matrices()
+
+    # drop warm starts and logged data
+    for key, val in gen.__dict__.items():
+        if isinstance(val, QPSolver):
+            val.reset()
+        elif isinstance(val, list) and val and isinstance(val[0], QPSolver):
+            for qp in val:
+                qp.reset()
+    gen.data.reset()
+
+
+def _restore(obj, snapshot):
+    """
+    restore attributes of obj from snapshot of its __dict__. Arrays and
+    objects are restored in place, s.t. views on them, e.g. the edge
+    normals of the CoP constraints on D_kp1, stay valid.
+    """
+    for key, val in snapshot.items():
+        cur = obj.__dict__.get(key)
+        if isinstance(val, numpy.ndarray) and isinstance(cur, numpy.ndarray) \
+        and cur.shape == val.shape and cur.dtype == val.dtype:
+            # read-only arrays are shared constants, e.g. preview matrices
+            if cur.flags.writeable:
+                cur[...] = val
+        elif hasattr(val, '__dict__') and type(cur) is type(val):
+            _restore(cur, val.__dict__)
+        else:
+            setattr(obj, key, deepcopy(val))
+
+
+def _qp_statistics(gen):
+    """ return QP time in ms and working set recalculations of last solve """
+    if hasattr(gen, 'qp_cputime'):
+        return gen.qp_cputime, gen.qp_nwsr
+    return (
+        gen.ori_qp_cputime + gen.pos_qp_cputime,
+        gen.ori_qp_nwsr + gen.pos_qp_nwsr,
+    )
+
+
+def _cop_violation(gen):
+    """
+    return maximum violation of the CoP constraints of the first sample,
+    i.e. the executed CoP, by the solution of the last solve. Negative values
+    are the remaining distance to the security margin.
+
+    .. NOTE:: The constraints of the first sample only depend on the current
+              support foot, i.e. the ones built for the last solve are
+              evaluated on copies without modifying the generator.
+    """
+    nEdges = gen.nFootEdge
+    cop = gen.cop_constraint
+
+    # Acop[:nEdges] * U_k, cf. CoPConstraint
+    zx = gen.Pzu[0].dot(gen.dddC_k_x) - gen.V_kp1[0].dot(gen.F_k_x)
+    zy = gen.Pzu[0].dot(gen.dddC_k_y) - gen.V_kp1[0].dot(gen.F_k_y)
+    Acop_U = cop.dx[0]*zx + cop.dy[0]*zy
+
+    return numpy.max(Acop_U - gen.ubBcop[:nEdges])
@@ -4,77 +4,17 @@ import re
 import numpy
 import json
 from time import strftime
-from copy import deepcopy
+
+from datalog import DataLog, PlotData, load_npz
+from recorder import load_recording
 
 import matplotlib
 from matplotlib import pyplot as plt
 
-class PlotData(object):
-    """
-    Smart data container for saving plotting relevant data.
-    """
-
-    def __init__(self, generator):
-        """ build data structures """
-        self.data = {}
-        self.generator = generator
-
-        # get list keys
-        self.hull_keys = generator._hull_keys
-        self.plot_keys = generator._plot_keys
-        self.data_keys = generator._data_keys
-
-        # fill internal data with keys and empty lists
-        for key in self.hull_keys:
-            self.data[key] = []
-
-        for key in self.data_keys:
-            self.data[key] = []
-
-        for key in self.plot_keys:
-            self.data[key] = []
-
-    def update(self):
-        """ update internal data from generator """
-        for key in self.data:
-            val = self.generator.__dict__.get(key, [])
-            self.data[key].append(deepcopy(val))
-
-    def reset(self):
-        """ reset all internal data """
-        for key in self.data:
-            self.data[key] = []
-
-    def save_to_file(self, filename=''):
-        """
-        save data in json format to file
-
-        Parameters
-        ----------
-
-        filename: str
-            path to output file,
-        """
-        # generate general filename
-        if not filename:
-            stamp = strftime("%Y-%m-%d-%H-%M-%S")
-            name = '{stamp}_generator_data.json'.format(stamp=stamp)
-            filename = os.path.join('/tmp', name)
-
-        # convert numpy arrays into lists
-        for key in self.data.keys():
-            val = numpy.asarray(self.data[key])
-            self.data[key] = val.tolist()
-
-        # save data to file in json format
-        with open(filename, 'w') as f:
-            json.dump(self.data, f, sort_keys=True, indent=2)
-
-
 class Plotter(object):
     """
     Real time plotter for pattern generator data. Can create plots online or
-    from saved data in json format.
+    from saved data in json or npz format.
     """
 
     # counter for pictures
@@ -175,7 +115,7 @@ class Plotter(object):
     ):
         """
         Real time plotter for pattern generator data. Can create plots online or
-        from saved data in json format.
+        from saved data in json or npz format.
 
         Parameters
         ----------
@@ -344,7 +284,11 @@ class Plotter(object):
         """
         load data from file
 
-        .. NOTE: Expects data to be in json format!
+        .. NOTE: Expects data in json format, when filename ends with
+                 '.json', a recording of GeneratorRecorder, when it ends with
+                 '.npy', and in .npz format of PlotData.save_to_file else.
+                 Arrays of .npy and .npz files are memory mapped instead of
+                 read, recordings can be loaded while they are written.
 
         Parameters
         ----------
@@ -361,8 +305,14 @@ class Plotter(object):
         self.input_filename = filename
 
         # try to read data
-        with open(self.input_filename, 'r') as f:
-            self.data = json.load(f)
+        if filename.endswith('.json'):
+            with open(self.input_filename, 'r') as f:
+                self.data = json.load(f)
+        elif filename.endswith('.npy'):
+            records = load_recording(self.input_filename)
+            self.data = dict((key, records[key]) for key in records.dtype.names)
+        else:
+            self.data = load_npz(self.input_filename)
 
     def update(self):
         """ creates plot of x/y trajectories on the ground """
@@ -0,0 +1,157 @@
+import numpy
+from contextlib import contextmanager
+
+# tracemalloc is part of the standard library since Python 3.4, for
+# Python 2.7 it is available through the pytracemalloc backport
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+class Workspace(object):
+    """
+    Preallocated work buffers of a pattern generator.
+
+    All temporaries of the QP assembly are allocated once on construction
+    of the generator and then reused in every iteration through out=
+    arguments and in-place operations, s.t. steady state iterations do not
+    allocate new arrays. Buffers are accessible as attributes, e.g.
+
+    >>> ws = Workspace()
+    >>> tmp = ws.allocate('tmp', (16,))
+    >>> ws.tmp is tmp
+    True
+
+    In debug mode check_allocations() asserts that a region of code does
+    not allocate more than max_bytes, which requires tracemalloc.
+    """
+
+    def __init__(self, debug=False, max_bytes=8192):
+        """
+        Parameters
+        ----------
+
+        debug: bool
+            enables allocation checks of check_allocations()
+
+        max_bytes: int
+            tolerated peak of memory allocated inside a checked block, i.e.
+            array headers of views, iterators of NumPy on strided operands
+            and Python objects of the interpreter
+        """
+        self.debug = debug
+        self.max_bytes = max_bytes
+        self._buffers = []
+
+        # number of performed checks and of checks skipped due to cache
+        # misses, i.e. outside of steady state
+        self.checks = 0
+        self.skipped_checks = 0
+
+        # largest peak in bytes of the performed checks
+        self.peak = 0
+
+        # depth of nested checks, only the outermost one measures
+        self._depth = 0
+
+    @property
+    def debug(self):
+        """ True when check_allocations() measures allocations """
+        return self._debug
+
+    @debug.setter
+    def debug(self, debug):
+        if debug and tracemalloc is None:
+            err_str = 'Debug mode of workspace requires tracemalloc, ' \
+                    + 'for Python 2.7 please install pytracemalloc.'
+            raise ImportError(err_str)
+        self._debug = bool(debug)
+
+    def allocate(self, name, shape, dtype=float):
+        """
+        allocate zero initialized buffer and register it under given name
+
+        Parameters
+        ----------
+
+        name: str
+            attribute name of the buffer
+
+        shape: tuple
+            shape of the buffer
+
+        dtype: numpy.dtype
+            data type of the buffer
+        """
+        err_str = 'buffer {} already allocated'.format(name)
+        assert name not in self._buffers, err_str
+
+        buf = numpy.zeros(shape, dtype=dtype)
+        setattr(self, name, buf)
+        self._buffers.append(name)
+        return buf
+
+    @property
+    def nbytes(self):
+        """ total size of all buffers in bytes """
+        return sum(getattr(self, name).nbytes for name in self._buffers)
+
+    @contextmanager
+    def check_allocations(self, where='', caches=()):
+        """
+        assert that the memory allocated inside the with block peaks at most
+        at max_bytes when workspace is in debug mode, else this is a no-op.
+
+        Tracing is restarted at the beginning of the block, s.t. the traced
+        peak covers temporaries of expressions which are already freed at
+        the end of the block as well as arrays kept alive.
+
+        .. NOTE: Restarting clears traces of other users of tracemalloc.
+                 Iteration buffers of ufuncs broadcasting over several
+                 non-contiguous axes count as well, cf. peak. NumPy serves
+                 data of less than 1024 bytes from its own cache of freed
+                 blocks, which tracemalloc does not see, i.e. only larger
+                 temporaries are detected reliably.
+
+        Parameters
+        ----------
+
+        where: str
+            name of the checked code region for the error message
+
+        caches: sequence of LRUCache
+            caches filled lazily inside the block. When one of them misses,
+            the iteration is not in steady state and the check is skipped,
+            which is counted in skipped_checks.
+        """
+        if not self.debug or self._depth > 0:
+            yield
+            return
+
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        tracemalloc.start()
+
+        misses = [cache.misses for cache in caches]
+        baseline = tracemalloc.get_traced_memory()[0]
+
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+        if misses != [cache.misses for cache in caches]:
+            self.skipped_checks += 1
+            return
+
+        self.checks += 1
+        self.peak = max(self.peak, peak)
+        if peak > self.max_bytes:
+            stats = tracemalloc.take_snapshot().statistics('lineno')[:10]
+            err_str = '{} bytes allocated in {}, allocations still alive:\n{}'
+            err_str = err_str.format(
+                peak, where, '\n'.join(str(stat) for stat in stats)
+            )
+            raise AssertionError(err_str)